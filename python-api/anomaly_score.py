@@ -1,99 +1,397 @@
-import math
-import numpy as np
-
-def calculate_confidence_score(jlen_arr, logdist_arr, elevation_arr, rotation_arr, depth, bool_arr):
-    a_score = 0.4*allignment_score(jlen_arr, logdist_arr, elevation_arr, rotation_arr)
-    p_score = 0.4*persistence_score(bool_arr)
-    m_score = 0.2*magnitude_score(depth)
-    
-    return a_score + p_score + m_score  # Example confidence score
-
-def allignment_score(jlen_arr, logdist_arr, elevation_arr, rotation_arr):
-    j = [d for d in jlen_arr if d is not None and d > 0]
-    l = [d for d in logdist_arr if d is not None and d > 0]
-    e = [d for d in elevation_arr if d is not None and d > 0]
-    r = [d for d in rotation_arr if d is not None and d > 0]
-    
-    j_mean = np.mean(j)
-    j_stdev = np.std(j)
-    l_mean = np.mean(l)
-    l_stdev = np.std(l)
-    e_mean = np.mean(e)
-    e_stdev = np.std(e)
-    r_mean = np.mean(r)
-    r_stdev = np.std(r)
-    
-    j_cv = j_stdev / j_mean if j_mean != 0 else 0
-    l_cv = l_stdev / l_mean if l_mean != 0 else 0
-    e_cv = e_stdev / e_mean if e_mean != 0 else 0
-    r_cv = r_stdev / r_mean if r_mean != 0 else 0
-    score = 1 - (j_cv + l_cv + e_cv + r_cv) / 4  # Average CV and invert for score
-    
-
-    return score
-
-def persistence_score(bool_arr):
-    count = 0
-    for i in bool_arr:
-        if i:
-            count += 1
- 
-    return count / len(bool_arr) 
-
-def magnitude_score(depth):
-    threshold = 0.8
-    if depth <= 0:
-        return 0.0
-    
- 
-    return min(1.0, depth / threshold)
-
-def calculate_growth_rate(d0,df,l0,lf,w0,wf,time):
-    V0 = d0 * l0 * w0 
-    Vf = df * lf * wf
-    growth_rate = (Vf - V0) / time 
-    
-    return growth_rate  # Return the calculated growth rate
-
-def calculate_severity_score(rpr_scores, years):
-    # takes in array of rpr scores from each year
-    
-    # Handle single data point case
-    if len(rpr_scores) <= 1:
-        # For new anomalies with only one data point, use the RPR value directly
-        # Lower RPR = higher severity
-        if len(rpr_scores) == 1:
-            return 1.0 - rpr_scores[0]  # Invert so low RPR gives high severity
-        else:
-            return 0.0  # No data
-    
-    decay_rate_sum = 0
-    for i in range(0, len(rpr_scores) - 1):
-        decay_rate = (rpr_scores[i+1] - rpr_scores[i]) / (years[i+1] - years[i])
-        decay_rate_sum += decay_rate
-    
-    decay_rate_sum /= -1 * (len(rpr_scores) - 1)  # Average decay rate
-
-    years_until_implode = (rpr_scores[-1] - 1) / decay_rate_sum if decay_rate_sum != 0 else float('inf')  # Avoid division by zero
-    severity_score = 1 / (1 + math.exp(-decay_rate_sum))  # Sigmoid function to scale severity score between 0 and 1
-    
-    return severity_score 
-
-def main():
-    # rpr_scores = [float(x) for x in input("Enter RPR scores separated by spaces: ").split()]
-    # years = [float(x) for x in input("Enter corresponding years separated by spaces: ").split()]
-    # print(calculate_severity_score(rpr_scores, years))
-    
-    jlen_arr = [1.0, 1.2, 0.8, 1.1]
-    logdist_arr = [0.5, 0.6, 0.4, 0.7]
-    elevation_arr = [0.2, 0.3, 0.1, 0.4]
-    rotation_arr = [0.05, 0.06, 0.04, 0.07]
-    depth = 0.5
-    bool_arr = [True, True, False, True]
-    confidence_score = calculate_confidence_score(jlen_arr, logdist_arr, elevation_arr, rotation_arr, depth, bool_arr)
-
-    
-    
-    
-if __name__ == "__main__":    
+import math
+import numpy as np
+
+# Scoring knobs. Overrides can be passed to score_histories() to re-score
+# cached histories without re-running the alignment.
+DEFAULT_SCORING_PARAMS = {
+    'alignment_weight': 0.4,     # confidence weight of the alignment consistency score
+    'persistence_weight': 0.4,   # confidence weight of the fraction of inspections detected
+    'magnitude_weight': 0.2,     # confidence weight of the latest depth
+    'magnitude_threshold': 0.8,  # depth that gives a full magnitude score
+    'severity_steepness': 1.0,   # slope of the severity sigmoid
+    'severity_midpoint': 0.0,    # RPR decay rate scored as 0.5 severity
+}
+
+def calculate_confidence_score(jlen_arr, logdist_arr, elevation_arr, rotation_arr, depth, bool_arr):
+    a_score = DEFAULT_SCORING_PARAMS['alignment_weight']*allignment_score(jlen_arr, logdist_arr, elevation_arr, rotation_arr)
+    p_score = DEFAULT_SCORING_PARAMS['persistence_weight']*persistence_score(bool_arr)
+    m_score = DEFAULT_SCORING_PARAMS['magnitude_weight']*magnitude_score(depth)
+    
+    return a_score + p_score + m_score  # Example confidence score
+
+def allignment_score(jlen_arr, logdist_arr, elevation_arr, rotation_arr):
+    j = [d for d in jlen_arr if d is not None and d > 0]
+    l = [d for d in logdist_arr if d is not None and d > 0]
+    e = [d for d in elevation_arr if d is not None and d > 0]
+    r = [d for d in rotation_arr if d is not None and d > 0]
+    
+    j_mean = np.mean(j)
+    j_stdev = np.std(j)
+    l_mean = np.mean(l)
+    l_stdev = np.std(l)
+    e_mean = np.mean(e)
+    e_stdev = np.std(e)
+    r_mean = np.mean(r)
+    r_stdev = np.std(r)
+    
+    j_cv = j_stdev / j_mean if j_mean != 0 else 0
+    l_cv = l_stdev / l_mean if l_mean != 0 else 0
+    e_cv = e_stdev / e_mean if e_mean != 0 else 0
+    r_cv = r_stdev / r_mean if r_mean != 0 else 0
+    score = 1 - (j_cv + l_cv + e_cv + r_cv) / 4  # Average CV and invert for score
+    
+
+    return score
+
+def persistence_score(bool_arr):
+    count = 0
+    for i in bool_arr:
+        if i:
+            count += 1
+ 
+    return count / len(bool_arr) 
+
+def magnitude_score(depth):
+    threshold = DEFAULT_SCORING_PARAMS['magnitude_threshold']
+    if depth <= 0:
+        return 0.0
+    
+ 
+    return min(1.0, depth / threshold)
+
+def calculate_growth_rate(d0,df,l0,lf,w0,wf,time):
+    V0 = d0 * l0 * w0 
+    Vf = df * lf * wf
+    growth_rate = (Vf - V0) / time 
+    
+    return growth_rate  # Return the calculated growth rate
+
+def calculate_severity_score(rpr_scores, years):
+    # takes in array of rpr scores from each year, and the year each one was measured
+    
+    # Handle single data point case
+    if len(rpr_scores) <= 1:
+        # For new anomalies with only one data point, use the RPR value directly
+        # Lower RPR = higher severity
+        if len(rpr_scores) == 1:
+            return 1.0 - rpr_scores[0]  # Invert so low RPR gives high severity
+        else:
+            return 0.0  # No data
+    
+    decay_rate_sum = 0
+    for i in range(0, len(rpr_scores) - 1):
+        decay_rate = (rpr_scores[i+1] - rpr_scores[i]) / (years[i+1] - years[i])
+        decay_rate_sum += decay_rate
+    
+    decay_rate_sum /= -1 * (len(rpr_scores) - 1)  # Average decay rate
+
+    years_until_implode = (rpr_scores[-1] - 1) / decay_rate_sum if decay_rate_sum != 0 else float('inf')  # Avoid division by zero
+    steepness = DEFAULT_SCORING_PARAMS['severity_steepness']
+    midpoint = DEFAULT_SCORING_PARAMS['severity_midpoint']
+    severity_score = 1 / (1 + math.exp(-steepness * (decay_rate_sum - midpoint)))  # Sigmoid function to scale severity score between 0 and 1
+    
+    return severity_score 
+
+# Streaming form of the scores. A ScoreAccumulator keeps constant-size state
+# per anomaly and is updated one inspection at a time, so the raw per-year
+# lists never have to be kept. Accumulators for consecutive ranges of
+# inspections can be merged, and round-trip through plain dicts (JSON).
+
+class RunningStat:
+    """Welford count/mean/M2 with Chan et al.'s merge."""
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other):
+        if other.count == 0:
+            return RunningStat(self.count, self.mean, self.m2)
+        if self.count == 0:
+            return RunningStat(other.count, other.mean, other.m2)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.count / count
+        m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / count
+        return RunningStat(count, mean, m2)
+
+    def cv(self):
+        # Population std / mean, like np.std / np.mean in allignment_score
+        if self.count == 0:
+            return float('nan')
+        std = math.sqrt(max(self.m2, 0.0) / self.count)
+        return std / self.mean if self.mean != 0 else 0
+
+    def to_list(self):
+        return [self.count, self.mean, self.m2]
+
+
+ALIGNMENT_FEATURES = ('j_len', 'log_dist', 'elevation', 'rotation')
+
+class ScoreAccumulator:
+    """
+    Running state for one anomaly. Call update() once per inspection, in
+    chronological order, with detected=False for inspections that missed it.
+    """
+    def __init__(self):
+        self.stats = {key: RunningStat() for key in ALIGNMENT_FEATURES}
+        self.inspections = 0           # years in the anomaly's history
+        self.detections = 0            # years it was detected
+        self.rpr_count = 0
+        self.first_year = None         # history span, for growth
+        self.last_year = None
+        self.first_detected_year = None
+        self.last_detected_year = None
+        self.first_rpr = None
+        self.last_rpr = None
+        self.decay_rate_sum = 0.0      # sum of RPR change per year between detections
+        self.first_volume = None       # depth * length * width at first / last detection
+        self.last_volume = None
+        self.last_depth = None         # NaN when the latest detection had no depth
+
+    def update(self, year, detected, j_len=None, log_dist=None, elevation=None, rotation=None,
+               depth=None, length=None, width=None, rpr=None):
+        if self.last_year is not None and year <= self.last_year:
+            raise ValueError(f"Inspections must be added in chronological order ({year} after {self.last_year})")
+        if self.first_year is None:
+            self.first_year = year
+        self.last_year = year
+        self.inspections += 1
+        if not detected:
+            return self
+
+        self.detections += 1
+        for key, value in zip(ALIGNMENT_FEATURES, (j_len, log_dist, elevation, rotation)):
+            if value is not None and value > 0:
+                self.stats[key].update(value)
+
+        if rpr is not None:
+            self.rpr_count += 1
+            if self.last_rpr is not None:
+                self.decay_rate_sum += (rpr - self.last_rpr) / (year - self.last_detected_year)
+            else:
+                self.first_rpr = rpr
+            self.last_rpr = rpr
+        if self.first_detected_year is None:
+            self.first_detected_year = year
+        self.last_detected_year = year
+
+        # Missing measurements are NaN, as in the packed histories
+        depth, length, width = (math.nan if v is None else v for v in (depth, length, width))
+        volume = depth * length * width
+        if self.first_volume is None:
+            self.first_volume = volume
+        self.last_volume = volume
+        self.last_depth = depth
+        return self
+
+    def merge(self, later):
+        """Combines this accumulator with one covering strictly later inspections."""
+        if self.inspections and later.inspections and later.first_year <= self.last_year:
+            raise ValueError("Can only merge an accumulator that covers later inspections")
+        merged = ScoreAccumulator()
+        merged.stats = {key: self.stats[key].merge(later.stats[key]) for key in ALIGNMENT_FEATURES}
+        merged.inspections = self.inspections + later.inspections
+        merged.detections = self.detections + later.detections
+        merged.first_year = self.first_year if self.inspections else later.first_year
+        merged.last_year = later.last_year if later.inspections else self.last_year
+
+        merged.rpr_count = self.rpr_count + later.rpr_count
+        merged.decay_rate_sum = self.decay_rate_sum + later.decay_rate_sum
+        if self.last_rpr is not None and later.first_rpr is not None:
+            merged.decay_rate_sum += ((later.first_rpr - self.last_rpr)
+                                      / (later.first_detected_year - self.last_detected_year))
+        merged.first_rpr = self.first_rpr if self.first_rpr is not None else later.first_rpr
+        merged.last_rpr = later.last_rpr if later.last_rpr is not None else self.last_rpr
+
+        earlier_seen, later_seen = self.detections > 0, later.detections > 0
+        merged.first_detected_year = self.first_detected_year if earlier_seen else later.first_detected_year
+        merged.last_detected_year = later.last_detected_year if later_seen else self.last_detected_year
+        merged.first_volume = self.first_volume if earlier_seen else later.first_volume
+        merged.last_volume = later.last_volume if later_seen else self.last_volume
+        merged.last_depth = later.last_depth if later_seen else self.last_depth
+        return merged
+
+    # Scores, equal to the list-based functions fed the same inspections
+
+    def alignment_score(self):
+        return 1 - sum(self.stats[key].cv() for key in ALIGNMENT_FEATURES) / 4
+
+    def persistence_score(self):
+        return self.detections / self.inspections
+
+    def confidence_score(self, params=None):
+        params = resolve_scoring_params(params)
+        depth = self.last_depth if self.last_depth is not None else 0
+        threshold = params['magnitude_threshold']
+        # A detection without a depth scores like magnitude_score(nan): full magnitude
+        m_score = 1.0 if math.isnan(depth) else 0.0 if depth <= 0 else min(1.0, depth / threshold)
+        return (params['alignment_weight'] * self.alignment_score()
+                + params['persistence_weight'] * self.persistence_score()
+                + params['magnitude_weight'] * m_score)
+
+    def severity_score(self, params=None):
+        """calculate_severity_score over the RPRs and the years they were measured."""
+        params = resolve_scoring_params(params)
+        if self.rpr_count == 0:
+            return 0.0
+        if self.rpr_count == 1:
+            return 1.0 - self.last_rpr
+        decay = self.decay_rate_sum / (-1 * (self.rpr_count - 1))
+        return 1 / (1 + math.exp(-params['severity_steepness'] * (decay - params['severity_midpoint'])))
+
+    def persistence(self):
+        if self.first_detected_year is None:
+            return 0
+        return self.last_detected_year - self.first_detected_year
+
+    def growth_rate(self):
+        """Volume change between first and last detection over the history span, clipped at 0."""
+        if self.inspections < 2 or self.first_volume is None:
+            return 0.0
+        gr = (self.last_volume - self.first_volume) / (self.last_year - self.first_year)
+        return 0.0 if gr < 0 else gr
+
+    def scores(self, params=None):
+        """Same columns and rounding as score_histories / mapping.py."""
+        return {
+            'confidence': round(self.confidence_score(params), 4),
+            'severity': round(self.severity_score(params), 4),
+            'persistence': self.persistence(),
+            'growth_rate': round(self.growth_rate(), 6),
+        }
+
+    def to_dict(self):
+        state = {key: value for key, value in self.__dict__.items() if key != 'stats'}
+        state['stats'] = {key: stat.to_list() for key, stat in self.stats.items()}
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        acc = cls()
+        for key, value in state.items():
+            if key == 'stats':
+                acc.stats = {k: RunningStat(*v) for k, v in value.items()}
+            else:
+                setattr(acc, key, value)
+        return acc
+
+# Vectorized scoring over packed histories (see history_cache.py).
+# Every array is (anomalies x inspection years); the results match the
+# per-anomaly functions above, including their handling of missed years.
+
+def resolve_scoring_params(overrides=None):
+    """Merges overrides into the defaults, rejecting unknown or non-numeric knobs."""
+    params = dict(DEFAULT_SCORING_PARAMS)
+    for key, value in (overrides or {}).items():
+        if key not in params:
+            raise ValueError(f"Unknown scoring parameter: {key}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Scoring parameter {key} must be a number")
+        params[key] = float(value)
+    if params['magnitude_threshold'] <= 0:
+        raise ValueError("magnitude_threshold must be positive")
+    return params
+
+def _left_pack(values, mask):
+    # Moves the masked entries of each row to the front, keeping their order
+    order = np.argsort(~mask, axis=1, kind='stable')
+    packed = np.take_along_axis(values, order, axis=1)
+    count = mask.sum(axis=1)
+    valid = np.arange(values.shape[1]) < count[:, None]
+    return np.where(valid, packed, np.nan), count
+
+def _last(packed, count):
+    rows = np.arange(len(packed))
+    return np.where(count > 0, packed[rows, np.maximum(count - 1, 0)], np.nan)
+
+def score_histories(packed, params=None):
+    """
+    packed: dict from history_cache.pack_history / load_history
+    Returns a dict of confidence, severity, persistence and growth_rate arrays.
+    """
+    params = resolve_scoring_params(params)
+    years = packed['years'].astype(float)
+    in_history = packed['in_history']
+    present = packed['present']
+    n = len(present)
+    year_grid = np.broadcast_to(years, present.shape)
+    hist_years, n_hist = _left_pack(year_grid, in_history)
+    seen_years, n_seen = _left_pack(year_grid, present)
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        # Confidence: alignment consistency (coefficient of variation of positive values)
+        cv_sum = np.zeros(n)
+        for key in ('j_len', 'log_dist', 'elevation', 'rotation'):
+            values = packed[key].astype(float)
+            ok = present & (values > 0)
+            count = ok.sum(axis=1)
+            mean = np.where(ok, values, 0.0).sum(axis=1) / count
+            std = np.sqrt((np.where(ok, values - mean[:, None], 0.0) ** 2).sum(axis=1) / count)
+            cv_sum += np.where(mean != 0, std / mean, 0.0)
+        a_score = 1 - cv_sum / 4
+
+        p_score = n_seen / n_hist
+
+        depth, _ = _left_pack(packed['depth'].astype(float), present)
+        last_depth = np.where(n_seen > 0, _last(depth, n_seen), 0.0)
+        m_score = np.where(last_depth <= 0, 0.0, np.minimum(1.0, last_depth / params['magnitude_threshold']))
+        m_score = np.where(np.isnan(last_depth), 1.0, m_score)
+
+        confidence = (params['alignment_weight'] * a_score + params['persistence_weight'] * p_score
+                      + params['magnitude_weight'] * m_score)
+
+        # Severity: sigmoid of the average RPR decay rate, each value paired with
+        # the year it was detected (missed inspections do not shift the years)
+        rpr, _ = _left_pack(packed['rpr'].astype(float), present)
+        steps = (rpr[:, 1:] - rpr[:, :-1]) / (seen_years[:, 1:] - seen_years[:, :-1])
+        steps = np.where(np.arange(steps.shape[1]) < (n_seen - 1)[:, None], steps, 0.0)
+        decay = steps.sum(axis=1) / (-1 * (n_seen - 1))
+        sigmoid = 1 / (1 + np.exp(-params['severity_steepness'] * (decay - params['severity_midpoint'])))
+        severity = np.where(n_seen > 1, sigmoid, np.where(n_seen == 1, 1.0 - rpr[:, 0], 0.0))
+
+        # Persistence: first to last year detected
+        persistence = np.where(n_seen > 0, _last(seen_years, n_seen) - seen_years[:, 0], 0.0)
+
+        # Growth: volume change between first and last detection over the history span
+        length, _ = _left_pack(packed['length'].astype(float), present)
+        width, _ = _left_pack(packed['width'].astype(float), present)
+        v0 = depth[:, 0] * length[:, 0] * width[:, 0]
+        vf = last_depth * _last(length, n_seen) * _last(width, n_seen)
+        growth = (vf - v0) / (_last(hist_years, n_hist) - hist_years[:, 0])
+        growth = np.where(growth < 0, 0.0, growth)
+        growth = np.where(n_hist >= 2, growth, 0.0)
+
+    # Anomalies without any history keep empty scores
+    empty = n_hist == 0
+    return {
+        'confidence': np.where(empty, np.nan, np.round(confidence, 4)),
+        'severity': np.where(empty, np.nan, np.round(severity, 4)),
+        'persistence': np.where(empty, np.nan, persistence),
+        'growth_rate': np.where(empty, np.nan, np.round(growth, 6)),
+    }
+
+def main():
+    # rpr_scores = [float(x) for x in input("Enter RPR scores separated by spaces: ").split()]
+    # years = [float(x) for x in input("Enter corresponding years separated by spaces: ").split()]
+    # print(calculate_severity_score(rpr_scores, years))
+    
+    jlen_arr = [1.0, 1.2, 0.8, 1.1]
+    logdist_arr = [0.5, 0.6, 0.4, 0.7]
+    elevation_arr = [0.2, 0.3, 0.1, 0.4]
+    rotation_arr = [0.05, 0.06, 0.04, 0.07]
+    depth = 0.5
+    bool_arr = [True, True, False, True]
+    confidence_score = calculate_confidence_score(jlen_arr, logdist_arr, elevation_arr, rotation_arr, depth, bool_arr)
+
+    
+    
+    
+if __name__ == "__main__":    
     main()
\ No newline at end of file
@@ -1,234 +1,494 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import os
-import pandas as pd
-import subprocess
-import shutil
-from werkzeug.utils import secure_filename
-
-app = Flask(__name__)
-CORS(app)
-
-# Configuration
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'data', 'formatted_files')
-RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'data', 'Aligned_Results')
-ALLOWED_EXTENSIONS = {'csv'}
-
-# Ensure folders exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(RESULTS_FOLDER, exist_ok=True)
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def validate_filename(filename):
-    """Check if filename matches ILI_YYYY_formatted.csv pattern"""
-    import re
-    pattern = r'^ILI_\d{4}_formatted\.csv$'
-    return re.match(pattern, filename) is not None
-
-@app.route('/api/health', methods=['GET'])
-def health():
-    return jsonify({'status': 'healthy', 'message': 'Python API is running'})
-
-@app.route('/api/upload', methods=['POST'])
-def upload_files():
-    """Handle file uploads and save to formatted_files directory"""
-    try:
-        if 'files' not in request.files:
-            return jsonify({'error': 'No files provided'}), 400
-        
-        files = request.files.getlist('files')
-        
-        if not files or files[0].filename == '':
-            return jsonify({'error': 'No files selected'}), 400
-        
-        uploaded_files = []
-        errors = []
-        
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                
-                # Validate filename format
-                if not validate_filename(filename):
-                    errors.append(f"{filename}: Must match pattern ILI_YYYY_formatted.csv")
-                    continue
-                
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
-                uploaded_files.append(filename)
-            else:
-                errors.append(f"{file.filename}: Invalid file type (must be CSV)")
-        
-        if not uploaded_files:
-            return jsonify({
-                'error': 'No valid files uploaded',
-                'details': errors
-            }), 400
-        
-        return jsonify({
-            'message': f'Successfully uploaded {len(uploaded_files)} file(s)',
-            'files': uploaded_files,
-            'errors': errors if errors else None
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/analyze', methods=['POST'])
-def analyze():
-    """Run the mapping script and return results"""
-    try:
-        # Check if files exist in formatted_files directory
-        files = [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.csv')]
-        
-        if not files:
-            return jsonify({'error': 'No CSV files found in formatted_files directory'}), 400
-        
-        print(f"Found {len(files)} files to analyze: {files}")
-        
-        # Run the mapping script
-        mapping_script = os.path.join(os.path.dirname(__file__), 'mapping.py')
-        result = subprocess.run(
-            ['python3', mapping_script],
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
-        )
-        
-        if result.returncode != 0:
-            print(f"Mapping script error: {result.stderr}")
-            return jsonify({
-                'error': 'Analysis failed',
-                'details': result.stderr
-            }), 500
-        
-        print(f"Mapping script output: {result.stdout}")
-        
-        # Read the results CSV
-        results_file = os.path.join(RESULTS_FOLDER, 'Master_Alignment_Final.csv')
-        
-        # If the main file doesn't exist, look for timestamped versions
-        if not os.path.exists(results_file):
-            # Look for any Master_Alignment_Final*.csv files
-            import glob
-            pattern = os.path.join(RESULTS_FOLDER, 'Master_Alignment_Final*.csv')
-            files = glob.glob(pattern)
-            if files:
-                # Use the most recent one
-                results_file = max(files, key=os.path.getmtime)
-                print(f"Using results file: {results_file}")
-            else:
-                return jsonify({'error': 'Results file not generated'}), 500
-        
-        # Load and format results for frontend
-        df = pd.read_csv(results_file)
-        
-        # Convert to format expected by frontend
-        results = []
-        for idx, row in df.iterrows():
-            try:
-                # Handle anomaly_no - could be numeric or string like 'C-70'
-                anomaly_no = row['anomaly_no']
-                if pd.notna(anomaly_no):
-                    try:
-                        anomaly_no = int(anomaly_no)
-                    except (ValueError, TypeError):
-                        # If it's a string like 'C-70', use the index as fallback
-                        anomaly_no = idx + 1
-                else:
-                    anomaly_no = idx + 1
-                
-                # Handle joint_no - ensure it's an integer
-                joint_no = row['joint_no']
-                if pd.notna(joint_no):
-                    try:
-                        joint_no = int(float(joint_no))  # Convert via float first to handle decimals
-                    except (ValueError, TypeError):
-                        joint_no = 0
-                else:
-                    joint_no = 0
-                
-                results.append({
-                    'anomalyNumber': anomaly_no,
-                    'jointNumber': joint_no,
-                    'startDistance': str(row['start_distance']) if pd.notna(row['start_distance']) else '',
-                    'anomalyType': str(row['anomaly_type']) if pd.notna(row['anomaly_type']) else '',
-                    'confidence': float(row['confidence']) if pd.notna(row['confidence']) else 0,
-                    'severity': float(row['severity']) if pd.notna(row['severity']) else 0,
-                    'persistence': int(row['persistence']) if pd.notna(row['persistence']) else 0,
-                    'growthRate': float(row['growth_rate']) if pd.notna(row['growth_rate']) else 0,
-                    'viewed': 'Y' if row['viewed'] == 'Yes' else 'N'
-                })
-            except Exception as e:
-                print(f"Error processing row {idx}: {e}")
-                continue
-        
-        return jsonify({
-            'message': 'Analysis complete',
-            'totalAnomalies': len(results),
-            'results': results
-        }), 200
-        
-    except subprocess.TimeoutExpired:
-        return jsonify({'error': 'Analysis timed out (exceeded 5 minutes)'}), 500
-    except Exception as e:
-        print(f"Error in analyze endpoint: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/clear-uploads', methods=['DELETE'])
-def clear_uploads():
-    """Clear all uploaded files from formatted_files directory"""
-    try:
-        files = os.listdir(UPLOAD_FOLDER)
-        for file in files:
-            if file.endswith('.csv'):
-                os.remove(os.path.join(UPLOAD_FOLDER, file))
-        
-        return jsonify({
-            'message': f'Cleared {len(files)} file(s)',
-            'count': len(files)
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/anomaly/<int:anomaly_id>/viewed', methods=['PATCH'])
-def mark_viewed(anomaly_id):
-    """Toggle viewed status for an anomaly"""
-    try:
-        results_file = os.path.join(RESULTS_FOLDER, 'Master_Alignment_Final.csv')
-        
-        if not os.path.exists(results_file):
-            return jsonify({'error': 'Results file not found'}), 404
-        
-        df = pd.read_csv(results_file)
-        
-        # Find the anomaly
-        mask = df['anomaly_no'] == anomaly_id
-        if not mask.any():
-            return jsonify({'error': 'Anomaly not found'}), 404
-        
-        # Toggle viewed status
-        current_status = df.loc[mask, 'viewed'].iloc[0]
-        new_status = 'No' if current_status == 'Yes' else 'Yes'
-        df.loc[mask, 'viewed'] = new_status
-        
-        # Save back to CSV
-        df.to_csv(results_file, index=False)
-        
-        return jsonify({
-            'message': 'Viewed status updated',
-            'anomalyId': anomaly_id,
-            'viewed': 'Y' if new_status == 'Yes' else 'N'
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-if __name__ == '__main__':
-    print("Starting Flask API server...")
-    print(f"Upload folder: {UPLOAD_FOLDER}")
-    print(f"Results folder: {RESULTS_FOLDER}")
-    app.run(debug=True, port=8000, host='0.0.0.0')
+from flask import Flask, Response, g, request, jsonify
+from flask_cors import CORS
+import os
+import numpy as np
+import pandas as pd
+import subprocess
+import shutil
+import time
+
+from anomaly_score import DEFAULT_SCORING_PARAMS, resolve_scoring_params, score_histories
+from columnar import freshest_source, load_frame, save_frame
+from forecast import CROSSING_COLUMNS
+from history_cache import HISTORY_FILE, load_history
+from metrics import (CONTENT_TYPE, IN_FLIGHT, REGISTRY, REQUEST_LATENCY, REQUESTS, RUN_METRICS_FILE,
+                     record_run_metrics)
+from result_diff import COMPARABLE_COLUMNS, KEY_COLUMN, DEFAULT_TOLERANCES, diff_results, resolve_tolerances
+from results_store import ResultsStore, list_versions, publish
+from schema import ALIGNED_SCHEMA, apply_schema, to_export
+from upload_ingest import clear_folder, ingest_multipart, schedule_precompute
+
+app = Flask(__name__)
+CORS(app)
+
+# Configuration
+# ILI_DATA_ROOT points the API at another data folder (e.g. for load tests)
+DATA_ROOT = os.environ.get('ILI_DATA_ROOT', os.path.join(os.path.dirname(__file__), '..', 'data'))
+UPLOAD_FOLDER = os.path.join(DATA_ROOT, 'formatted_files')
+RESULTS_FOLDER = os.path.join(DATA_ROOT, 'Aligned_Results')
+STORE_FOLDER = os.path.join(RESULTS_FOLDER, 'store')
+HISTORY_PATH = os.path.join(RESULTS_FOLDER, HISTORY_FILE)
+
+# Columns the frontend table needs
+RESULT_COLUMNS = ['anomaly_no', 'joint_no', 'start_distance', 'anomaly_type',
+                  'confidence', 'severity', 'persistence', 'growth_rate', 'viewed']
+
+# Ensure folders exist
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(RESULTS_FOLDER, exist_ok=True)
+
+# Each worker process keeps its own handle; the arrays themselves are shared mmaps
+results_store = ResultsStore(STORE_FOLDER)
+
+def load_results(results_file):
+    """Reads results from the typed columnar copy when it is up to date."""
+    return apply_schema(load_frame(freshest_source(results_file)), ALIGNED_SCHEMA)
+
+def save_results(df, results_file):
+    """Writes the CSV export and refreshes the columnar copy if there is one."""
+    source = freshest_source(results_file)
+    to_export(df).to_csv(results_file, index=False)
+    if source != results_file:
+        save_frame(df, source)
+
+def format_results(df):
+    """Convert a results frame to the records expected by the frontend"""
+    # Handle anomaly_no - could be numeric or string like 'C-70'; use the position as fallback
+    fallback_no = pd.Series(range(1, len(df) + 1), index=df.index)
+    anomaly_no = pd.to_numeric(df['anomaly_no'], errors='coerce').fillna(fallback_no).astype(int)
+    # Handle joint_no - ensure it's an integer (via float to handle decimals)
+    joint_no = pd.to_numeric(df['joint_no'], errors='coerce').fillna(0).astype(int)
+
+    start_distance = df['start_distance']
+    anomaly_type = df['anomaly_type']
+    records = pd.DataFrame({
+        'anomalyNumber': anomaly_no,
+        'jointNumber': joint_no,
+        'startDistance': start_distance.astype(str).where(start_distance.notna(), ''),
+        'anomalyType': anomaly_type.astype(str).where(anomaly_type.notna(), ''),
+        # float32 columns are rounded back to the precision mapping.py stores
+        'confidence': pd.to_numeric(df['confidence'], errors='coerce').fillna(0).astype(float).round(4),
+        'severity': pd.to_numeric(df['severity'], errors='coerce').fillna(0).astype(float).round(4),
+        'persistence': pd.to_numeric(df['persistence'], errors='coerce').fillna(0).astype(int),
+        'growthRate': pd.to_numeric(df['growth_rate'], errors='coerce').fillna(0).astype(float).round(6),
+        'viewed': df['viewed'].isin(['Yes', 1, True]).map({True: 'Y', False: 'N'})
+    })
+    return records.to_dict(orient='records')
+
+def _route_label():
+    # The URL rule, not the path, so /api/anomaly/<id>/viewed stays one series
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = _route_label()
+    IN_FLIGHT.inc(route=g.metrics_route)
+
+@app.after_request
+def record_request_metrics(response):
+    route = g.get('metrics_route', 'unmatched')
+    REQUEST_LATENCY.observe(time.perf_counter() - g.get('metrics_start', time.perf_counter()),
+                            route=route, method=request.method)
+    REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'metrics_route' in g:
+        IN_FLIGHT.dec(route=g.metrics_route)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return Response(REGISTRY.render(), mimetype=CONTENT_TYPE)
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'healthy', 'message': 'Python API is running'})
+
+@app.route('/api/upload', methods=['POST'])
+def upload_files():
+    """Stream uploaded files into formatted_files, validating and de-duplicating them on the way"""
+    try:
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            return jsonify({'error': 'No files provided'}), 400
+
+        results = ingest_multipart(request.stream, boundary, UPLOAD_FOLDER, on_saved=schedule_precompute)
+        if not results:
+            return jsonify({'error': 'No files selected'}), 400
+
+        uploaded_files = [r['filename'] for r in results if r['status'] == 'saved']
+        duplicates = [r['filename'] for r in results if r['status'] == 'duplicate']
+        errors = [e for r in results for e in r['errors']]
+
+        if not uploaded_files and not duplicates:
+            return jsonify({
+                'error': 'No valid files uploaded',
+                'details': errors,
+                'results': results
+            }), 400
+
+        message = f'Successfully uploaded {len(uploaded_files)} file(s)'
+        if duplicates:
+            message += f', skipped {len(duplicates)} already uploaded'
+        return jsonify({
+            'message': message,
+            'files': uploaded_files,
+            'duplicates': duplicates,
+            'errors': errors if errors else None,
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze():
+    """Run the mapping script and return results"""
+    try:
+        # Check if files exist in formatted_files directory
+        files = [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.csv')]
+        
+        if not files:
+            return jsonify({'error': 'No CSV files found in formatted_files directory'}), 400
+        
+        print(f"Found {len(files)} files to analyze: {files}")
+        
+        # Run the mapping script
+        mapping_script = os.path.join(os.path.dirname(__file__), 'mapping.py')
+        result = subprocess.run(
+            ['python3', mapping_script, '--data-dir', UPLOAD_FOLDER, '--output-folder', RESULTS_FOLDER],
+            capture_output=True,
+            text=True,
+            timeout=300  # 5 minute timeout
+        )
+        
+        if result.returncode != 0:
+            print(f"Mapping script error: {result.stderr}")
+            return jsonify({
+                'error': 'Analysis failed',
+                'details': result.stderr
+            }), 500
+        
+        print(f"Mapping script output: {result.stdout}")
+        record_run_metrics(os.path.join(RESULTS_FOLDER, RUN_METRICS_FILE))
+        
+        # Read the results CSV
+        results_file = os.path.join(RESULTS_FOLDER, 'Master_Alignment_Final.csv')
+        
+        # If the main file doesn't exist, look for timestamped versions
+        if not os.path.exists(results_file):
+            # Look for any Master_Alignment_Final*.csv files
+            import glob
+            pattern = os.path.join(RESULTS_FOLDER, 'Master_Alignment_Final*.csv')
+            files = glob.glob(pattern)
+            if files:
+                # Use the most recent one
+                results_file = max(files, key=os.path.getmtime)
+                print(f"Using results file: {results_file}")
+            else:
+                return jsonify({'error': 'Results file not generated'}), 500
+        
+        # Load and format results for frontend
+        view = results_store.open()
+        if view is None:
+            # Results produced without a store (older mapping run): publish them now
+            publish(load_results(results_file), STORE_FOLDER)
+            view = results_store.open()
+        results = format_results(view.to_frame(RESULT_COLUMNS))
+        
+        return jsonify({
+            'message': 'Analysis complete',
+            'totalAnomalies': len(results),
+            'results': results
+        }), 200
+        
+    except subprocess.TimeoutExpired:
+        return jsonify({'error': 'Analysis timed out (exceeded 5 minutes)'}), 500
+    except Exception as e:
+        print(f"Error in analyze endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/results', methods=['GET'])
+def get_results():
+    """Return the current results version without re-running the analysis"""
+    try:
+        view = results_store.open()
+        if view is None:
+            return jsonify({'error': 'No results available, run an analysis first'}), 404
+        
+        results = format_results(view.to_frame(RESULT_COLUMNS))
+        return jsonify({
+            'version': view.version,
+            'totalAnomalies': len(results),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _key_text(keys):
+    # 64-bit keys as hex strings; JSON numbers lose precision past 2**53
+    return [format(int(k) & 0xFFFFFFFFFFFFFFFF, '016x') for k in keys]
+
+@app.route('/api/results/diff', methods=['GET'])
+def diff_versions():
+    """Added, removed and changed anomalies between two results versions"""
+    try:
+        limit = request.args.get('limit', 100, type=int)
+        tolerances = {}
+        for item in filter(None, request.args.get('tolerance', '').split(',')):
+            col, _, value = item.partition(':')
+            tolerances[col.strip()] = value
+        try:
+            resolve_tolerances(tolerances)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'details': {'allowed': list(COMPARABLE_COLUMNS)}}), 400
+        
+        versions = list_versions(STORE_FOLDER)
+        current = results_store.open()
+        to_version = request.args.get('to') or (current.version if current is not None else None)
+        if to_version not in versions:
+            return jsonify({'error': 'No results available, run an analysis first'}), 404
+        from_version = request.args.get('from')
+        if from_version is None:
+            earlier = [v for v in versions if v < to_version]
+            if not earlier:
+                return jsonify({'error': 'No earlier results version to compare with'}), 404
+            from_version = earlier[-1]
+        old_view = results_store.open_version(from_version)
+        new_view = results_store.open_version(to_version)
+        if old_view is None or new_view is None:
+            return jsonify({'error': 'Unknown version', 'details': {'available': versions}}), 404
+        if KEY_COLUMN not in old_view.columns or KEY_COLUMN not in new_view.columns:
+            return jsonify({'error': 'Both versions need anomaly keys, run an analysis again'}), 409
+        
+        start = time.perf_counter()
+        columns = [KEY_COLUMN] + list(DEFAULT_TOLERANCES) + list(tolerances)
+        try:
+            diff = diff_results({c: old_view.array(c) for c in columns if c in old_view.columns},
+                                {c: new_view.array(c) for c in columns if c in new_view.columns},
+                                tolerances)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        def records(view, rows):
+            rows = rows[:limit] if limit >= 0 else rows
+            df = view.take(rows, RESULT_COLUMNS + [KEY_COLUMN])
+            return [dict(r, anomalyKey=k) for r, k in zip(format_results(df), _key_text(df[KEY_COLUMN]))]
+        
+        changed = diff['changed']
+        shown = slice(None, limit) if limit >= 0 else slice(None)
+        old_rows, new_rows = changed['old'][shown], changed['new'][shown]
+        changed_records = records(new_view, new_rows)
+        for i, record in enumerate(changed_records):
+            record['previousAnomalyNumber'] = int(old_view.array('anomaly_no')[old_rows[i]])
+            record['changes'] = {}
+            for col, mask in changed['columns'].items():
+                if mask[i]:
+                    before = float(old_view.array(col)[old_rows[i]])
+                    after = float(new_view.array(col)[new_rows[i]])
+                    record['changes'][col] = {'before': None if np.isnan(before) else round(before, 6),
+                                              'after': None if np.isnan(after) else round(after, 6)}
+        
+        return jsonify({
+            'from': from_version,
+            'to': to_version,
+            'matched': diff['matched'],
+            'counts': {'added': len(diff['added']), 'removed': len(diff['removed']),
+                       'changed': len(changed['new'])},
+            'changedBy': {col: int(mask.sum()) for col, mask in changed['columns'].items()},
+            'tolerances': diff['tolerances'],
+            'elapsedMs': round(elapsed_ms, 1),
+            'added': records(new_view, diff['added']),
+            'removed': records(old_view, diff['removed']),
+            'changed': changed_records
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rescore', methods=['POST'])
+def rescore():
+    """Recompute scores from the cached histories with new scoring parameters"""
+    try:
+        body = request.get_json(silent=True) or {}
+        overrides = body.get('params', {})
+        if not isinstance(overrides, dict):
+            return jsonify({'error': 'params must be an object'}), 400
+        
+        view = results_store.open()
+        if view is None or not os.path.exists(HISTORY_PATH):
+            return jsonify({'error': 'No cached histories available, run an analysis first'}), 404
+        
+        packed = load_history(HISTORY_PATH)
+        if len(packed['present']) != len(view):
+            return jsonify({'error': 'Cached histories do not match the current results, run an analysis again'}), 409
+        
+        try:
+            params = resolve_scoring_params(overrides)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'details': {'allowed': sorted(DEFAULT_SCORING_PARAMS)}}), 400
+        
+        start = time.perf_counter()
+        scores = score_histories(packed, params)
+        
+        df = view.to_frame()
+        for col, values in scores.items():
+            df[col] = values
+        apply_schema(df, ALIGNED_SCHEMA)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        # Preview only unless asked to publish; publish takes the viewed flags as they
+        # are at that moment, including toggles made while scoring
+        version = publish(df, STORE_FOLDER, viewed_from=view.version) if body.get('publish', False) else None
+        
+        results = format_results(df[RESULT_COLUMNS])
+        return jsonify({
+            'message': 'Scores recomputed',
+            'params': params,
+            'version': version,
+            'elapsedMs': round(elapsed_ms, 1),
+            'totalAnomalies': len(results),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/forecast/due', methods=['GET'])
+def forecast_due():
+    """Anomalies forecast to reach a threshold before a given year, earliest first"""
+    try:
+        before = request.args.get('before', type=float)
+        threshold = request.args.get('threshold', 'any')
+        limit = request.args.get('limit', type=int)
+        if before is None:
+            return jsonify({'error': 'before must be a year, e.g. ?before=2030'}), 400
+        if threshold != 'any' and threshold not in CROSSING_COLUMNS:
+            return jsonify({'error': f"threshold must be one of: any, {', '.join(CROSSING_COLUMNS)}"}), 400
+        
+        view = results_store.open()
+        if view is None:
+            return jsonify({'error': 'No results available, run an analysis first'}), 404
+        names = list(CROSSING_COLUMNS) if threshold == 'any' else [threshold]
+        if any(CROSSING_COLUMNS[name] not in view.columns for name in names):
+            return jsonify({'error': 'These results have no forecast, run an analysis again'}), 409
+        
+        # Binary search in the sorted crossing-year indexes; only matching rows are read
+        found = [view.rows_below(CROSSING_COLUMNS[name], before) for name in names]
+        rows = np.concatenate([r for r, _ in found])
+        due = np.concatenate([y for _, y in found])
+        if len(names) > 1:
+            # An anomaly due on both counts is listed once, at its earlier year
+            order = np.argsort(due, kind='stable')
+            rows, first = np.unique(rows[order], return_index=True)
+            due = due[order][first]
+            order = np.argsort(due, kind='stable')
+            rows, due = rows[order], due[order]
+        total = len(rows)
+        if limit is not None and limit >= 0:
+            rows, due = rows[:limit], due[:limit]
+        
+        df = view.take(rows, RESULT_COLUMNS + ['remaining_life', 'projected_depth', 'projected_rpr']
+                       + [CROSSING_COLUMNS[name] for name in CROSSING_COLUMNS])
+        forecast = pd.DataFrame({
+            'dueYear': due.astype(float),
+            'depthCrossingYear': df['depth_crossing_year'].astype(float),
+            'rprCrossingYear': df['rpr_crossing_year'].astype(float),
+            'remainingLife': df['remaining_life'].astype(float),
+            'projectedDepth': df['projected_depth'].astype(float),
+            'projectedRpr': df['projected_rpr'].astype(float),
+        }).round(4)
+        forecast = forecast.astype(object).where(forecast.notna(), None)
+        results = [dict(record, **extra) for record, extra
+                   in zip(format_results(df), forecast.to_dict(orient='records'))]
+        
+        return jsonify({
+            'version': view.version,
+            'before': before,
+            'threshold': threshold,
+            'totalAnomalies': total,
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/clear-uploads', methods=['DELETE'])
+def clear_uploads():
+    """Clear all uploaded files from formatted_files directory"""
+    try:
+        count = clear_folder(UPLOAD_FOLDER)
+        
+        return jsonify({
+            'message': f'Cleared {count} file(s)',
+            'count': count
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/anomaly/<int:anomaly_id>/viewed', methods=['PATCH'])
+def mark_viewed(anomaly_id):
+    """Toggle viewed status for an anomaly"""
+    try:
+        view = results_store.open()
+        if view is not None:
+            # Flip the flag in the shared mapping; every worker sees it immediately.
+            # A version published meanwhile already carries the flags, so toggle there.
+            # The store is the source of truth for viewed: Master_Alignment_Final.csv
+            # and its columnar copy keep the flags of the run that wrote them, and
+            # are not rewritten on every toggle.
+            viewed = None
+            while viewed is None:
+                row = view.row_for(anomaly_id)
+                if row is None:
+                    return jsonify({'error': 'Anomaly not found'}), 404
+                viewed = view.toggle_viewed(row)
+                if viewed is None:
+                    view = results_store.open()
+                    if view is None:
+                        return jsonify({'error': 'Results file not found'}), 404
+            return jsonify({
+                'message': 'Viewed status updated',
+                'anomalyId': anomaly_id,
+                'viewed': 'Y' if viewed else 'N'
+            }), 200
+        
+        results_file = os.path.join(RESULTS_FOLDER, 'Master_Alignment_Final.csv')
+        
+        if not os.path.exists(results_file):
+            return jsonify({'error': 'Results file not found'}), 404
+        
+        df = load_results(results_file)
+        
+        # Find the anomaly
+        mask = df['anomaly_no'] == anomaly_id
+        if not mask.any():
+            return jsonify({'error': 'Anomaly not found'}), 404
+        
+        # Toggle viewed status
+        new_status = not bool(df.loc[mask, 'viewed'].iloc[0])
+        df.loc[mask, 'viewed'] = new_status
+        
+        # Save back to CSV (and the columnar copy)
+        save_results(df, results_file)
+        
+        return jsonify({
+            'message': 'Viewed status updated',
+            'anomalyId': anomaly_id,
+            'viewed': 'Y' if new_status else 'N'
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+if __name__ == '__main__':
+    print("Starting Flask API server...")
+    print(f"Upload folder: {UPLOAD_FOLDER}")
+    print(f"Results folder: {RESULTS_FOLDER}")
+    app.run(debug=True, port=8000, host='0.0.0.0')
@@ -0,0 +1,337 @@
+import argparse
+import contextlib
+import heapq
+import io
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from columnar import columnar_path, load_frame
+
+# Runs mapping.process_directory for many pipelines at once.
+# A manifest lists one data directory per pipeline segment:
+#
+#   {
+#     "defaults": {"alignment": "banded", "tracking": "graph"},
+#     "pipelines": [
+#       {"name": "line-12", "data_dir": "line-12/formatted_files"},
+#       {"name": "line-40", "data_dir": "/mnt/ili/line-40", "output_folder": "/mnt/results/line-40"}
+#     ]
+#   }
+#
+# Relative paths are resolved against the manifest's folder; output_folder
+# defaults to <data_dir>/../Aligned_Results like the single-pipeline layout.
+# All pipelines share one process pool. Each is split into its year-pair
+# alignments (mapping.alignment_pairs) and a final tracking/scoring/save
+# step, so one long pipeline is spread over several workers instead of
+# running alone at the end. A failing pipeline only fails its own tasks,
+# including when one of its tasks kills the worker process.
+# Every pipeline gets its results and a batch.log in its output folder;
+# the fleet summary goes to fleet_summary.json.
+
+SUMMARY_FILE = 'fleet_summary.json'
+LOG_FILE = 'batch.log'
+PIPELINE_OPTIONS = ('alignment', 'tracking', 'columnar_format', 'publish_store')
+
+
+def load_manifest(path):
+    """Reads a manifest and returns one job dict per pipeline, with absolute paths."""
+    with open(path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults', {})
+
+    jobs, names, outputs = [], set(), set()
+    for entry in manifest.get('pipelines', []):
+        if 'data_dir' not in entry:
+            raise ValueError(f"Pipeline entry without data_dir: {entry}")
+        data_dir = os.path.join(base, entry['data_dir'])
+        name = entry.get('name') or os.path.basename(os.path.normpath(data_dir))
+        if name in names:
+            raise ValueError(f"Duplicate pipeline name: {name}")
+        names.add(name)
+        output_folder = entry.get('output_folder')
+        output_folder = (os.path.join(base, output_folder) if output_folder
+                         else os.path.join(os.path.dirname(os.path.normpath(data_dir)), 'Aligned_Results'))
+        if os.path.normpath(output_folder) in outputs:
+            raise ValueError(f"{name}: output folder {output_folder} is used by another pipeline")
+        outputs.add(os.path.normpath(output_folder))
+        options = {k: entry.get(k, defaults.get(k)) for k in PIPELINE_OPTIONS
+                   if k in entry or k in defaults}
+        unknown = set(entry) - {'name', 'data_dir', 'output_folder'} - set(PIPELINE_OPTIONS)
+        if unknown:
+            raise ValueError(f"{name}: unknown manifest keys {sorted(unknown)}")
+        jobs.append({'name': name, 'data_dir': os.path.normpath(data_dir),
+                     'output_folder': os.path.normpath(output_folder), 'options': options})
+    if not jobs:
+        raise ValueError(f"No pipelines listed in {path}")
+    return jobs
+
+
+def plan_pipeline(job):
+    """
+    Splits a pipeline into its year-pair alignments plus one final tracking
+    and scoring step. Adds 'files', 'pairs' and 'bytes' to job.
+    """
+    from mapping import alignment_pairs, collect_formatted_files
+    with contextlib.redirect_stdout(io.StringIO()):
+        files = collect_formatted_files(job['data_dir']) if os.path.isdir(job['data_dir']) else []
+    job['files'] = {f['year']: f['path'] for f in files}
+    job['pairs'] = alignment_pairs(job['files'], job['options'].get('tracking', 'baseline'))
+    job['bytes'] = sum(os.path.getsize(p) for p in job['files'].values())
+    return job
+
+
+def _pair_cost(job, pair):
+    # Alignment work grows with the rows of both inspections; bytes stand in for rows
+    return os.path.getsize(job['files'][pair[0]]) + os.path.getsize(job['files'][pair[1]])
+
+
+def align_pair(job, pair):
+    """Worker: aligns one pair of inspections. Returns (mapping, log text, wall s, cpu s)."""
+    from mapping import align_years, load_formatted
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        print(f"=== Aligning {pair[0]} -> {pair[1]} ({os.getpid()}) ===")
+        earlier = load_formatted(job['files'][pair[0]])
+        later = load_formatted(job['files'][pair[1]])
+        mapping = align_years(earlier, later, method=job['options'].get('alignment', 'dtw'),
+                              workers=job.get('align_workers', 1))
+        print(f"{len(mapping)} matches")
+    return mapping, log.getvalue(), time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+def finish_pipeline(job, mappings, align_log):
+    """Worker: tracking, scoring and saving with the precomputed alignments. Never raises."""
+    from mapping import process_directory
+    from metrics import RUN_METRICS_FILE
+
+    record = {'status': 'ok', 'pid': os.getpid()}
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        os.makedirs(job['output_folder'], exist_ok=True)
+        with open(os.path.join(job['output_folder'], LOG_FILE), 'w') as log, \
+                contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            log.write(align_log)
+            message = process_directory(os.path.join(current_dir, 'mapping.py'), data_dir=job['data_dir'],
+                                        output_folder=job['output_folder'], mappings=mappings,
+                                        workers=job.get('align_workers', 1), **job['options'])
+        if message.startswith('Error'):
+            record.update(status='failed', error=message)
+        else:
+            final_path = os.path.join(job['output_folder'], 'Master_Alignment_Final.csv')
+            record['results'] = final_path
+            record.update(_result_stats(final_path))
+            with open(os.path.join(job['output_folder'], RUN_METRICS_FILE)) as f:
+                run = json.load(f)
+            record['rows'] = run['rows']
+            record['stages'] = {k: round(v, 3) for k, v in run['stages'].items()}
+    except Exception as e:
+        record.update(status='failed', error=f'{type(e).__name__}: {e}', traceback=traceback.format_exc())
+    record['wall_s'] = time.perf_counter() - wall_start
+    record['cpu_s'] = time.process_time() - cpu_start
+    return record
+
+
+def _result_stats(final_path):
+    typed = columnar_path(final_path)
+    df = load_frame(typed if os.path.exists(typed) else final_path, columns=['confidence', 'severity'])
+    return {
+        'anomalies': len(df),
+        'mean_confidence': round(float(df['confidence'].mean()), 4) if len(df) else None,
+        'max_severity': round(float(df['severity'].max()), 4) if len(df) else None,
+    }
+
+
+def run_batch(jobs, workers=None, summary_path=None):
+    """
+    Runs every pipeline on one process pool. The year-pair alignments of all
+    pipelines are independent tasks; a pipeline's final step is queued once
+    its alignments are in. Whenever a worker frees up it gets the largest
+    ready task (longest-processing-time-first list scheduling), which keeps
+    wall time close to total work / workers. Returns the fleet summary, also
+    written to summary_path when given.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    # Chunked alignment starts its own pool inside a worker; give it only this
+    # worker's share of the cores so the nested pools don't oversubscribe.
+    align_workers = max(1, (os.cpu_count() or 1) // workers)
+    state = {}
+    ready = []  # heap of (-cost, seq, kind, name, pair)
+    seq = itertools.count()
+    for job in jobs:
+        plan_pipeline(job)
+        job['align_workers'] = align_workers
+        state[job['name']] = {'job': job, 'mappings': {}, 'log': [], 'pending': len(job['pairs']),
+                              'record': {'name': job['name'], 'data_dir': job['data_dir'],
+                                         'output_folder': job['output_folder'], 'bytes': job['bytes'],
+                                         'align_tasks': len(job['pairs']), 'wall_s': 0.0, 'cpu_s': 0.0}}
+        if not job['files']:
+            error = f"No formatted ILI files in {job['data_dir']}"
+            state[job['name']]['record'].update(status='failed', error=error)
+            print(f"{job['name']}: failed ({error})")
+            continue
+        for pair in job['pairs']:
+            heapq.heappush(ready, (-_pair_cost(job, pair), next(seq), 'align', job['name'], pair))
+        if not job['pairs']:
+            heapq.heappush(ready, (-job['bytes'], next(seq), 'finish', job['name'], None))
+
+    def fail(name, error):
+        record = state[name]['record']
+        if 'status' not in record:
+            record.update(status='failed', error=error)
+            print(f"{name}: failed ({error})")
+
+    def describe(task):
+        kind, _, pair = task
+        return f"{kind} {pair[0]}->{pair[1]}" if pair else kind
+
+    def submit(pool, task):
+        kind, name, pair = task
+        st = state[name]
+        if kind == 'align':
+            return pool.submit(align_pair, st['job'], pair)
+        return pool.submit(finish_pipeline, st['job'], st['mappings'], ''.join(st['log']))
+
+    def complete(task, result):
+        kind, name, pair = task
+        st = state[name]
+        if kind == 'align':
+            mapping, log, wall, cpu = result
+            st['mappings'][pair] = mapping
+            st['log'].append(log)
+            st['record']['wall_s'] += wall
+            st['record']['cpu_s'] += cpu
+            st['pending'] -= 1
+            if st['pending'] == 0 and 'status' not in st['record']:
+                heapq.heappush(ready, (-st['job']['bytes'], next(seq), 'finish', name, None))
+        else:
+            st['mappings'].clear()
+            record = st['record']
+            record['wall_s'] += result.pop('wall_s')
+            record['cpu_s'] += result.pop('cpu_s')
+            record.update(result)
+            detail = f"{record['wall_s']:.1f}s" if record['status'] == 'ok' else record['error']
+            print(f"{name}: {record['status']} ({detail})")
+
+    def crashed(task):
+        fail(task[1], f"{describe(task)}: worker process died (BrokenProcessPool)")
+
+    # A worker that dies (killed for memory, os._exit) breaks the whole pool and
+    # every task running on it. The pool is rebuilt; if more than one task was
+    # running, each is re-run alone so the crash is charged to its own pipeline.
+    start = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers)
+    suspects = []
+    try:
+        in_flight = {}
+        while ready or in_flight or suspects:
+            if suspects:
+                task = suspects.pop()
+                if 'status' in state[task[1]]['record']:
+                    continue
+                future = submit(pool, task)
+                wait([future])
+                if isinstance(future.exception(), BrokenProcessPool):
+                    crashed(task)
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                elif future.exception() is not None:
+                    fail(task[1], f"{describe(task)}: {type(future.exception()).__name__}: {future.exception()}")
+                else:
+                    complete(task, future.result())
+                continue
+
+            broken = False
+            while ready and len(in_flight) < workers and not broken:
+                entry = heapq.heappop(ready)
+                task = entry[2:]
+                if 'status' in state[task[1]]['record']:
+                    continue  # pipeline already failed
+                try:
+                    in_flight[submit(pool, task)] = task
+                except BrokenProcessPool:
+                    heapq.heappush(ready, entry)  # never ran, just resubmit
+                    broken = True
+            if not broken:
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    error = future.exception()
+                    if isinstance(error, BrokenProcessPool):
+                        broken = True
+                        continue
+                    task = in_flight.pop(future)
+                    if error is not None:
+                        fail(task[1], f"{describe(task)}: {type(error).__name__}: {error}")
+                    else:
+                        complete(task, future.result())
+            if broken:
+                # Finished results are kept; whatever was still running is suspect
+                for future, task in in_flight.items():
+                    if future.done() and future.exception() is None:
+                        complete(task, future.result())
+                    else:
+                        suspects.append(task)
+                in_flight = {}
+                if len(suspects) == 1:
+                    crashed(suspects.pop())
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    wall = time.perf_counter() - start
+
+    pipelines = [state[job['name']]['record'] for job in jobs]
+    for record in pipelines:
+        record['wall_s'] = round(record['wall_s'], 3)
+        record['cpu_s'] = round(record['cpu_s'], 3)
+    ok = [r for r in pipelines if r['status'] == 'ok']
+    busy = sum(r['wall_s'] for r in pipelines)
+    summary = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'workers': workers,
+        'pipelines_total': len(pipelines),
+        'pipelines_ok': len(ok),
+        'pipelines_failed': len(pipelines) - len(ok),
+        'anomalies': sum(r['anomalies'] for r in ok),
+        'rows': sum(r['rows'] for r in ok),
+        'wall_s': round(wall, 3),
+        'cpu_s': round(sum(r['cpu_s'] for r in pipelines), 3),
+        # 1.0 means every worker was busy from the first task to the last
+        'pool_utilisation': round(busy / (wall * workers), 3) if wall > 0 else None,
+        'pipelines': pipelines,
+    }
+    if summary_path:
+        os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Align and score many pipelines on a shared worker pool")
+    parser.add_argument('manifest', help="JSON manifest listing the pipeline data directories")
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    parser.add_argument('--summary', help=f"fleet summary path (default: {SUMMARY_FILE} next to the manifest)")
+    args = parser.parse_args()
+
+    summary_path = args.summary or os.path.join(os.path.dirname(os.path.abspath(args.manifest)), SUMMARY_FILE)
+    summary = run_batch(load_manifest(args.manifest), args.workers, summary_path)
+    print(f"\n{summary['pipelines_ok']}/{summary['pipelines_total']} pipelines succeeded, "
+          f"{summary['anomalies']:,} anomalies tracked")
+    print(f"Wall {summary['wall_s']:.1f}s, CPU {summary['cpu_s']:.1f}s on {summary['workers']} workers "
+          f"(utilisation {summary['pool_utilisation']})")
+    print(f"Summary written to {summary_path}")
+    sys.exit(1 if summary['pipelines_failed'] else 0)
@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Allow importing the pipeline modules from python-api/
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_ili import generate_inspections
+
+# Load-test harness for the Flask API. It starts the API on a private data
+# folder (or targets --url), seeds it with synthetic inspections, then drives
+# a weighted mix of upload / analyze / results / viewed requests from a pool
+# of client threads for a fixed duration.
+#
+# Lost updates are measured in a separate contention phase: every client
+# toggles the viewed flag of a few "hot" anomalies. With atomic toggles the
+# states returned for one anomaly alternate, so each extra duplicate state
+# is a toggle that overwrote another. The final flag is also checked
+# against the parity of the acknowledged toggles.
+
+DEFAULT_MIX = {'results': 60, 'viewed': 30, 'upload': 5, 'analyze': 5}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def parse_mix(text):
+    """'results=60,viewed=30,upload=5,analyze=5' -> dict of weights."""
+    mix = {}
+    for part in text.split(','):
+        op, _, weight = part.partition('=')
+        if op not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation in mix: {op}")
+        mix[op] = float(weight)
+    return mix
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(data_root, workers=1):
+    """Starts the API on a free port with ILI_DATA_ROOT=data_root. Returns (process, base_url)."""
+    port = _free_port()
+    env = dict(os.environ, ILI_DATA_ROOT=data_root)
+    if workers > 1 and shutil.which('gunicorn'):
+        cmd = ['gunicorn', '-w', str(workers), '--threads', '4', '-b', f'127.0.0.1:{port}', 'app:app']
+    else:
+        if workers > 1:
+            print("gunicorn not found, falling back to the threaded Flask server")
+        cmd = [sys.executable, '-c',
+               f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(cmd, cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            request('GET', base_url + '/api/health', timeout=1)
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("API server did not start")
+
+
+def _multipart(paths):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for path in paths:
+        with open(path, 'rb') as f:
+            content = f.read()
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="files"; '
+                 f'filename="{os.path.basename(path)}"\r\nContent-Type: text/csv\r\n\r\n').encode()
+        body += content + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return bytes(body), f'multipart/form-data; boundary={boundary}'
+
+
+def request(method, url, body=None, content_type=None, timeout=600):
+    """Returns (status, parsed JSON or None). HTTP errors are returned, not raised."""
+    req = urllib.request.Request(url, data=body, method=method)
+    if content_type:
+        req.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}   # op -> list of (latency_s, ok)
+
+    def add(self, op, latency, ok):
+        with self.lock:
+            self.samples.setdefault(op, []).append((latency, ok))
+
+    def summary(self, elapsed):
+        report = {}
+        for op, samples in sorted(self.samples.items()):
+            latency = np.array([s[0] for s in samples]) * 1000
+            errors = sum(1 for s in samples if not s[1])
+            report[op] = {
+                'requests': len(samples),
+                'throughput_rps': round(len(samples) / elapsed, 2),
+                'p50_ms': round(float(np.percentile(latency, 50)), 1),
+                'p95_ms': round(float(np.percentile(latency, 95)), 1),
+                'p99_ms': round(float(np.percentile(latency, 99)), 1),
+                'max_ms': round(float(latency.max()), 1),
+                'error_rate': round(errors / len(samples), 4),
+            }
+        return report
+
+
+def run_mixed(base_url, upload_paths, n_anomalies, mix, concurrency, duration, seed=0):
+    """Drives the mix for `duration` seconds. Returns the per-operation summary."""
+    recorder = Recorder()
+    ops = list(mix)
+    weights = np.array([mix[op] for op in ops], dtype=float)
+    weights /= weights.sum()
+    upload_body = _multipart(upload_paths)
+    deadline = time.perf_counter() + duration
+
+    def call(op, rng):
+        if op == 'results':
+            return request('GET', base_url + '/api/results')
+        if op == 'viewed':
+            anomaly = rng.randint(1, n_anomalies)
+            return request('PATCH', f'{base_url}/api/anomaly/{anomaly}/viewed')
+        if op == 'upload':
+            return request('POST', base_url + '/api/upload', *upload_body)
+        return request('POST', base_url + '/api/analyze')
+
+    def client(index):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            op = ops[int(np.searchsorted(np.cumsum(weights), rng.random()))]
+            start = time.perf_counter()
+            try:
+                status, _ = call(op, rng)
+                ok = status == 200
+            except OSError:
+                ok = False
+            recorder.add(op, time.perf_counter() - start, ok)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    report = recorder.summary(elapsed)
+    total = sum(r['requests'] for r in report.values())
+    report['total'] = {'requests': total, 'throughput_rps': round(total / elapsed, 2), 'elapsed_s': round(elapsed, 2)}
+    return report
+
+
+def _viewed_flags(base_url):
+    status, body = request('GET', base_url + '/api/results')
+    if status != 200:
+        raise RuntimeError(f"GET /api/results failed with {status}")
+    return {r['anomalyNumber']: r['viewed'] == 'Y' for r in body['results']}
+
+
+def run_contention(base_url, concurrency, toggles, hot_ids):
+    """Concurrent viewed toggles on a few anomalies; counts lost updates."""
+    before = _viewed_flags(base_url)
+    acknowledged = {a: [] for a in hot_ids}
+    lock = threading.Lock()
+
+    def toggle(k):
+        anomaly = hot_ids[k % len(hot_ids)]
+        status, body = request('PATCH', f'{base_url}/api/anomaly/{anomaly}/viewed')
+        if status == 200:
+            with lock:
+                acknowledged[anomaly].append(body['viewed'] == 'Y')
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(toggle, range(toggles)))
+    after = _viewed_flags(base_url)
+
+    lost = 0
+    final_mismatch = 0
+    for anomaly, states in acknowledged.items():
+        k = len(states)
+        # Atomic toggles from s0 return (not s0) ceil(k/2) times
+        flipped = sum(1 for s in states if s != before[anomaly])
+        lost += abs(flipped - (k + 1) // 2)
+        expected = before[anomaly] if k % 2 == 0 else not before[anomaly]
+        final_mismatch += int(after[anomaly] != expected)
+    return {'toggles': toggles, 'acknowledged': sum(len(s) for s in acknowledged.values()),
+            'hot_ids': list(hot_ids), 'lost_updates': lost, 'final_state_mismatches': final_mismatch}
+
+
+def run(n_anomalies=2000, mix=None, concurrency=8, duration=30, toggles=400, hot=5,
+        url=None, workers=1, seed=0):
+    mix = mix or dict(DEFAULT_MIX)
+    work_dir = tempfile.mkdtemp(prefix='ili_load_')
+    process = None
+    try:
+        data_dir = os.path.join(work_dir, 'synthetic')
+        truth = generate_inspections(data_dir, n_anomalies, seed=seed)
+        upload_paths = [os.path.join(data_dir, f'ILI_{y}_formatted.csv') for y in truth]
+
+        if url is None:
+            process, url = start_server(os.path.join(work_dir, 'data'), workers)
+        print(f"API at {url}")
+
+        # Seed: upload and analyze once so results exist
+        status, _ = request('POST', url + '/api/upload', *_multipart(upload_paths))
+        if status != 200:
+            raise RuntimeError(f"Seeding upload failed with {status}")
+        start = time.perf_counter()
+        status, body = request('POST', url + '/api/analyze')
+        if status != 200:
+            raise RuntimeError(f"Seeding analyze failed with {status}")
+        total_anomalies = body['totalAnomalies']
+        print(f"Seeded {total_anomalies:,} anomalies (analyze took {time.perf_counter() - start:.1f}s)")
+
+        print(f"Mixed load: {concurrency} clients for {duration}s, mix {mix}")
+        mixed = run_mixed(url, upload_paths, total_anomalies, mix, concurrency, duration, seed)
+
+        rng = random.Random(seed)
+        hot_ids = rng.sample(range(1, total_anomalies + 1), min(hot, total_anomalies))
+        print(f"Contention: {toggles} viewed toggles on anomalies {hot_ids}")
+        contention = run_contention(url, concurrency, toggles, hot_ids)
+
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'anomalies': total_anomalies,
+            'concurrency': concurrency,
+            'duration_s': duration,
+            'server_workers': workers,
+            'mix': mix,
+            'operations': mixed,
+            'contention': contention,
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_report(report):
+    print(f"\n{'operation':<10} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for op, r in report['operations'].items():
+        if op == 'total':
+            continue
+        print(f"{op:<10} {r['requests']:>9} {r['throughput_rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+              f"{r['p99_ms']:>9} {r['error_rate']:>8.2%}")
+    total = report['operations']['total']
+    print(f"{'total':<10} {total['requests']:>9} {total['throughput_rps']:>8}")
+    c = report['contention']
+    print(f"\nLost updates: {c['lost_updates']} of {c['acknowledged']} acknowledged toggles, "
+          f"{c['final_state_mismatches']} final-state mismatches")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the Flask API with synthetic data")
+    parser.add_argument('--anomalies', type=int, default=2000, help="synthetic baseline anomaly count")
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="operation weights, e.g. results=60,viewed=30,upload=5,analyze=5")
+    parser.add_argument('--concurrency', type=int, default=8, help="client threads")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of mixed load")
+    parser.add_argument('--toggles', type=int, default=400, help="viewed toggles in the contention phase")
+    parser.add_argument('--hot', type=int, default=5, help="anomalies targeted in the contention phase")
+    parser.add_argument('--workers', type=int, default=1, help="server worker processes (needs gunicorn)")
+    parser.add_argument('--url', help="target a running API instead of starting one (it will be written to)")
+    parser.add_argument('--out', help="JSON output path (default: benchmarks/results/)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.anomalies, args.mix, args.concurrency, args.duration, args.toggles, args.hot,
+                 args.url, args.workers, args.seed)
+    print_report(report)
+
+    out_path = args.out
+    if out_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out_path = os.path.join(RESULTS_DIR, f"load_{report['timestamp'].replace(':', '').replace('-', '')}.json")
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out_path}")
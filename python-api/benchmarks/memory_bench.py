@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Allow importing the pipeline modules from python-api/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import FORMATTED_SCHEMA, ALIGNED_SCHEMA, apply_schema, bytes_per_row
+
+# Reports bytes per anomaly for the formatted and aligned tables with pandas
+# defaults (what pd.read_csv gives us) versus the declared schema.
+
+
+def default_formatted(n, rng):
+    """Formatted ILI table as pd.read_csv would type it."""
+    joints = np.sort(rng.integers(1, n // 3 + 2, n)).astype(float)
+    joints[rng.random(n) < 0.001] = np.nan  # a few rows without a joint number
+    distance = np.sort(rng.uniform(0, 2.6e6, n))
+    return pd.DataFrame({
+        'feature_id': np.array([f'ML-{int(j) if j == j else 0}' for j in joints], dtype=object),
+        'distance': distance,
+        'odometer': distance,
+        'joint_number': joints,
+        'relative_position': rng.uniform(0, 40, n),
+        'angle': rng.uniform(0, 360, n),
+        'feature_type': rng.choice(np.array(['metal loss', 'Cluster', 'metal loss-manufacturing anomaly'], dtype=object), n),
+        'depth_percent': rng.uniform(0.05, 0.6, n),
+        'length': rng.uniform(0.2, 5, n),
+        'width': rng.uniform(0.2, 5, n),
+        'wall_thickness': np.full(n, 0.25),
+        'weld_type': np.full(n, None, dtype=object),
+        'elevation': rng.uniform(0, 500, n),
+        'j_len': rng.uniform(35, 45, n),
+    })
+
+
+def default_aligned(n, rng):
+    """Master_Alignment_Final table as pd.read_csv would type it."""
+    return pd.DataFrame({
+        'anomaly_no': np.arange(1, n + 1),
+        'joint_no': np.sort(rng.integers(1, n // 3 + 2, n)).astype(float),
+        'start_distance': np.sort(rng.uniform(0, 2.6e6, n)),
+        'anomaly_type': rng.choice(np.array(['metal loss', 'Cluster'], dtype=object), n),
+        'confidence': rng.random(n),
+        'severity': rng.random(n),
+        'persistence': rng.choice([0.0, 8.0, 15.0], n),
+        'growth_rate': rng.random(n),
+        'viewed': rng.choice(np.array(['Yes', 'No'], dtype=object), n),
+        'j_len': rng.uniform(35, 45, n),
+        'log_dist': np.sort(rng.uniform(0, 2.6e6, n)),
+        'elevation': rng.uniform(0, 500, n),
+        'rotation': rng.uniform(0, 360, n),
+        'internal': np.full(n, np.nan),
+        'ml_depth': rng.uniform(0.05, 0.6, n),
+        'ml_depth_lenth': rng.uniform(0.2, 5, n),
+        'width': rng.uniform(0.2, 5, n),
+        'mod_b31g': np.full(n, np.nan),
+    })
+
+
+def run(n=1_000_000, seed=0):
+    rng = np.random.default_rng(seed)
+    report = {}
+    for name, build, schema in [('formatted', default_formatted, FORMATTED_SCHEMA),
+                                ('aligned', default_aligned, ALIGNED_SCHEMA)]:
+        df = build(n, rng)
+        before = bytes_per_row(df)
+        after = bytes_per_row(apply_schema(df, schema))
+        report[name] = {'rows': n, 'bytes_per_anomaly_before': round(before, 1),
+                        'bytes_per_anomaly_after': round(after, 1),
+                        'reduction': round(before / after, 2)}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bytes per anomaly with and without the dtype schema")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    for name, r in run(args.rows).items():
+        print(f"{name:>10}: {r['bytes_per_anomaly_before']:>7} -> {r['bytes_per_anomaly_after']:>6} "
+              f"bytes/anomaly ({r['reduction']}x smaller, {r['rows']:,} rows)")
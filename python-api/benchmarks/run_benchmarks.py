@@ -0,0 +1,188 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# Allow importing the pipeline modules from python-api/
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(API_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_ili import DEFAULT_YEARS, alignment_accuracy, generate_inspections, load_truth
+
+# End-to-end benchmark on synthetic inspections. For each scale it times
+# formatter.py on a vendor-style raw file, mapping.process_directory, and the
+# API conversion of the results to JSON, then scores the alignment against
+# the generator's ground truth. Results are written as JSON so runs can be
+# compared across commits.
+
+DEFAULT_SCALES = (1_000, 10_000, 100_000, 1_000_000)
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=API_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux; it only ever grows, so it is the peak so far
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+@contextlib.contextmanager
+def _quiet(verbose):
+    if verbose:
+        yield
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+
+def time_formatter(data_dir, year):
+    """Runs the ILI_2007-style formatting steps on the raw file of `year`."""
+    import formatter
+    with open(os.path.join(API_DIR, 'format.json')) as f:
+        fmt = json.load(f)['ILI_2007']
+    formatter.PATH = data_dir + os.sep
+    start = time.perf_counter()
+    ili = formatter.ILI(f'Raw_ILI_{year}.csv', fmt)
+    ili.process()
+    ili.filter_anomalies()
+    ili.generate_ids()
+    ili.clock_to_degrees()
+    ili.normalize_depth()
+    ili.clean_relative_position()
+    ili.apply_schema()
+    return time.perf_counter() - start, len(ili.processed_data)
+
+
+def time_mapping(data_dir, output_folder, alignment):
+    from mapping import process_directory
+    start = time.perf_counter()
+    process_directory(os.path.join(API_DIR, 'mapping.py'), data_dir=data_dir, output_folder=output_folder,
+                      alignment=alignment)
+    return time.perf_counter() - start
+
+
+def time_api_conversion(output_folder):
+    """load_results + format_results + JSON encoding, as /api/analyze does for the CSV fallback."""
+    from app import format_results, load_results
+    results_file = os.path.join(output_folder, 'Master_Alignment_Final.csv')
+    start = time.perf_counter()
+    payload = json.dumps(format_results(load_results(results_file)))
+    return time.perf_counter() - start, len(payload)
+
+
+def measure_accuracy(data_dir, years, alignment):
+    from mapping import align_years, load_formatted
+    truth = load_truth(data_dir)
+    baseline = load_formatted(os.path.join(data_dir, f'ILI_{years[0]}_formatted.csv'))
+    report = {}
+    for year in years[1:]:
+        current = load_formatted(os.path.join(data_dir, f'ILI_{year}_formatted.csv'))
+        mapping = align_years(baseline, current, method=alignment)
+        report[str(year)] = alignment_accuracy(mapping, truth[years[0]], truth[year])
+    return report
+
+
+def run_scale(n_anomalies, work_dir, alignment, years=DEFAULT_YEARS, seed=0, accuracy=True, verbose=False):
+    data_dir = os.path.join(work_dir, f'n{n_anomalies}')
+    output_folder = os.path.join(data_dir, 'Aligned_Results')
+    result = {'anomalies': n_anomalies, 'alignment': alignment}
+
+    start = time.perf_counter()
+    truth = generate_inspections(data_dir, n_anomalies, years, seed=seed, raw_year=years[0])
+    result['generate_s'] = round(time.perf_counter() - start, 3)
+    result['rows_per_year'] = {str(y): int(len(ids)) for y, ids in truth.items()}
+
+    with _quiet(verbose):
+        seconds, rows = time_formatter(data_dir, years[0])
+        result['formatter_s'] = round(seconds, 3)
+        result['formatter_rows'] = rows
+
+        result['mapping_s'] = round(time_mapping(data_dir, output_folder, alignment), 3)
+
+        seconds, size = time_api_conversion(output_folder)
+        result['api_conversion_s'] = round(seconds, 3)
+        result['api_payload_bytes'] = size
+
+        if accuracy:
+            result['accuracy'] = measure_accuracy(data_dir, years, alignment)
+
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def run(scales=DEFAULT_SCALES, alignment='dtw', years=DEFAULT_YEARS, seed=0, accuracy=True,
+        work_dir=None, verbose=False):
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='ili_bench_')
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'years': list(years),
+        'runs': [],
+    }
+    try:
+        for n in scales:
+            print(f"--- {n:,} anomalies ({alignment}) ---")
+            result = run_scale(n, work_dir, alignment, years, seed, accuracy, verbose)
+            report['runs'].append(result)
+            line = (f"formatter {result['formatter_s']:.2f}s  mapping {result['mapping_s']:.2f}s  "
+                    f"api {result['api_conversion_s']:.2f}s  peak RSS {result['peak_rss_mb']} MB")
+            print(line)
+            for year, acc in result.get('accuracy', {}).items():
+                print(f"  {years[0]} -> {year}: precision {acc['precision']:.4f}  recall {acc['recall']:.4f}")
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def save_report(report, out_path=None):
+    if out_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = report['timestamp'].replace(':', '').replace('-', '')
+        out_path = os.path.join(RESULTS_DIR, f"bench_{stamp}_{report['commit'] or 'nogit'}.json")
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return out_path
+
+
+if __name__ == "__main__":
+    from mapping import ALIGNMENT_METHODS
+
+    parser = argparse.ArgumentParser(description="End-to-end benchmark on synthetic ILI inspections")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES),
+                        help="baseline anomaly counts to run")
+    parser.add_argument('--alignment', choices=ALIGNMENT_METHODS, default='dtw')
+    parser.add_argument('--years', type=int, nargs='+', default=list(DEFAULT_YEARS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-accuracy', action='store_true', help="skip scoring against ground truth")
+    parser.add_argument('--work-dir', help="keep generated data here instead of a temp directory")
+    parser.add_argument('--out', help="JSON output path (default: benchmarks/results/)")
+    parser.add_argument('--verbose', action='store_true', help="show pipeline output")
+    args = parser.parse_args()
+
+    report = run(args.scales, args.alignment, tuple(sorted(args.years)), args.seed,
+                 not args.no_accuracy, args.work_dir, verbose=args.verbose)
+    print(f"Results written to {save_report(report, args.out)}")
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Synthetic multi-year ILI inspections with known ground truth.
+#
+# One set of "physical" anomalies is laid out along a pipeline of joints.
+# Each inspection year sees them through its own odometer (a per-year scale
+# error plus a slowly wandering offset), with clock-angle and position noise,
+# depth growth, a fraction of anomalies missed and some new ones appearing.
+# Output per year:
+#   ILI_YYYY_formatted.csv   the formatted table mapping.py reads
+# plus ground_truth.npz with, per year, the physical anomaly id of every row,
+# and (optionally) a vendor-style raw file for benchmarking formatter.py.
+
+DEFAULT_YEARS = (2007, 2015, 2022)
+FEATURE_TYPES = np.array(['metal loss', 'Cluster', 'metal loss-manufacturing anomaly'])
+FEATURE_WEIGHTS = (0.85, 0.10, 0.05)
+TRUTH_FILE = 'ground_truth.npz'
+
+
+def _pipeline(n_anomalies, anomalies_per_joint, rng):
+    """Joint layout and the physical anomalies on it, sorted by position."""
+    n_joints = max(1, int(np.ceil(n_anomalies / anomalies_per_joint)))
+    joint_length = rng.uniform(35, 45, n_joints)
+    joint_start = np.concatenate([[0.0], np.cumsum(joint_length)[:-1]])
+
+    joint = np.sort(rng.integers(0, n_joints, n_anomalies))
+    rel = rng.uniform(0, joint_length[joint])
+    order = np.lexsort((rel, joint))
+    joint, rel = joint[order], rel[order]
+    return {
+        'joint_length': joint_length,
+        'joint_start': joint_start,
+        'joint': joint,
+        'rel': rel,
+        'angle': rng.uniform(0, 360, n_anomalies),
+        'depth': rng.uniform(0.05, 0.4, n_anomalies),
+        'length': rng.uniform(0.5, 3.0, n_anomalies),
+        'width': rng.uniform(0.5, 3.0, n_anomalies),
+        'feature_type': rng.choice(FEATURE_TYPES, n_anomalies, p=FEATURE_WEIGHTS),
+        'wall_thickness': rng.choice([0.25, 0.312, 0.375], n_joints),
+    }
+
+
+def _odometer(true_pos, k, drift, rng):
+    """Odometer reading of year k: scale error plus a smooth random-walk offset."""
+    scale = 1 + drift * k * rng.uniform(0.5, 1.5)
+    wander = np.cumsum(rng.normal(0, 10 * drift, len(true_pos)))
+    return true_pos * scale + wander
+
+
+def generate_inspections(out_dir, n_anomalies=1000, years=DEFAULT_YEARS, anomalies_per_joint=3.0,
+                         odometer_drift=0.002, position_noise=0.1, angle_noise=3.0,
+                         missing_rate=0.05, new_rate=0.03, depth_growth=0.01, seed=0,
+                         raw_year=None):
+    """
+    Writes one ILI_YYYY_formatted.csv per year and ground_truth.npz to out_dir.
+    n_anomalies is the size of the baseline population; later years add
+    about new_rate * n_anomalies new anomalies each.
+    Returns {year: array of physical anomaly ids, one per row}.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    pipe = _pipeline(n_anomalies, anomalies_per_joint, rng)
+    born = np.zeros(n_anomalies, dtype=int)  # index of the first year an anomaly exists
+
+    # Anomalies that start growing after the baseline
+    for k in range(1, len(years)):
+        n_new = int(round(n_anomalies * new_rate))
+        extra = _pipeline(n_new, anomalies_per_joint, rng)
+        # Place them on the existing joints
+        joint = rng.integers(0, len(pipe['joint_length']), n_new)
+        extra['joint'] = joint
+        extra['rel'] = rng.uniform(0, pipe['joint_length'][joint])
+        extra['depth'] = rng.uniform(0.05, 0.15, n_new)
+        for key in ('joint', 'rel', 'angle', 'depth', 'length', 'width', 'feature_type'):
+            pipe[key] = np.concatenate([pipe[key], extra[key]])
+        born = np.concatenate([born, np.full(n_new, k)])
+
+    true_pos = pipe['joint_start'][pipe['joint']] + pipe['rel']
+    by_position = np.argsort(true_pos, kind='stable')
+    truth = {}
+
+    for k, year in enumerate(years):
+        ids = by_position[(born[by_position] <= k) & (rng.random(len(by_position)) >= missing_rate)]
+        n = len(ids)
+        joint = pipe['joint'][ids]
+        odometer = _odometer(true_pos[ids], k, odometer_drift, rng)
+        elapsed = year - years[0]
+        df = pd.DataFrame({
+            'feature_id': [f'ML-{j + 1}' for j in joint],
+            'distance': odometer + rng.normal(0, position_noise, n),
+            'odometer': odometer,
+            'joint_number': joint + 1,
+            'relative_position': np.abs(pipe['rel'][ids] + rng.normal(0, position_noise, n)),
+            'angle': np.mod(pipe['angle'][ids] + rng.normal(0, angle_noise, n), 360),
+            'feature_type': pipe['feature_type'][ids],
+            'depth_percent': np.minimum(pipe['depth'][ids] + depth_growth * elapsed * rng.uniform(0, 2, n), 0.95),
+            'length': pipe['length'][ids] * rng.uniform(0.9, 1.1, n),
+            'width': pipe['width'][ids] * rng.uniform(0.9, 1.1, n),
+            'wall_thickness': pipe['wall_thickness'][joint],
+            'weld_type': None,
+            'elevation': 150 + 50 * np.sin(true_pos[ids] / 5000) + rng.normal(0, 1, n),
+            'j_len': pipe['joint_length'][joint],
+        })
+        df.to_csv(os.path.join(out_dir, f'ILI_{year}_formatted.csv'), index=False)
+        truth[year] = ids
+        if raw_year == year:
+            write_raw(df, os.path.join(out_dir, f'Raw_ILI_{year}.csv'))
+
+    np.savez(os.path.join(out_dir, TRUTH_FILE), **{str(y): ids for y, ids in truth.items()})
+    with open(os.path.join(out_dir, 'generator.json'), 'w') as f:
+        json.dump({'n_anomalies': n_anomalies, 'years': list(years), 'anomalies_per_joint': anomalies_per_joint,
+                   'odometer_drift': odometer_drift, 'position_noise': position_noise,
+                   'angle_noise': angle_noise, 'missing_rate': missing_rate, 'new_rate': new_rate,
+                   'depth_growth': depth_growth, 'seed': seed}, f, indent=2)
+    return truth
+
+
+def write_raw(formatted, path):
+    """
+    Vendor-style export of a formatted year, using the ILI_2007 headers in
+    format.json: girth weld rows carry the joint number, length and wall
+    thickness; anomaly rows carry an o'clock string and depth in percent.
+    """
+    welds = formatted.drop_duplicates('joint_number')
+    weld_rows = pd.DataFrame({
+        'log dist. [ft]': welds['distance'] - welds['relative_position'],
+        'J. no.': welds['joint_number'],
+        'to u/s w. [ft]': 0.0,
+        "o'clock": None,
+        'event': 'Girth Weld',
+        'depth [%]': np.nan,
+        'length [in]': np.nan,
+        'width [in]': np.nan,
+        't [in]': welds['wall_thickness'],
+        'J. len [ft]': welds['j_len'],
+    })
+    minutes = np.round(formatted['angle'].to_numpy() * 2).astype(int) % 720
+    anomaly_rows = pd.DataFrame({
+        'log dist. [ft]': formatted['distance'],
+        'J. no.': np.nan,
+        'to u/s w. [ft]': -formatted['relative_position'],
+        "o'clock": [f'{m // 60}:{m % 60:02d}' for m in minutes],
+        'event': formatted['feature_type'],
+        'depth [%]': formatted['depth_percent'] * 100,
+        'length [in]': formatted['length'],
+        'width [in]': formatted['width'],
+        't [in]': np.nan,
+        'J. len [ft]': np.nan,
+    })
+    raw = pd.concat([weld_rows, anomaly_rows]).sort_values('log dist. [ft]', kind='stable')
+    raw.to_csv(path, index=False)
+    return path
+
+
+def load_truth(out_dir):
+    with np.load(os.path.join(out_dir, TRUTH_FILE)) as data:
+        return {int(year): data[year] for year in data.files}
+
+
+def alignment_accuracy(mapping, baseline_truth, current_truth):
+    """
+    Scores a baseline_idx -> current_idx mapping against the ground truth.
+    precision: share of reported matches that are the same physical anomaly
+    recall: share of anomalies present in both years that were matched correctly
+    """
+    correct = sum(1 for i, j in mapping.items() if baseline_truth[i] == current_truth[j])
+    matchable = len(np.intersect1d(baseline_truth, current_truth))
+    return {
+        'matches': len(mapping),
+        'correct': correct,
+        'matchable': int(matchable),
+        'precision': round(correct / len(mapping), 4) if mapping else 1.0,
+        'recall': round(correct / matchable, 4) if matchable else 1.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic ILI_YYYY_formatted.csv inspections")
+    parser.add_argument('out_dir')
+    parser.add_argument('--anomalies', type=int, default=1000)
+    parser.add_argument('--years', type=int, nargs='+', default=list(DEFAULT_YEARS))
+    parser.add_argument('--per-joint', type=float, default=3.0, help="anomalies per joint")
+    parser.add_argument('--drift', type=float, default=0.002, help="odometer scale error per inspection")
+    parser.add_argument('--angle-noise', type=float, default=3.0, help="clock angle noise (degrees)")
+    parser.add_argument('--missing', type=float, default=0.05, help="fraction missed per inspection")
+    parser.add_argument('--new', type=float, default=0.03, help="fraction of new anomalies per inspection")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--raw', action='store_true', help="also write a vendor-style raw file for the first year")
+    args = parser.parse_args()
+
+    truth = generate_inspections(args.out_dir, args.anomalies, tuple(sorted(args.years)), args.per_joint,
+                                 args.drift, angle_noise=args.angle_noise, missing_rate=args.missing,
+                                 new_rate=args.new, seed=args.seed,
+                                 raw_year=min(args.years) if args.raw else None)
+    for year, ids in truth.items():
+        print(f"ILI_{year}_formatted.csv: {len(ids):,} anomalies")
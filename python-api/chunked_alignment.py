@@ -0,0 +1,157 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Add the current directory to sys.path to ensure we can import the sibling file
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from mapping import (DEFAULT_BAND_TOLERANCE, align_years, compute_custom_dtw, connect_band, distance_band_rows,
+                     get_alignment_signal)
+
+# Out-of-core alignment for very long lines. Both inspections are cut into
+# overlapping segments (at girth welds where possible), each segment is
+# aligned on its own, and only the mappings from the segment's core are kept,
+# so the overlap absorbs DTW's forced start/end cells. Results are appended to
+# a binary file of (baseline_idx, current_idx) int64 pairs as segments finish.
+# The distance band is computed once for the whole line and each segment gets
+# its slice: a drift correction fitted to one segment's welds alone can be a
+# joint length off the global one.
+
+DEFAULT_SEGMENT_SIZE = 5000  # baseline rows per segment core
+DEFAULT_OVERLAP = 500        # extra baseline rows aligned on each side of the core
+
+
+def weld_boundaries(df):
+    """Row indices where a new joint starts (i.e. just after a girth weld)."""
+    if 'joint_number' not in df.columns:
+        return np.array([], dtype=int)
+    joints = df['joint_number'].astype(float).ffill().to_numpy()
+    return np.flatnonzero(joints[1:] != joints[:-1]) + 1
+
+
+def segment_cores(df, segment_size=DEFAULT_SEGMENT_SIZE):
+    """
+    Splits rows into contiguous [start, end) cores of about segment_size rows,
+    moving each cut to the nearest girth weld within a quarter segment.
+    """
+    n = len(df)
+    welds = weld_boundaries(df)
+    cuts = [0]
+    target = segment_size
+    while target < n:
+        cut = target
+        if len(welds):
+            k = np.searchsorted(welds, target)
+            nearby = welds[max(k - 1, 0):k + 1]
+            nearby = nearby[np.abs(nearby - target) <= segment_size // 4]
+            if len(nearby):
+                cut = int(nearby[np.argmin(np.abs(nearby - target))])
+        if cut <= cuts[-1]:
+            cut = target
+        cuts.append(cut)
+        target = cut + segment_size
+    cuts.append(n)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def plan_segments(baseline_df, current_df, segment_size=DEFAULT_SEGMENT_SIZE,
+                  overlap=DEFAULT_OVERLAP, band_tolerance=DEFAULT_BAND_TOLERANCE):
+    """
+    Returns a list of segment dicts with the baseline core, the extended
+    baseline range, the matching current-year range and, when both years
+    have distances, the segment's slice of the distance band ([lo, hi)
+    current rows per baseline row, relative to the current range).
+    """
+    n, m = len(baseline_df), len(current_df)
+    has_distance = 'distance' in baseline_df.columns and 'distance' in current_df.columns
+    if has_distance:
+        lo, hi = distance_band_rows(baseline_df, current_df, band_tolerance)
+
+    segments = []
+    for core_start, core_end in segment_cores(baseline_df, segment_size):
+        b0 = max(0, core_start - overlap)
+        b1 = min(n, core_end + overlap)
+        if has_distance:
+            c0 = int(lo[b0:b1].min())
+            c1 = max(int(hi[b0:b1].max()), c0 + 1)
+            segments.append({'core': (core_start, core_end), 'baseline': (b0, b1), 'current': (c0, c1),
+                             'band': (lo[b0:b1] - c0, hi[b0:b1] - c0)})
+        else:
+            # No distance axis: assume rows advance at the same rate in both years
+            c0 = max(0, int(b0 * m / n) - overlap)
+            c1 = min(m, int(b1 * m / n) + overlap)
+            segments.append({'core': (core_start, core_end), 'baseline': (b0, b1),
+                             'current': (c0, max(c1, c0 + 1))})
+    return segments
+
+
+def _align_segment(args):
+    segment, baseline_part, current_part, method, max_distance_threshold, band_tolerance = args
+    b0, _ = segment['baseline']
+    c0, _ = segment['current']
+    core_start, core_end = segment['core']
+    baseline_part = baseline_part.reset_index(drop=True)
+    current_part = current_part.reset_index(drop=True)
+    if method == 'banded' and 'band' in segment:
+        lo, hi = segment['band']
+        band = connect_band(lo + 1, hi + 1, len(current_part))
+        local = compute_custom_dtw(get_alignment_signal(baseline_part), get_alignment_signal(current_part),
+                                   max_distance_threshold, band=band)
+    else:
+        local = align_years(baseline_part, current_part, method=method,
+                            max_distance_threshold=max_distance_threshold, band_tolerance=band_tolerance)
+    # Stitch: keep only the core; the overlap belongs to the neighbouring segments
+    pairs = [(b0 + i, c0 + j) for i, j in local.items() if core_start <= b0 + i < core_end]
+    return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+
+def align_chunked(baseline_df, current_df, out_path, segment_size=DEFAULT_SEGMENT_SIZE,
+                  overlap=DEFAULT_OVERLAP, workers=None, method='banded',
+                  max_distance_threshold=2.0, band_tolerance=DEFAULT_BAND_TOLERANCE):
+    """
+    Aligns current_df to baseline_df segment by segment and streams the
+    (baseline_idx, current_idx) pairs to out_path. Peak memory for the DTW
+    cost rows and paths is bounded by one segment per worker.
+    Returns the number of pairs written.
+    """
+    segments = plan_segments(baseline_df, current_df, segment_size, overlap, band_tolerance)
+    print(f"Chunked alignment: {len(segments)} segment(s) of ~{segment_size} rows, overlap {overlap}")
+
+    def tasks():
+        for seg in segments:
+            b0, b1 = seg['baseline']
+            c0, c1 = seg['current']
+            yield (seg, baseline_df.iloc[b0:b1], current_df.iloc[c0:c1],
+                   method, max_distance_threshold, band_tolerance)
+
+    written = 0
+    with open(out_path, 'wb') as out:
+        if workers is not None and workers > 1 and len(segments) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Keep at most 2 segments per worker in flight so memory stays bounded,
+                # and write in segment order so the file stays sorted by baseline index
+                pending = []
+                for task in tasks():
+                    pending.append(pool.submit(_align_segment, task))
+                    if len(pending) >= 2 * workers:
+                        pairs = pending.pop(0).result()
+                        out.write(pairs.tobytes())
+                        written += len(pairs)
+                for future in pending:
+                    pairs = future.result()
+                    out.write(pairs.tobytes())
+                    written += len(pairs)
+        else:
+            for task in tasks():
+                pairs = _align_segment(task)
+                out.write(pairs.tobytes())
+                written += len(pairs)
+    return written
+
+
+def load_mapping(path):
+    """Reads a file written by align_chunked back into a baseline_idx -> current_idx dict."""
+    pairs = np.fromfile(path, dtype=np.int64).reshape(-1, 2)
+    return dict(zip(pairs[:, 0].tolist(), pairs[:, 1].tolist()))
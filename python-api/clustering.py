@@ -0,0 +1,172 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add the current directory to sys.path to ensure we can import the sibling file
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+except ImportError:
+    connected_components = None
+
+# Interaction clustering. Anomalies within the axial and circumferential
+# interaction distance of each other belong to the same cluster, transitively.
+# Points are binned into an axial-distance x clock-angle grid with cells the
+# size of the interaction distance, so every interacting pair sits in the same
+# or an adjacent cell (angle cells wrap around at 360 degrees). Only those
+# cells are compared, which keeps the work near-linear in the anomaly count.
+#
+# Positions are only comparable within one inspection: every run has its own
+# odometer. cluster_histories therefore finds the interacting pairs per
+# inspection year, among the anomalies detected that year, and joins the
+# pairs of all years into one set of clusters.
+
+DEFAULT_AXIAL_DISTANCE = 1.0           # ft between anomaly positions
+DEFAULT_CIRCUMFERENTIAL_DISTANCE = 15.0  # degrees of clock angle
+CLUSTER_COLUMNS = ['cluster_id', 'cluster_size', 'cluster_max_depth', 'cluster_axial_extent']
+
+# Neighbouring cells to visit as (axial, angular) offsets. Half of the 3 x 3
+# neighbourhood is enough since each pair is found from one of its two cells.
+_NEIGHBOUR_OFFSETS = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def interacting_pairs(distance, angle, axial_distance=DEFAULT_AXIAL_DISTANCE,
+                      circumferential_distance=DEFAULT_CIRCUMFERENTIAL_DISTANCE):
+    """
+    Index pairs (i, j) of anomalies within both interaction distances.
+    Rows with a missing distance or angle never interact.
+    """
+    valid = np.flatnonzero(~(np.isnan(distance) | np.isnan(angle)))
+    d = distance[valid]
+    a = np.mod(angle[valid], 360.0)
+    n_angle_cells = max(1, int(np.floor(360.0 / circumferential_distance)))
+    cell_x = np.floor((d - d.min()) / axial_distance).astype(np.int64) if len(d) else np.array([], dtype=np.int64)
+    cell_a = np.minimum((a / (360.0 / n_angle_cells)).astype(np.int64), n_angle_cells - 1)
+
+    keys = cell_x * n_angle_cells + cell_a
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    left, right = [], []
+    for dx, da in _NEIGHBOUR_OFFSETS:
+        target = (cell_x + dx) * n_angle_cells + np.mod(cell_a + da, n_angle_cells)
+        lo = np.searchsorted(sorted_keys, target, side='left')
+        hi = np.searchsorted(sorted_keys, target, side='right')
+        counts = hi - lo
+        i = np.repeat(np.arange(len(d)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(lo, counts) + offsets]
+        keep = i < j if (dx, da) == (0, 0) else i != j
+        left.append(i[keep])
+        right.append(j[keep])
+    i = np.concatenate(left)
+    j = np.concatenate(right)
+
+    angle_diff = np.abs(a[i] - a[j])
+    angle_diff = np.minimum(angle_diff, 360.0 - angle_diff)
+    close = (np.abs(d[i] - d[j]) <= axial_distance) & (angle_diff <= circumferential_distance)
+    return valid[i[close]], valid[j[close]]
+
+
+def _components(n, i, j):
+    """Component label per node, numbered in order of each component's first node."""
+    if connected_components is not None:
+        graph = coo_matrix((np.ones(len(i), dtype=np.int8), (i, j)), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+    else:
+        from identity_graph import UnionFind
+        uf = UnionFind(n)
+        for a, b in zip(i.tolist(), j.tolist()):
+            uf.union(a, b)
+        labels = uf.roots()
+    # Renumber so cluster ids follow row order
+    _, first = np.unique(labels, return_index=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    return rank[np.unique(labels, return_inverse=True)[1]]
+
+
+def _aggregate(labels, depth, positions):
+    """
+    CLUSTER_COLUMNS arrays from component labels. positions: DataFrame of
+    (label, year, distance); the axial extent is the widest within one year.
+    """
+    size = np.bincount(labels, minlength=labels.max() + 1 if len(labels) else 0)
+    max_depth = pd.Series(depth).groupby(labels).max().to_numpy()
+    extent = np.zeros(len(size))
+    if len(positions):
+        by_year = positions.groupby(['label', 'year'])['distance']
+        widest = (by_year.max() - by_year.min()).groupby(level='label').max()
+        extent[widest.index.to_numpy()] = widest.fillna(0).to_numpy()
+    multi = int((size > 1).sum())
+    print(f"Interaction clustering: {multi} clusters with 2+ anomalies ({int(size[size > 1].sum())} anomalies)")
+    return {
+        'cluster_id': labels + 1,
+        'cluster_size': size[labels],
+        'cluster_max_depth': max_depth[labels],
+        'cluster_axial_extent': extent[labels],
+    }
+
+
+def cluster_histories(packed, axial_distance=DEFAULT_AXIAL_DISTANCE,
+                      circumferential_distance=DEFAULT_CIRCUMFERENTIAL_DISTANCE):
+    """
+    packed: dict from history_cache.pack_history
+    Clusters per inspection year: two anomalies interact when their positions
+    in the same inspection (log_dist, rotation) are within the interaction
+    distances. Clusters join the pairs of every year. Returns a dict of
+    CLUSTER_COLUMNS arrays, one value per anomaly; cluster_max_depth uses each
+    anomaly's latest depth and cluster_axial_extent the widest single-year span.
+    """
+    present = packed['present']
+    n, n_years = present.shape
+    distance = packed['log_dist'].astype(float)
+    angle = packed['rotation'].astype(float)
+
+    left, right, positions = [], [], []
+    for k in range(n_years):
+        rows = np.flatnonzero(present[:, k])
+        i, j = interacting_pairs(distance[rows, k], angle[rows, k], axial_distance, circumferential_distance)
+        left.append(rows[i])
+        right.append(rows[j])
+        positions.append(pd.DataFrame({'row': rows, 'year': k, 'distance': distance[rows, k]}))
+    i = np.concatenate(left) if left else np.array([], dtype=np.int64)
+    j = np.concatenate(right) if right else np.array([], dtype=np.int64)
+    labels = _components(n, i, j)
+
+    last = n_years - 1 - np.argmax(present[:, ::-1], axis=1) if n_years else np.zeros(n, dtype=int)
+    seen = present.any(axis=1)
+    depth = np.where(seen, packed['depth'].astype(float)[np.arange(n), last], np.nan) if n_years else np.full(n, np.nan)
+
+    positions = pd.concat(positions, ignore_index=True) if positions else pd.DataFrame(
+        {'row': [], 'year': [], 'distance': []})
+    positions['label'] = labels[positions['row'].to_numpy(dtype=np.int64)]
+    return _aggregate(labels, depth, positions)
+
+
+def cluster_anomalies(df, axial_distance=DEFAULT_AXIAL_DISTANCE,
+                      circumferential_distance=DEFAULT_CIRCUMFERENTIAL_DISTANCE,
+                      distance_col='log_dist', angle_col='rotation', depth_col='ml_depth'):
+    """
+    Clusters the rows of one table whose positions share an odometer axis
+    (e.g. a single inspection). Adds cluster_id (1-based, in row order) and
+    the per-cluster aggregates cluster_size, cluster_max_depth and
+    cluster_axial_extent to df in place. Anomalies that interact with nothing
+    form a cluster of size 1.
+    """
+    n = len(df)
+    distance = df[distance_col].astype(float).to_numpy() if distance_col in df.columns else np.full(n, np.nan)
+    angle = df[angle_col].astype(float).to_numpy() if angle_col in df.columns else np.full(n, np.nan)
+    i, j = interacting_pairs(distance, angle, axial_distance, circumferential_distance)
+    labels = _components(n, i, j)
+
+    depth = df[depth_col].astype(float).to_numpy() if depth_col in df.columns else np.full(n, np.nan)
+    valid = ~np.isnan(distance)
+    positions = pd.DataFrame({'label': labels[valid], 'year': 0, 'distance': distance[valid]})
+    for col, values in _aggregate(labels, depth, positions).items():
+        df[col] = values
+    return df
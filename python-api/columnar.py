@@ -0,0 +1,120 @@
+import os
+import numpy as np
+import pandas as pd
+
+from metrics import cache_lookup
+from schema import plain_array
+
+# Typed on-disk format used between pipeline stages (formatter -> mapping -> app).
+# CSV stays the export format; these files only exist to skip re-parsing text.
+#   .parquet / .feather  need pyarrow
+#   .npz                 numpy only, one array per column
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+COLUMNAR_EXTENSIONS = ('.parquet', '.feather', '.npz')
+DEFAULT_FORMAT = 'parquet' if HAS_PYARROW else 'npz'
+
+_COLUMNS_KEY = '__columns__'
+_NULL_PREFIX = '__null__'
+
+
+def columnar_path(path, fmt=DEFAULT_FORMAT):
+    """ILI_2007_formatted.csv -> ILI_2007_formatted.parquet"""
+    return os.path.splitext(path)[0] + '.' + fmt.lstrip('.')
+
+
+def _save_npz(df, path):
+    arrays = {_COLUMNS_KEY: np.array(list(df.columns), dtype=str)}
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        key = f'c{i}'
+        if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+            arrays[key] = plain_array(series)
+        else:
+            # Strings: store text plus a null mask so NaN survives the round trip
+            nulls = series.isna().to_numpy()
+            arrays[key] = np.array(series.astype(object).where(~nulls, '').tolist(), dtype=str)
+            arrays[_NULL_PREFIX + key] = nulls
+    # Write to a temp name first; np.savez appends .npz to names without it
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _load_npz(path, columns=None):
+    with np.load(path, allow_pickle=False) as npz:
+        all_columns = list(npz[_COLUMNS_KEY])
+        wanted = all_columns if columns is None else [c for c in all_columns if c in set(columns)]
+        data = {}
+        for col in wanted:
+            key = f'c{all_columns.index(col)}'
+            values = npz[key]
+            if _NULL_PREFIX + key in npz.files:
+                values = pd.Series(values, dtype=object).mask(npz[_NULL_PREFIX + key])
+            data[col] = values
+    return pd.DataFrame(data, columns=wanted)
+
+
+def save_frame(df, path):
+    """Writes df in the format given by the file extension (.csv included)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        df.to_csv(path, index=False)
+    elif ext == '.parquet':
+        df.to_parquet(path, index=False)
+    elif ext == '.feather':
+        df.reset_index(drop=True).to_feather(path)
+    elif ext == '.npz':
+        _save_npz(df, path)
+    else:
+        raise ValueError(f"Unsupported table format: {path}")
+    return path
+
+
+def load_frame(path, columns=None):
+    """
+    Reads a table written by save_frame. `columns` projects the read so only
+    those columns are decoded; names missing from the file are ignored.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        if columns is None:
+            return pd.read_csv(path)
+        wanted = set(columns)
+        return pd.read_csv(path, usecols=lambda c: c in wanted)
+
+    if ext in ('.parquet', '.feather'):
+        if columns is not None:
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+            schema_names = (pq.read_schema(path).names if ext == '.parquet'
+                            else feather.read_table(path, memory_map=True).schema.names)
+            columns = [c for c in schema_names if c in set(columns)]
+        if ext == '.parquet':
+            return pd.read_parquet(path, columns=columns)
+        return pd.read_feather(path, columns=columns)
+
+    if ext == '.npz':
+        return _load_npz(path, columns)
+
+    raise ValueError(f"Unsupported table format: {path}")
+
+
+def freshest_source(csv_path):
+    """
+    Returns the columnar sibling of csv_path if one exists and is at least as
+    new as the CSV, otherwise csv_path itself.
+    """
+    csv_mtime = os.path.getmtime(csv_path) if os.path.exists(csv_path) else -1
+    for ext in COLUMNAR_EXTENSIONS:
+        candidate = os.path.splitext(csv_path)[0] + ext
+        if os.path.exists(candidate) and os.path.getmtime(candidate) >= csv_mtime:
+            cache_lookup('columnar', hit=True)
+            return candidate
+    cache_lookup('columnar', hit=False)
+    return csv_path
@@ -0,0 +1,114 @@
+import numpy as np
+
+# Remaining-life forecast from the packed per-year histories (history_cache).
+# Every anomaly gets a linear depth growth rate and RPR change rate (least
+# squares over the years it was detected), projected values at a horizon,
+# the year it crosses each threshold, and its remaining life counted from
+# the latest inspection. All of it is computed on whole (n, years) arrays.
+#
+# Crossing years are NaN when the anomaly is not getting worse; an anomaly
+# already past a threshold crosses in the year it was last detected. RPR
+# columns stay NaN unless the inspection reported mod_b31g.
+
+DEFAULT_FORECAST_PARAMS = {
+    'depth_threshold': 0.8,   # depth as a fraction of wall thickness
+    'rpr_threshold': 1.0,     # RPR below this is treated as failed (see calculate_severity_score)
+    'horizon_years': 10,      # projected_* columns are for latest inspection + horizon
+}
+
+FORECAST_COLUMNS = ['depth_rate', 'rpr_rate', 'projected_depth', 'projected_rpr',
+                    'depth_crossing_year', 'rpr_crossing_year', 'remaining_life']
+
+# Threshold names accepted by the due-by query and the result column each one reads
+CROSSING_COLUMNS = {'depth': 'depth_crossing_year', 'rpr': 'rpr_crossing_year'}
+
+
+def resolve_forecast_params(overrides=None):
+    params = dict(DEFAULT_FORECAST_PARAMS)
+    for key, value in (overrides or {}).items():
+        if key not in params:
+            raise ValueError(f"Unknown forecast parameter: {key}")
+        try:
+            params[key] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Forecast parameter {key} must be a number")
+    return params
+
+
+def _trend(years, values, mask):
+    """
+    Least-squares slope of values over years per row, using the masked
+    entries. Also returns the last masked value and its year. Rows with
+    fewer than two points get a NaN slope.
+    """
+    mask = mask & np.isfinite(values)
+    count = mask.sum(axis=1)
+    x = np.where(mask, years, 0.0)
+    y = np.where(mask, values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = x.sum(axis=1) / count
+        mean_y = y.sum(axis=1) / count
+        dx = np.where(mask, years - mean_x[:, None], 0.0)
+        dy = np.where(mask, values - mean_y[:, None], 0.0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+    slope = np.where(count >= 2, slope, np.nan)
+
+    last_col = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+    rows = np.arange(len(mask))
+    has_any = count > 0
+    last_value = np.where(has_any, values[rows, last_col], np.nan)
+    last_year = np.where(has_any, years[rows, last_col], np.nan)
+    return slope, last_value, last_year
+
+
+def _crossing_year(last_value, last_year, rate, threshold, worsening):
+    """Year a linear trend reaches threshold; worsening is +1 for rising depth, -1 for falling RPR."""
+    past = worsening * (last_value - threshold) >= 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ahead = last_year + (threshold - last_value) / rate
+    ahead = np.where(worsening * rate > 0, ahead, np.nan)
+    return np.where(past, last_year, ahead)
+
+
+def forecast_histories(packed, params=None):
+    """
+    packed: dict from history_cache.pack_history / load_history
+    Returns a dict of FORECAST_COLUMNS arrays, one value per anomaly.
+    """
+    params = resolve_forecast_params(params)
+    present = packed['present']
+    years = np.broadcast_to(packed['years'].astype(float), present.shape)
+    reference_year = float(packed['years'].max()) if len(packed['years']) else np.nan
+    target_year = reference_year + params['horizon_years']
+
+    depth = packed['depth'].astype(float)
+    rpr = packed['rpr'].astype(float)
+    # Without mod_b31g, get_rpr falls back to 1 - depth; that proxy is always
+    # below 1.0 and only mirrors the depth forecast, so it gets no RPR forecast
+    proxy = np.all(~present | np.isnan(rpr) | np.isclose(rpr, 1.0 - depth, atol=1e-5), axis=1)
+    rpr = np.where(proxy[:, None], np.nan, rpr)
+
+    depth_slope, last_depth, depth_year = _trend(years, depth, present)
+    rpr_slope, last_rpr, rpr_year = _trend(years, rpr, present)
+    # Shrinking corrosion or recovering strength is measurement noise, not repair
+    depth_rate = np.where(np.isnan(depth_slope), np.nan, np.maximum(depth_slope, 0.0))
+    rpr_rate = np.where(np.isnan(rpr_slope), np.nan, np.minimum(rpr_slope, 0.0))
+
+    projected_depth = np.clip(last_depth + depth_rate * (target_year - depth_year), 0.0, 1.0)
+    projected_rpr = np.maximum(last_rpr + rpr_rate * (target_year - rpr_year), 0.0)
+
+    depth_crossing = _crossing_year(last_depth, depth_year, depth_rate, params['depth_threshold'], 1)
+    rpr_crossing = _crossing_year(last_rpr, rpr_year, rpr_rate, params['rpr_threshold'], -1)
+    first_crossing = np.fmin(depth_crossing, rpr_crossing)
+    remaining_life = np.maximum(first_crossing - reference_year, 0.0)
+
+    return {
+        'depth_rate': np.round(depth_rate, 6),
+        'rpr_rate': np.round(rpr_rate, 6),
+        'projected_depth': np.round(projected_depth, 4),
+        'projected_rpr': np.round(projected_rpr, 4),
+        'depth_crossing_year': np.round(depth_crossing, 2),
+        'rpr_crossing_year': np.round(rpr_crossing, 2),
+        'remaining_life': np.round(remaining_life, 2),
+    }
+
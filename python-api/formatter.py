@@ -2,6 +2,9 @@ import pandas as pd
 import numpy as np
 import json
 
+from columnar import DEFAULT_FORMAT, columnar_path, save_frame
+from schema import FORMATTED_SCHEMA, apply_schema
+
 FILE = 'format.json'
 PATH = '../data/' 
 
@@ -84,9 +87,17 @@ class ILI:
         if 'relative_position' in self.processed_data.columns:
             self.processed_data['relative_position'] = self.processed_data['relative_position'].abs()
 
+    def apply_schema(self):
+        # Compact dtypes (categoricals, Int32 joints, float32 measurements)
+        self.processed_data = apply_schema(self.processed_data, FORMATTED_SCHEMA)
+
     def save_csv(self, output_name):
         self.processed_data.to_csv(PATH + output_name, index=False)
 
+    def save_columnar(self, output_name, fmt=DEFAULT_FORMAT):
+        # Typed copy next to the CSV; mapping.py prefers it when it is up to date
+        save_frame(self.processed_data, columnar_path(PATH + output_name, fmt))
+
     def datasort2022(sheet4_df: pd.DataFrame) -> pd.DataFrame:
         anomoly_count = 0
         output_columns = [
@@ -260,49 +271,54 @@ class ILI:
                 
         return pd.DataFrame(output_data, columns=output_columns)
 
-# --- Execution ---
-file_path = '../data' # Change to your actual path
+if __name__ == "__main__":
+    # --- Execution ---
+    file_path = '../data' # Change to your actual path
 
-# 1. Load
-ILI_2015 = pd.read_csv(file_path + '/Cleaned_ILIDataV2-2015.csv')
+    # 1. Load
+    ILI_2015 = pd.read_csv(file_path + '/Cleaned_ILIDataV2-2015.csv')
 
-# 2. Process
-ILI_2015_formatted = ILI.datasort2015(ILI_2015)
+    # 2. Process
+    ILI_2015_formatted = apply_schema(ILI.datasort2015(ILI_2015), FORMATTED_SCHEMA)
 
-# 3. Save
-ILI_2015_formatted.to_csv(file_path + '/ILI_2015_formatted.csv', index=False)
+    # 3. Save
+    ILI_2015_formatted.to_csv(file_path + '/ILI_2015_formatted.csv', index=False)
+    save_frame(ILI_2015_formatted, columnar_path(file_path + '/ILI_2015_formatted.csv'))
 
-# --- Main Execution Block ---
-file_path = '../data' # Update this to your actual directory path
+    # --- Main Execution Block ---
+    file_path = '../data' # Update this to your actual directory path
 
-# 1. Load the data
-ILI_2022 = pd.read_csv(file_path + '/Cleaned_ILIDataV2-2022.csv')
+    # 1. Load the data
+    ILI_2022 = pd.read_csv(file_path + '/Cleaned_ILIDataV2-2022.csv')
 
-# 2. Process the data
-ILI_2022_formatted = ILI.datasort2022(ILI_2022)
+    # 2. Process the data
+    ILI_2022_formatted = apply_schema(ILI.datasort2022(ILI_2022), FORMATTED_SCHEMA)
 
-# 3. Save the data
-ILI_2022_formatted.to_csv(file_path + '/ILI_2022_formatted.csv', index=False)
-# ... (2 lines left)
+    # 3. Save the data
+    ILI_2022_formatted.to_csv(file_path + '/ILI_2022_formatted.csv', index=False)
+    save_frame(ILI_2022_formatted, columnar_path(file_path + '/ILI_2022_formatted.csv'))
+    # ... (2 lines left)
 
 
-with open(FILE, 'r') as file:
-    data = json.load(file)
+    with open(FILE, 'r') as file:
+        data = json.load(file)
 
-ili_objects = {
-    '2007': ILI('Cleaned_ILIDataV2-2007.csv', data['ILI_2007'])
-}
+    ili_objects = {
+        '2007': ILI('Cleaned_ILIDataV2-2007.csv', data['ILI_2007'])
+    }
 
-for year, ili_obj in ili_objects.items():
-    print(f"Processing {year}...")
+    for year, ili_obj in ili_objects.items():
+        print(f"Processing {year}...")
     
-    ili_obj.process()
+        ili_obj.process()
     
-    ili_obj.filter_anomalies()
-    ili_obj.generate_ids()
-    ili_obj.clock_to_degrees()
-    ili_obj.normalize_depth()
-    ili_obj.clean_relative_position()
+        ili_obj.filter_anomalies()
+        ili_obj.generate_ids()
+        ili_obj.clock_to_degrees()
+        ili_obj.normalize_depth()
+        ili_obj.clean_relative_position()
+        ili_obj.apply_schema()
     
-    ili_obj.save_csv(f'ILI_{year}_formatted.csv')
-    print(f"Finished {year}.")
\ No newline at end of file
+        ili_obj.save_csv(f'ILI_{year}_formatted.csv')
+        ili_obj.save_columnar(f'ILI_{year}_formatted.csv')
+        print(f"Finished {year}.")
\ No newline at end of file
@@ -0,0 +1,139 @@
+import json
+import os
+import re
+from difflib import SequenceMatcher
+
+# Offline header matcher. Maps vendor ILI headers onto our target columns
+# without any network call; heading_interpreter only asks Bedrock about the
+# columns this module is not confident about.
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+FORMAT_FILE = os.path.join(current_dir, 'format.json')
+
+DEFAULT_THRESHOLD = 0.75
+
+# Hand-written synonyms for each target. Headers already seen in format.json
+# are added on top of these by build_synonyms().
+BASE_SYNONYMS = {
+    'feature_id': ['feature id', 'anomaly id', 'feature number', 'anomaly number', 'id'],
+    'distance': ['log dist', 'log distance', 'wheel count', 'ili wheel count', 'odometer', 'chainage', 'absolute distance'],
+    'odometer': ['log dist', 'log distance', 'wheel count', 'ili wheel count', 'odometer', 'chainage', 'absolute distance'],
+    'joint_number': ['j no', 'joint number', 'joint no', 'girth weld number', 'gw number'],
+    'relative_position': ['to u s w', 'distance to u s gw', 'distance to upstream weld', 'relative position', 'rel dist'],
+    'angle': ['o clock', 'clock', 'clock position', 'orientation', 'angle'],
+    'feature_type': ['event', 'event description', 'feature type', 'feature description', 'identification'],
+    'depth_percent': ['depth', 'metal loss depth', 'peak depth', 'depth percent', 'max depth'],
+    'length': ['length', 'axial length', 'feature length'],
+    'width': ['width', 'circumferential width', 'feature width'],
+    'wall_thickness': ['t', 'wt', 'wall thickness', 'nominal wall thickness', 'nwt'],
+    'weld_type': ['weld type', 'girth weld type', 'seam type'],
+    'elevation': ['elevation', 'altitude', 'height'],
+    'j_len': ['j len', 'joint length', 'jt length', 'pipe length'],
+}
+
+# Units we expect for each target. A header whose bracketed unit disagrees
+# is penalised so e.g. 'Length [in]' is not mistaken for 'J. len [ft]'.
+EXPECTED_UNITS = {
+    'distance': 'ft',
+    'odometer': 'ft',
+    'relative_position': 'ft',
+    'elevation': 'ft',
+    'j_len': 'ft',
+    'length': 'in',
+    'width': 'in',
+    'wall_thickness': 'in',
+    'depth_percent': '%',
+}
+
+UNIT_MISMATCH_PENALTY = 0.5
+
+_UNIT_PATTERN = re.compile(r'[\[\(]([^\]\)]*)[\]\)]')
+
+
+def split_unit(header):
+    """
+    Splits a raw header into (normalized name, normalized unit).
+    'Metal Loss Depth [%]' -> ('metal loss depth', '%')
+    """
+    header = str(header)
+    unit_match = _UNIT_PATTERN.search(header)
+    unit = None
+    if unit_match:
+        unit = unit_match.group(1).strip().lower().rstrip('.')
+        if unit in ('feet', 'foot'): unit = 'ft'
+        if unit in ('inch', 'inches'): unit = 'in'
+
+    name = _UNIT_PATTERN.sub(' ', header).lower()
+    name = re.sub(r'[^a-z0-9%]+', ' ', name)
+    name = re.sub(r'\s+', ' ', name).strip()
+    return name, unit
+
+
+def build_synonyms(format_file=FORMAT_FILE):
+    """
+    Returns {target: set of normalized synonyms}, seeded from BASE_SYNONYMS
+    and every vendor header recorded in format.json.
+    """
+    synonyms = {target: set(names) for target, names in BASE_SYNONYMS.items()}
+
+    if format_file and os.path.exists(format_file):
+        with open(format_file, 'r') as file:
+            formats = json.load(file)
+        for vendor_format in formats.values():
+            for target, header in vendor_format.items():
+                if header is None: continue
+                name, _ = split_unit(header)
+                synonyms.setdefault(target, set()).add(name)
+
+    return synonyms
+
+
+def _similarity(name, synonym):
+    """Blend of token overlap and character similarity, in [0, 1]."""
+    if name == synonym:
+        return 1.0
+    name_tokens = set(name.split())
+    syn_tokens = set(synonym.split())
+    if not name_tokens or not syn_tokens:
+        return 0.0
+    jaccard = len(name_tokens & syn_tokens) / len(name_tokens | syn_tokens)
+    ratio = SequenceMatcher(None, name, synonym).ratio()
+    return 0.5 * jaccard + 0.5 * ratio
+
+
+def match_headers(headers, targets, synonyms=None):
+    """
+    Maps target columns to header indices using only local rules.
+    Returns (mapping, confidence) where mapping is {target: index or None}
+    and confidence is {target: score in [0, 1]}.
+    Several targets may share a header (distance and odometer usually do).
+    """
+    if synonyms is None:
+        synonyms = build_synonyms()
+
+    parsed = [split_unit(h) for h in headers]
+    mapping = {}
+    confidence = {}
+
+    for target in targets:
+        target_synonyms = synonyms.get(target) or {target.replace('_', ' ')}
+        expected_unit = EXPECTED_UNITS.get(target)
+
+        best_idx, best_score = None, 0.0
+        for idx, (name, unit) in enumerate(parsed):
+            if not name: continue
+            score = max(_similarity(name, syn) for syn in target_synonyms)
+            if expected_unit and unit and unit != expected_unit:
+                score *= UNIT_MISMATCH_PENALTY
+            if score > best_score:
+                best_idx, best_score = idx, score
+
+        mapping[target] = best_idx
+        confidence[target] = round(best_score, 4)
+
+    return mapping, confidence
+
+
+def low_confidence_targets(confidence, threshold=DEFAULT_THRESHOLD):
+    """Targets that should be sent to the remote interpreter."""
+    return [t for t, score in confidence.items() if score < threshold]
@@ -1,110 +1,355 @@
-import boto3
-import json
-import os
-import pandas as pd
-from dotenv import load_dotenv
-
-# 1. Load Environment Variables
-load_dotenv()
-
-# 2. Extract AWS Credentials
-aws_access  = os.getenv("AWS_ACCESS_KEY_ID")
-aws_secret  = os.getenv("AWS_SECRET_ACCESS_KEY")
-aws_session = os.getenv("AWS_SESSION_TOKEN")  # Mandatory for Assumed Roles
-aws_region  = os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-
-# 3. Initialize Bedrock Runtime Client
-# We use the full "Triple" of credentials to ensure the signature is valid.
-try:
-    bedrock = boto3.client(
-        service_name='bedrock-runtime',
-        region_name=aws_region,
-        aws_access_key_id=aws_access,
-        aws_secret_access_key=aws_secret,
-        aws_session_token=aws_session
-    )
-except Exception as e:
-    print(f"❌ Failed to initialize Bedrock client: {e}")
-
-def get_column_mapping_bedrock(file_path, targets):
-    """
-    Reads CSV headers and uses Claude 3 to map them to target data needs.
-    """
-    # Load headers with latin1 encoding to handle special characters like °
-    try:
-        df = pd.read_csv(file_path, nrows=0, encoding='latin1')
-        actual_headers = list(df.columns)
-    except Exception as e:
-        print(f"❌ Error reading file headers: {e}")
-        return None
-
-    # Define the mapping prompt
-    prompt = f"""You are a pipeline integrity data expert. 
-    Map these ILI spreadsheet headers: {actual_headers} 
-    to these target categories: {targets}.
-    
-    Rules:
-    1. Return ONLY a valid JSON object.
-    2. Key = Target Name, Value = Integer Index (starting at 0).
-    3. Use null if a category is not found.
-    4. Match based on common industry synonyms (e.g., 'Orientation' -> 'clock_position')."""
-
-    # Claude 3 Sonnet Payload
-    payload = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 500,
-        "messages": [
-            {
-                "role": "user",
-                "content": [{"type": "text", "text": prompt}]
-            }
-        ]
-    }
-
-    try:
-        # Invoke the Model
-        response = bedrock.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps(payload)
-        )
-
-        # Parse Response
-        response_body = json.loads(response.get("body").read())
-        raw_text = response_body['content'][0]['text']
-        
-        # Strip potential markdown code blocks
-        clean_json = raw_text.replace('```json', '').replace('```', '').strip()
-        return json.loads(clean_json)
-
-    except Exception as e:
-        print(f"❌ Bedrock Invocation Error: {e}")
-        return None
-
-# --- EXECUTION ---
-if __name__ == "__main__":
-    target_needs = [
-        'feature_id',
-        'distance',
-        'odometer',
-        'joint_number',
-        'relative_position',
-        'angle',
-        'feature_type',
-        'depth_percent',
-        'length',
-        'width',
-        'wall_thickness',
-        'weld_type',
-        'elevation'
-    ]
-    csv_file = "test.csv" # Replace with your actual filename
-
-    mapping = get_column_mapping_bedrock(csv_file, target_needs)
-
-    if mapping:
-        print("\n✅ Successfully mapped headers:")
-        print(json.dumps(mapping, indent=4))
-    else:
-        print("\n❌ Failed to generate mapping.")
\ No newline at end of file
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from header_matcher import DEFAULT_THRESHOLD, match_headers, low_confidence_targets
+
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+# Files per Bedrock request and how many requests may be in flight at once.
+FILES_PER_REQUEST = 10
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = 60  # seconds
+
+# Reply size estimate. Files are grouped so a request never asks for more than
+# the model can return (Claude 3 Sonnet: 4096 output tokens).
+MAX_OUTPUT_TOKENS = 4096
+TOKENS_PER_TARGET = 40
+REPLY_OVERHEAD_TOKENS = 100
+
+# Errors worth retrying: throttling, timeouts and server-side failures.
+# Anything else (validation, access denied, an unparseable reply) fails at once.
+RETRYABLE_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException',
+                         'InternalServerException', 'ModelTimeoutException', 'ModelNotReadyException'}
+RETRYABLE_ERROR_TYPES = {'ReadTimeoutError', 'ConnectTimeoutError', 'EndpointConnectionError',
+                         'ConnectionClosedError'}
+
+_REQUEST_START = "<<<FILES>>>"
+_REQUEST_END = "<<<END FILES>>>"
+
+# --- BACKENDS ---
+# A backend turns a prompt into the model's raw text reply.
+# Anything with a `complete(prompt, max_tokens)` method can be plugged in.
+
+class BedrockBackend:
+    """
+    Claude on AWS Bedrock. Credentials are read and the boto3 client is built
+    on first use, then reused for every later request.
+    """
+    def __init__(self, model_id=MODEL_ID, timeout=REQUEST_TIMEOUT):
+        self.model_id = model_id
+        self.timeout = timeout
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            from botocore.config import Config
+            from dotenv import load_dotenv
+
+            # 1. Load Environment Variables
+            load_dotenv()
+
+            # 2. Initialize Bedrock Runtime Client
+            # We use the full "Triple" of credentials to ensure the signature is valid.
+            # Retries are handled by _complete_with_retries, not botocore.
+            self._client = boto3.client(
+                service_name='bedrock-runtime',
+                region_name=os.getenv("AWS_DEFAULT_REGION", "us-west-2"),
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                aws_session_token=os.getenv("AWS_SESSION_TOKEN"),  # Mandatory for Assumed Roles
+                config=Config(
+                    connect_timeout=self.timeout,
+                    read_timeout=self.timeout,
+                    retries={'max_attempts': 0}
+                )
+            )
+        return self._client
+
+    def complete(self, prompt, max_tokens=500):
+        # Claude 3 Sonnet Payload
+        payload = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": prompt}]
+                }
+            ]
+        }
+        response = self.client.invoke_model(
+            modelId=self.model_id,
+            contentType="application/json",
+            accept="application/json",
+            body=json.dumps(payload)
+        )
+        response_body = json.loads(response.get("body").read())
+        return response_body['content'][0]['text']
+
+
+class FakeBackend:
+    """
+    Offline stand-in for tests. Answers every request with the local header
+    matcher and records the prompts it was sent.
+    """
+    def __init__(self, fail_times=0):
+        self.prompts = []
+        self.max_tokens = []
+        self.fail_times = fail_times
+
+    def complete(self, prompt, max_tokens=500):
+        self.prompts.append(prompt)
+        self.max_tokens.append(max_tokens)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise TimeoutError("FakeBackend: simulated timeout")
+
+        files = _parse_request_block(prompt)
+        answer = {}
+        for key, spec in files.items():
+            mapping, _ = match_headers(spec['headers'], spec['targets'])
+            answer[key] = mapping
+        return "```json\n" + json.dumps(answer) + "\n```"
+
+
+_backend = None
+
+def get_backend():
+    """Returns the shared backend, creating a BedrockBackend on first use."""
+    global _backend
+    if _backend is None:
+        _backend = BedrockBackend()
+    return _backend
+
+def set_backend(backend):
+    """Swaps the shared backend (e.g. FakeBackend() in tests)."""
+    global _backend
+    _backend = backend
+
+# --- PROMPTS ---
+
+def _build_prompt(requests):
+    """
+    requests: {file_key: {'headers': [...], 'targets': [...]}}
+    """
+    block = json.dumps(requests, indent=1)
+    return f"""You are a pipeline integrity data expert.
+    Below is a JSON object describing one or more ILI spreadsheets. For each
+    file key, map its "headers" to its "targets" categories.
+
+    {_REQUEST_START}
+    {block}
+    {_REQUEST_END}
+
+    Rules:
+    1. Return ONLY a valid JSON object.
+    2. Top-level Key = File key, Value = object where Key = Target Name, Value = Integer Index (starting at 0).
+    3. Use null if a category is not found.
+    4. Match based on common industry synonyms (e.g., 'Orientation' -> 'clock_position')."""
+
+def _parse_request_block(prompt):
+    start = prompt.index(_REQUEST_START) + len(_REQUEST_START)
+    end = prompt.index(_REQUEST_END)
+    return json.loads(prompt[start:end])
+
+def _parse_reply(raw_text):
+    # Strip potential markdown code blocks
+    clean_json = raw_text.replace('```json', '').replace('```', '').strip()
+    return json.loads(clean_json)
+
+def _is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_TYPES:
+        return True
+    # botocore ClientError carries the service's error code and HTTP status
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code')
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return code in RETRYABLE_ERROR_CODES or status >= 500
+    return False
+
+def _complete_with_retries(backend, prompt, max_tokens, retries=MAX_RETRIES):
+    delay = 1.0
+    for attempt in range(1, retries + 1):
+        try:
+            return _parse_reply(backend.complete(prompt, max_tokens=max_tokens))
+        except Exception as e:
+            print(f"❌ Bedrock Invocation Error (attempt {attempt}/{retries}): {e}")
+            if attempt == retries or not _is_retryable(e):
+                return None
+            time.sleep(delay)
+            delay *= 2
+
+# --- HEADER INTERPRETATION ---
+
+def read_headers(file_path):
+    """
+    Returns the CSV header row, or None if the file cannot be read.
+    """
+    # Load headers with latin1 encoding to handle special characters like °
+    try:
+        df = pd.read_csv(file_path, nrows=0, encoding='latin1')
+        return list(df.columns)
+    except Exception as e:
+        print(f"❌ Error reading file headers: {e}")
+        return None
+
+def _reply_tokens(chunk):
+    # Roughly 40 tokens per target per file, plus slack for the JSON braces
+    tokens = REPLY_OVERHEAD_TOKENS + sum(TOKENS_PER_TARGET * len(spec['targets']) for spec in chunk.values())
+    return min(tokens, MAX_OUTPUT_TOKENS)
+
+def _plan_chunks(requests, files_per_request=FILES_PER_REQUEST):
+    """
+    Groups file keys into requests of at most files_per_request files whose
+    estimated reply fits in MAX_OUTPUT_TOKENS. A file too big on its own
+    still gets a request of its own.
+    """
+    chunks, current, tokens = [], [], REPLY_OVERHEAD_TOKENS
+    for key, spec in requests.items():
+        cost = TOKENS_PER_TARGET * len(spec['targets'])
+        if current and (len(current) >= files_per_request or tokens + cost > MAX_OUTPUT_TOKENS):
+            chunks.append(current)
+            current, tokens = [], REPLY_OVERHEAD_TOKENS
+        current.append(key)
+        tokens += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def interpret_headers_batch(requests, backend=None, files_per_request=FILES_PER_REQUEST,
+                            max_workers=MAX_CONCURRENT_REQUESTS, retries=MAX_RETRIES):
+    """
+    Interprets the headers of many files with as few requests as possible.
+    requests: {file_key: {'headers': [...], 'targets': [...]}}
+    Returns {file_key: mapping or None}.
+    """
+    backend = backend or get_backend()
+    if not requests:
+        return {}
+
+    chunks = _plan_chunks(requests, files_per_request)
+
+    def _run(chunk_keys):
+        chunk = {k: requests[k] for k in chunk_keys}
+        return chunk_keys, _complete_with_retries(backend, _build_prompt(chunk), _reply_tokens(chunk), retries)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        for chunk_keys, reply in pool.map(_run, chunks):
+            for k in chunk_keys:
+                results[k] = reply.get(k) if isinstance(reply, dict) else None
+    return results
+
+def get_column_mappings_bedrock(file_paths, targets, backend=None):
+    """
+    Reads the headers of every file and maps them all to `targets`.
+    Returns {file_path: mapping or None}.
+    """
+    requests = {}
+    results = {}
+    for fp in file_paths:
+        headers = read_headers(fp)
+        if headers is None:
+            results[fp] = None
+        else:
+            requests[fp] = {'headers': headers, 'targets': list(targets)}
+
+    results.update(interpret_headers_batch(requests, backend=backend))
+    return results
+
+def get_column_mapping_bedrock(file_path, targets, backend=None):
+    """
+    Reads CSV headers and uses Claude 3 to map them to target data needs.
+    """
+    return get_column_mappings_bedrock([file_path], targets, backend=backend)[file_path]
+
+def get_column_mappings(file_paths, targets, threshold=DEFAULT_THRESHOLD, backend=None):
+    """
+    Maps every file with the offline matcher first, then sends the targets
+    whose local confidence is below `threshold` to the backend in one batch.
+    Returns {file_path: (mapping, confidence)}; mapping values are header
+    indices like get_column_mapping_bedrock.
+    """
+    results = {}
+    requests = {}
+    for fp in file_paths:
+        headers = read_headers(fp)
+        if headers is None:
+            results[fp] = (None, {})
+            continue
+
+        mapping, confidence = match_headers(headers, targets)
+        results[fp] = (mapping, confidence)
+        unresolved = low_confidence_targets(confidence, threshold)
+        if unresolved:
+            requests[fp] = {'headers': headers, 'targets': unresolved}
+
+    if not requests:
+        return results
+
+    print(f"Local matcher unsure about {len(requests)} file(s), asking Bedrock...")
+    remote = interpret_headers_batch(requests, backend=backend)
+    for fp, spec in requests.items():
+        reply = remote.get(fp) or {}
+        mapping, confidence = results[fp]
+        for target in spec['targets']:
+            if target in reply:
+                mapping[target] = reply[target]
+                confidence[target] = None  # Resolved remotely
+            else:
+                # Bedrock failed or skipped it: a guess below threshold is not a mapping.
+                # The local score stays in `confidence` for callers to inspect.
+                mapping[target] = None
+    return results
+
+def get_column_mapping(file_path, targets, threshold=DEFAULT_THRESHOLD, backend=None):
+    """
+    Single-file version of get_column_mappings. Returns (mapping, confidence).
+    """
+    return get_column_mappings([file_path], targets, threshold, backend)[file_path]
+
+# --- EXECUTION ---
+if __name__ == "__main__":
+    import sys
+
+    target_needs = [
+        'feature_id',
+        'distance',
+        'odometer',
+        'joint_number',
+        'relative_position',
+        'angle',
+        'feature_type',
+        'depth_percent',
+        'length',
+        'width',
+        'wall_thickness',
+        'weld_type',
+        'elevation'
+    ]
+    # Pass one or more CSV files, or a directory of them
+    csv_files = sys.argv[1:] or ["test.csv"] # Replace with your actual filename
+    if len(csv_files) == 1 and os.path.isdir(csv_files[0]):
+        folder = csv_files[0]
+        csv_files = [os.path.join(folder, f) for f in sorted(os.listdir(folder))
+                     if re.search(r'\.csv$', f, re.IGNORECASE)]
+
+    results = get_column_mappings(csv_files, target_needs)
+
+    for csv_file, (mapping, confidence) in results.items():
+        if mapping:
+            print(f"\n✅ Successfully mapped headers for {csv_file}:")
+            print(json.dumps(mapping, indent=4))
+            print(json.dumps(confidence, indent=4))
+        else:
+            print(f"\n❌ Failed to generate mapping for {csv_file}.")
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+
+# Compact binary copy of the per-anomaly, per-year histories built by
+# mapping.py, so scores can be recomputed without re-aligning.
+#
+# Layout (one .npz, uncompressed so it loads with a single read):
+#   years        (Y,)   inspection years, ascending
+#   in_history   (n, Y) year is part of the anomaly's history
+#   present      (n, Y) anomaly was detected that year
+#   <value>      (n, Y) measurement at each detection, NaN otherwise
+# Row i is history[i], i.e. anomaly_no i + 1 of the results table.
+
+VALUE_KEYS = ('j_len', 'log_dist', 'elevation', 'rotation', 'depth', 'length', 'width', 'rpr')
+# log_dist keeps float64 like the distance columns; the rest are float32 measurements
+VALUE_DTYPES = {key: np.float32 for key in VALUE_KEYS}
+VALUE_DTYPES['log_dist'] = np.float64
+
+HISTORY_FILE = 'history.npz'
+
+
+def pack_history(history, years=None):
+    """
+    history: {i: {'year': [...], 'bool': [...], <value>: [values at detections]}}
+    Returns the packed dict described above.
+    """
+    n = len(history)
+    if years is None:
+        years = sorted({y for h in history.values() for y in h['year']})
+    years = np.asarray(years, dtype=np.int32)
+    column = {int(y): k for k, y in enumerate(years)}
+
+    in_history = np.zeros((n, len(years)), dtype=bool)
+    present = np.zeros((n, len(years)), dtype=bool)
+    values = {key: np.full((n, len(years)), np.nan, dtype=VALUE_DTYPES[key]) for key in VALUE_KEYS}
+
+    for i in range(n):
+        h = history[i]
+        cols = [column[int(y)] for y in h['year']]
+        in_history[i, cols] = True
+        seen = [c for c, flag in zip(cols, h['bool']) if flag]
+        present[i, seen] = True
+        # Value lists only hold detected years, in order
+        for key in VALUE_KEYS:
+            vals = h[key][:len(seen)]
+            values[key][i, seen[:len(vals)]] = vals
+
+    packed = {'years': years, 'in_history': in_history, 'present': present}
+    packed.update(values)
+    return packed
+
+
+def save_history(packed, path):
+    """Writes the packed arrays atomically."""
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **packed)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_history(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
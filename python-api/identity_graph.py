@@ -0,0 +1,203 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add the current directory to sys.path to ensure we can import the sibling file
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from mapping import align_years, get_rpr
+
+# Persistent anomaly identities across all inspections.
+# Every (year, row) is a node. Consecutive years are aligned and matched rows
+# are merged in a union-find; a second pass aligns year k with year k+2 to
+# bridge anomalies the middle inspection missed. Each connected component is
+# one physical anomaly with its full per-year history. Cost: at most two
+# alignments per year, and near-linear union-find work in the anomaly count.
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1 with union by size and path halving."""
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return ra
+
+    def roots(self):
+        return np.array([self.find(x) for x in range(len(self.parent))])
+
+
+def _one_to_one(mapping):
+    """Keeps the first baseline index for every matched current index."""
+    seen = set()
+    pairs = []
+    for prev_idx, curr_idx in sorted(mapping.items()):
+        if curr_idx in seen:
+            continue
+        seen.add(curr_idx)
+        pairs.append((prev_idx, curr_idx))
+    return pairs
+
+
+def _pair_mapping(frames, earlier, later, alignment, mappings, workers):
+    if mappings and (earlier, later) in mappings:
+        return mappings[(earlier, later)]
+    return align_years(frames[earlier], frames[later], method=alignment, workers=workers)
+
+
+def build_identity_graph(frames, alignment='dtw', bridge_gaps=True, mappings=None, workers=None):
+    """
+    frames: {year: formatted DataFrame}
+    mappings: optional precomputed {(earlier_year, later_year): mapping}
+    workers: passed to align_years
+    Returns (years, offsets, components) where components is a list of
+    sorted node-id arrays; node = offsets[year_index] + row.
+    """
+    years = sorted(frames)
+    sizes = [len(frames[y]) for y in years]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+    uf = UnionFind(int(offsets[-1]))
+    has_next = np.zeros(offsets[-1], dtype=bool)
+    has_prev = np.zeros(offsets[-1], dtype=bool)
+
+    # 1. Consecutive years
+    for k in range(len(years) - 1):
+        print(f"\n=== Identity graph: aligning {years[k]} -> {years[k + 1]} ===")
+        mapping = _pair_mapping(frames, years[k], years[k + 1], alignment, mappings, workers)
+        for prev_idx, curr_idx in _one_to_one(mapping):
+            a, b = offsets[k] + prev_idx, offsets[k + 1] + curr_idx
+            uf.union(a, b)
+            has_next[a] = True
+            has_prev[b] = True
+        print(f"Linked {int(has_prev[offsets[k + 1]:offsets[k + 2]].sum())} anomalies")
+
+    # 2. Bridge single missed inspections (year k -> k+2)
+    if bridge_gaps:
+        for k in range(len(years) - 2):
+            print(f"\n=== Identity graph: bridging {years[k]} -> {years[k + 2]} ===")
+            mapping = _pair_mapping(frames, years[k], years[k + 2], alignment, mappings, workers)
+            bridged = 0
+            for prev_idx, curr_idx in _one_to_one(mapping):
+                a, b = offsets[k] + prev_idx, offsets[k + 2] + curr_idx
+                if has_next[a] or has_prev[b]:
+                    continue
+                uf.union(a, b)
+                has_next[a] = True
+                has_prev[b] = True
+                bridged += 1
+            print(f"Bridged {bridged} anomalies missed in {years[k + 1]}")
+
+    # 3. Components, ordered by first appearance (year, then row)
+    roots = uf.roots()
+    order = np.lexsort((np.arange(len(roots)), roots))
+    breaks = np.flatnonzero(roots[order][1:] != roots[order][:-1]) + 1
+    components = np.split(order, breaks) if len(order) else []
+    components.sort(key=lambda nodes: nodes[0])
+    return years, offsets, components
+
+
+def _year_arrays(df):
+    """Column arrays used for history, with the same fallbacks as the baseline tracker."""
+    def col(name, default=0.0):
+        if name in df.columns:
+            return df[name].astype(float).to_numpy()
+        return np.full(len(df), default)
+
+    j_len = col('j_len') if 'j_len' in df.columns else col('length')
+    rpr = get_rpr(df)
+    arrays = {
+        'j_len': j_len,
+        'log_dist': col('distance'),
+        'elevation': col('elevation'),
+        'rotation': col('angle'),
+        'depth': col('depth_percent'),
+        'length': col('length'),
+        'width': col('width'),
+        'rpr': np.asarray(rpr, dtype=float),
+        'joint_number': col('joint_number', np.nan),
+        'internal': col('internal', np.nan),
+        'mod_b31g': col('mod_b31g', np.nan),
+        'feature_type': (df['feature_type'].astype(object).to_numpy() if 'feature_type' in df.columns
+                         else np.full(len(df), 'Unknown', dtype=object)),
+    }
+    # Plain Python values, like the row.get() lookups of the baseline tracker
+    return {key: values.tolist() for key, values in arrays.items()}
+
+
+def track_identities(frames, alignment='dtw', bridge_gaps=True, mappings=None, workers=None):
+    """
+    Builds one master row per identity with its full per-year history.
+    Returns (master_df, history) in the same shape as mapping.track_from_baseline.
+    """
+    years, offsets, components = build_identity_graph(frames, alignment, bridge_gaps, mappings, workers)
+    arrays = [_year_arrays(frames[y]) for y in years]
+    history_keys = ('j_len', 'log_dist', 'elevation', 'rotation', 'depth', 'length', 'width', 'rpr')
+
+    rows = []
+    history = {}
+    for ident, nodes in enumerate(components):
+        year_idx = np.searchsorted(offsets, nodes, side='right') - 1
+        row_idx = nodes - offsets[year_idx]
+        present = dict(zip(year_idx.tolist(), row_idx.tolist()))
+
+        h = {'year': [], 'bool': []}
+        for key in history_keys:
+            h[key] = []
+        # History runs from the first sighting to the latest inspection
+        for k in range(int(year_idx[0]), len(years)):
+            h['year'].append(years[k])
+            if k in present:
+                r = present[k]
+                h['bool'].append(True)
+                for key in history_keys:
+                    h[key].append(arrays[k][key][r])
+            else:
+                h['bool'].append(False)
+        history[ident] = h
+
+        first_k, first_r = int(year_idx[0]), int(row_idx[0])
+        last_k, last_r = int(year_idx[-1]), int(row_idx[-1])
+        first, last = arrays[first_k], arrays[last_k]
+        rows.append({
+            'anomaly_no': ident + 1,
+            'joint_no': first['joint_number'][first_r],
+            'start_distance': first['log_dist'][first_r],
+            'anomaly_type': first['feature_type'][first_r],
+            'first_year': years[first_k],
+            'j_len': last['j_len'][last_r],
+            'log_dist': last['log_dist'][last_r],
+            'elevation': last['elevation'][last_r],
+            'rotation': last['rotation'][last_r],
+            'ml_depth': last['depth'][last_r],
+            'ml_depth_lenth': first['length'][first_r],
+            'width': first['width'][first_r],
+            'internal': first['internal'][first_r],
+            'mod_b31g': first['mod_b31g'][first_r],
+        })
+
+    master_df = pd.DataFrame(rows)
+    for col in ['confidence', 'severity', 'persistence', 'growth_rate']:
+        master_df[col] = np.nan
+
+    counts = pd.Series([len(c) for c in components]).value_counts().sort_index()
+    print(f"\nIdentity graph: {len(components)} identities across {len(years)} inspections")
+    for n_years, n_ids in counts.items():
+        print(f"  - seen in {n_years} inspection(s): {n_ids}")
+    return master_df, history
@@ -11,11 +11,28 @@ sys.path.append(current_dir)
 
 # Import functions from your existing 'anomaly_score.py' file
 try:
-    from anomaly_score import calculate_confidence_score, calculate_severity_score, calculate_growth_rate
+    from anomaly_score import score_histories
 except ImportError:
     print("Error: Could not import 'anomaly_score.py'. Ensure it is in the same directory.")
     sys.exit(1)
 
+from clustering import CLUSTER_COLUMNS, cluster_histories
+from columnar import DEFAULT_FORMAT, columnar_path, freshest_source, load_frame, save_frame
+from forecast import FORECAST_COLUMNS, forecast_histories
+from history_cache import HISTORY_FILE, pack_history, save_history
+from metrics import RUN_METRICS_FILE, StageTimer, write_run_metrics
+from result_diff import KEY_COLUMN, anomaly_keys
+from results_store import publish
+from schema import FORMATTED_SCHEMA, ALIGNED_SCHEMA, apply_schema, to_export
+
+# Columns of the formatted files that alignment and scoring actually read.
+# Columnar inputs are projected to these so nothing else is decoded.
+MAPPING_COLUMNS = [
+    'feature_id', 'distance', 'joint_number', 'relative_position', 'angle',
+    'feature_type', 'depth_percent', 'length', 'width', 'j_len', 'elevation',
+    'mod_b31g', 'internal'
+]
+
 # --- ALIGNMENT LOGIC ---
 
 def get_alignment_signal(df):
@@ -50,51 +67,252 @@ def get_alignment_signal(df):
         angle_cos * 0.5
     ])
 
-def compute_custom_dtw(series_a, series_b, max_distance_threshold=2.0):
+DEFAULT_WINDOW = 500          # Fixed band half-width, in rows
+DEFAULT_BAND_TOLERANCE = 25.0  # Distance band half-width, in ft
+WELD_MATCH_TOLERANCE = 15.0    # Max gap between a matched weld and the local offset, in ft
+WELD_SEARCH_RANGE = 200.0      # Residual drift searched for around the linear fit, in ft
+WELD_VOTE_WINDOW = 10          # Neighbouring welds on each side that vote on the local offset
+WELD_OFFSET_BIN = 2.0          # Offset histogram resolution, in ft
+
+def estimate_girth_welds(df):
     """
-    Dynamic Time Warping with a window constraint and distance threshold.
-    Returns a mapping dict where keys are baseline indices and values are matched indices.
-    If no good match exists (distance > threshold), the key won't be in the dict.
+    Girth weld positions implied by the anomalies: for each joint, the median
+    of distance - relative_position (relative_position is measured from the
+    upstream weld). Returns a sorted array of weld distances.
+    """
+    if not {'distance', 'relative_position', 'joint_number'}.issubset(df.columns):
+        return np.array([])
+    welds = pd.DataFrame({
+        'joint': df['joint_number'],
+        'weld': df['distance'].astype(float) - df['relative_position'].astype(float)
+    }).dropna()
+    if welds.empty:
+        return np.array([])
+    return np.sort(welds.groupby('joint', observed=True)['weld'].median().to_numpy())
+
+def _weld_candidates(predicted, curr_welds, search):
+    """Flat (base weld, current weld) index pairs whose offset is within +/- search ft."""
+    lo = np.searchsorted(curr_welds, predicted - search, side='left')
+    hi = np.searchsorted(curr_welds, predicted + search, side='right')
+    counts = hi - lo
+    owner = np.repeat(np.arange(len(predicted)), counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, lo[owner] + steps
+
+def _local_offsets(owner, offset, n, search, window=WELD_VOTE_WINDOW, bin_width=WELD_OFFSET_BIN):
+    """
+    Per base weld, the offset most of its neighbours agree on. Every candidate
+    pair votes for its offset bin; votes are summed over +/- window welds and
+    the best bin wins. A weld pair at the wrong neighbour is off by one joint
+    length, and joint lengths vary, so only the true offset lines up across
+    the window.
+    """
+    n_bins = int(np.ceil(2 * search / bin_width)) + 1
+    bins = np.clip(np.round((offset + search) / bin_width).astype(int), 0, n_bins - 1)
+    votes = np.zeros((n + 1, n_bins + 2), dtype=np.int32)
+    np.add.at(votes, (owner + 1, bins + 1), 1)
+    # Tolerate an offset sitting on a bin edge
+    votes[:, 1:-1] += votes[:, :-2] + votes[:, 2:]
+    votes = np.cumsum(votes[:, 1:-1], axis=0)
+    rows = np.arange(n)
+    window_votes = votes[np.minimum(rows + window + 1, n)] - votes[np.maximum(rows - window, 0)]
+    best = np.argmax(window_votes, axis=1)
+    return best * bin_width - search, window_votes[rows, best] > 0
+
+def linear_distance_correction(baseline_df, current_df):
+    """
+    Maps the inspected range of the baseline onto that of the current
+    inspection. Same (base_points, curr_points) form as estimate_distance_correction.
+    """
+    base_dist = baseline_df['distance'].astype(float).dropna().to_numpy()
+    curr_dist = current_df['distance'].astype(float).dropna().to_numpy()
+    if len(base_dist) == 0 or len(curr_dist) == 0:
+        return np.array([0.0, 1.0]), np.array([0.0, 1.0])
+    b0, b1 = base_dist.min(), base_dist.max()
+    c0, c1 = curr_dist.min(), curr_dist.max()
+    scale = (c1 - c0) / (b1 - b0) if b1 > b0 else 1.0
+    base_points = np.array([b0, b1]) if b1 > b0 else np.array([b0, b0 + 1.0])
+    return base_points, c0 + (base_points - b0) * scale
+
+def estimate_distance_correction(baseline_df, current_df, weld_tolerance=WELD_MATCH_TOLERANCE,
+                                 search=WELD_SEARCH_RANGE):
+    """
+    Estimates odometer drift between two inspections from matched girth welds.
+    Returns (base_points, curr_points): use np.interp(d, base_points, curr_points)
+    to move a baseline distance onto the current inspection's distance axis.
+    """
+    # 1. Global linear fit from the inspected range (handles odometer scale)
+    base_points, curr_points = linear_distance_correction(baseline_df, current_df)
+    b0, b1 = base_points
+    c0 = curr_points[0]
+    scale = (curr_points[1] - c0) / (b1 - b0)
+
+    # 2. Refine with welds seen in both years (handles local slip). The
+    # residual drift of the linear fit can be as large as a joint, so welds are
+    # not matched to the nearest one: the offset is taken from the weld
+    # sequence around each weld, then each weld is matched near that offset.
+    base_welds = estimate_girth_welds(baseline_df)
+    curr_welds = estimate_girth_welds(current_df)
+    if len(base_welds) < 2 or len(curr_welds) < 2:
+        print("Too few girth welds to refine the distance correction, using the linear fit")
+        return base_points, curr_points
+
+    predicted = c0 + (base_welds - b0) * scale
+    owner, cand = _weld_candidates(predicted, curr_welds, search)
+    offset = curr_welds[cand] - predicted[owner]
+    local, supported = _local_offsets(owner, offset, len(base_welds), search)
+
+    # Nearest candidate to the local offset, within tolerance
+    gap = np.abs(offset - local[owner])
+    order = np.lexsort((gap, owner))
+    first = order[np.concatenate([[True], owner[order][1:] != owner[order][:-1]])] if len(order) else order
+    first = first[(gap[first] <= weld_tolerance) & supported[owner[first]]]
+    mb, mc = base_welds[owner[first]], curr_welds[cand[first]]
+
+    # Reject pairs whose offset jumps away from their neighbours' by about a
+    # joint length: those sit on the wrong weld
+    if len(mb) >= 3:
+        spacing = np.median(np.diff(curr_welds))
+        pair_offset = pd.Series(mc - (c0 + (mb - b0) * scale))
+        neighbours = pair_offset.rolling(2 * WELD_VOTE_WINDOW + 1, center=True, min_periods=1).median()
+        consistent = (np.abs(pair_offset - neighbours) < spacing / 2).to_numpy()
+        mb, mc = mb[consistent], mc[consistent]
+
+    # Keep the matched pairs strictly increasing so np.interp is well defined
+    if len(mb):
+        keep = np.concatenate([[True], (np.diff(mb) > 0) & (np.diff(mc) > 0)])
+        mb, mc = mb[keep], mc[keep]
+    if len(mb) < 2:
+        print(f"Matched {len(mb)} of {len(base_welds)} girth welds, using the linear distance correction")
+        return base_points, curr_points
+
+    # Extend to the ends of the line with the global scale
+    base_points = np.concatenate([[min(b0, mb[0]) - 1.0], mb, [max(b1, mb[-1]) + 1.0]])
+    curr_points = np.concatenate([[mc[0] - (mb[0] - base_points[0]) * scale], mc,
+                                  [mc[-1] + (base_points[-1] - mb[-1]) * scale]])
+    return base_points, curr_points
+
+def fill_distance(df):
+    dist = pd.Series(df['distance'].astype(float).to_numpy())
+    return dist.interpolate(limit_direction='both').fillna(0).to_numpy()
+
+def distance_band_rows(baseline_df, current_df, tolerance=DEFAULT_BAND_TOLERANCE):
+    """
+    Baseline distances are drift-corrected onto the current inspection, then
+    the current rows within +/- tolerance ft are found with searchsorted.
+    Returns (lo, hi): 0-based [lo, hi) current rows per baseline row.
+    """
+    base_points, curr_points = estimate_distance_correction(baseline_df, current_df)
+    corrected = np.interp(fill_distance(baseline_df), base_points, curr_points)
+    # searchsorted needs a sorted axis; formatted files are in distance order,
+    # the running max only guards against the odd out-of-order row
+    curr_axis = np.maximum.accumulate(fill_distance(current_df))
+
+    lo = np.searchsorted(curr_axis, corrected - tolerance, side='left')
+    hi = np.searchsorted(curr_axis, corrected + tolerance, side='right')
+    return lo, hi
+
+def compute_distance_band(baseline_df, current_df, tolerance=DEFAULT_BAND_TOLERANCE):
+    """
+    Per-row DTW search band from the distance axis (see distance_band_rows).
+    Returns (j_start, j_end) in the 1-based column indices compute_custom_dtw uses.
+    """
+    lo, hi = distance_band_rows(baseline_df, current_df, tolerance)
+    return connect_band(lo + 1, hi + 1, len(current_df))
+
+def fixed_window_band(n, m, window=DEFAULT_WINDOW):
+    """The original +/- window band in row-index units."""
+    i = np.arange(1, n + 1)
+    return np.maximum(1, i - window), np.minimum(m + 1, i + window)
+
+def connect_band(j_start, j_end, m):
+    """
+    Makes a band usable by DTW: monotone, non-empty, starting at column 1 on
+    the first row, ending at column m on the last row, and every row
+    overlapping the previous one so a path always exists.
+    """
+    j_start = np.maximum.accumulate(np.clip(j_start, 1, m))
+    j_end = np.maximum.accumulate(np.clip(j_end, 1, m + 1))
+    j_end = np.maximum(j_end, j_start + 1)
+    j_start[0] = 1
+    j_end[-1] = m + 1
+    j_start = np.minimum(j_start, np.concatenate([[1], j_end[:-1]]))
+    return j_start, j_end
+
+def dtw_path(series_a, series_b, band=None):
+    """
+    DTW over the cells inside band (default: the fixed +/- 500 row window).
+    Only those cells are evaluated and stored.
+    Returns (path, cells) where path is a list of (baseline_idx, current_idx).
     """
     n, m = len(series_a), len(series_b)
-    window = 500  # constrain search window
-    
-    cost_matrix = np.full((n + 1, m + 1), np.inf)
-    cost_matrix[0, 0] = 0
-    
+    if n == 0 or m == 0:
+        return [], 0
+    j_start, j_end = band if band is not None else fixed_window_band(n, m)
+
+    # Row i of the cost matrix holds columns [j_start[i-1], j_end[i-1]); row 0 is the origin
+    rows = [np.array([0.0])]
+    starts = [0]
+    cells = 0
     for i in range(1, n + 1):
-        j_start = max(1, i - window)
-        j_end = min(m + 1, i + window)
-        for j in range(j_start, j_end):
-            dist = np.linalg.norm(series_a[i-1] - series_b[j-1])
-            cost_matrix[i, j] = dist + min(cost_matrix[i-1, j], cost_matrix[i, j-1], cost_matrix[i-1, j-1])
-    
+        s, e = int(j_start[i-1]), int(j_end[i-1])
+        if e <= s:
+            rows.append(np.array([]))
+            starts.append(s)
+            continue
+        dist = np.linalg.norm(series_b[s-1:e-1] - series_a[i-1], axis=1)
+        cells += e - s
+
+        # Best of up (i-1, j) and diagonal (i-1, j-1) from the previous row
+        prev, prev_start = rows[-1], starts[-1]
+        cols = np.arange(s, e)
+        up = _row_lookup(prev, prev_start, cols)
+        diag = _row_lookup(prev, prev_start, cols - 1)
+        best_prev = np.minimum(up, diag)
+
+        # Left moves chain along the row: cost[j] = d[j] + min(best_prev[j], cost[j-1]).
+        # Unrolled, cost[j] = D[j] + min over k<=j of (best_prev[k] - D[k-1]), D = cumsum(d)
+        csum = np.cumsum(dist)
+        rows.append(csum + np.minimum.accumulate(best_prev - (csum - dist)))
+        starts.append(s)
+
+    def cost(i, j):
+        row, start = rows[i], starts[i]
+        k = j - start
+        return row[k] if 0 <= k < len(row) else np.inf
+
     # Backtrack to find path
     path = []
     i, j = n, m
     while i > 0 and j > 0:
-        # path.append((i - 1, j - 1))
         candidates = []
-        if i > 0 and j > 0: candidates.append((cost_matrix[i-1, j-1], 0)) 
-        if i > 1:           candidates.append((cost_matrix[i-1, j], 1))   
-        if j > 1:           candidates.append((cost_matrix[i, j-1], 2))   
-        
+        if i > 0 and j > 0: candidates.append((cost(i-1, j-1), 0))
+        if i > 1:           candidates.append((cost(i-1, j), 1))
+        if j > 1:           candidates.append((cost(i, j-1), 2))
+
         best_move = min(candidates, key=lambda x: x[0])[1]
-        print("best_move: " + str(best_move))
 
-        if best_move > 8:
-            continue 
-        
         path.append((i - 1, j - 1))
 
         if best_move == 0: i, j = i - 1, j - 1
         elif best_move == 1: i -= 1
         else: j -= 1
-    
-    path = path[::-1]
-    
-    # Filter path by distance threshold
-    # Only keep mappings where the actual feature distance is below threshold
+
+    return path[::-1], cells
+
+def _row_lookup(row, row_start, cols):
+    """Values of a banded cost row at absolute columns cols (inf outside the row)."""
+    k = cols - row_start
+    inside = (k >= 0) & (k < len(row))
+    out = np.full(len(cols), np.inf)
+    out[inside] = row[k[inside]]
+    return out
+
+def filter_path(path, series_a, series_b, max_distance_threshold=2.0):
+    """
+    Only keep mappings where the actual feature distance is below threshold.
+    Returns a mapping dict baseline_idx -> current_idx.
+    """
     filtered_mapping = {}
     for baseline_idx, current_idx in path:
         dist = np.linalg.norm(series_a[baseline_idx] - series_b[current_idx])
@@ -103,42 +321,130 @@ def compute_custom_dtw(series_a, series_b, max_distance_threshold=2.0):
             # (DTW can map multiple baseline points to same current point)
             if baseline_idx not in filtered_mapping:
                 filtered_mapping[baseline_idx] = current_idx
-    
     return filtered_mapping
 
-def process_directory(script_path: str):
-    # 1. Setup Paths
-    project_root = os.path.dirname(current_dir)
-    data_dir = os.path.join(project_root, "data", "formatted_files")
-    output_folder = os.path.join(project_root, "data", "Aligned_Results")
-    if not os.path.exists(output_folder): os.makedirs(output_folder)
+def compute_custom_dtw(series_a, series_b, max_distance_threshold=2.0, band=None):
+    """
+    Dynamic Time Warping with a window constraint and distance threshold.
+    Returns a mapping dict where keys are baseline indices and values are matched indices.
+    If no good match exists (distance > threshold), the key won't be in the dict.
+    band: optional (j_start, j_end) per baseline row, e.g. from compute_distance_band.
+    """
+    path, cells = dtw_path(series_a, series_b, band)
+    print(f"DTW evaluated {cells:,} cells ({len(series_a)} x {len(series_b)} full matrix)")
+    return filter_path(path, series_a, series_b, max_distance_threshold)
 
-    # 2. Collect Files
-    file_paths = glob.glob(os.path.join(data_dir, "*.csv"))
-    file_metadata = []
-    for fp in file_paths:
+ALIGNMENT_METHODS = ('dtw', 'banded', 'chunked', 'multires', 'nn')
+
+def align_years(baseline_df, current_df, baseline_signal=None, method='dtw',
+                max_distance_threshold=2.0, band_tolerance=DEFAULT_BAND_TOLERANCE, workers=None):
+    """
+    Aligns one inspection against the baseline with the chosen method.
+      dtw     fixed +/- 500 row window
+      banded  per-row window from drift-corrected log distance
+      chunked banded DTW over overlapping weld-anchored segments (chunked_alignment.py)
+      multires coarse-to-fine DTW (multires_alignment.py)
+      nn      indexed nearest-neighbour matching, one-to-one (nn_matcher.py)
+    workers: process count for the chunked segments (default: all cores).
+    Callers that are already one of several pool workers pass their share.
+    Returns dict baseline_idx -> current_idx.
+    """
+    if method == 'nn':
+        from nn_matcher import match_anomalies
+        return match_anomalies(baseline_df, current_df)
+
+    if method == 'chunked':
+        import tempfile
+        from chunked_alignment import align_chunked, load_mapping
+        with tempfile.TemporaryDirectory() as tmp:
+            out_path = os.path.join(tmp, 'mapping.bin')
+            align_chunked(baseline_df, current_df, out_path, workers=workers or os.cpu_count(),
+                          max_distance_threshold=max_distance_threshold, band_tolerance=band_tolerance)
+            return load_mapping(out_path)
+
+    if baseline_signal is None:
+        baseline_signal = get_alignment_signal(baseline_df)
+    curr_signal = get_alignment_signal(current_df)
+
+    if method == 'banded':
+        if 'distance' in baseline_df.columns and 'distance' in current_df.columns:
+            band = compute_distance_band(baseline_df, current_df, band_tolerance)
+            return compute_custom_dtw(baseline_signal, curr_signal, max_distance_threshold, band=band)
+        print("No distance column, falling back to fixed-window DTW")
+        method = 'dtw'
+
+    if method == 'dtw':
+        return compute_custom_dtw(baseline_signal, curr_signal, max_distance_threshold)
+
+    if method == 'multires':
+        from multires_alignment import compute_multires_dtw
+        return compute_multires_dtw(baseline_signal, curr_signal, max_distance_threshold)
+
+    raise ValueError(f"Unknown alignment method: {method} (expected one of {ALIGNMENT_METHODS})")
+
+def collect_formatted_files(data_dir):
+    """
+    Finds ILI_YYYY_formatted files in data_dir. When a year has both a CSV and
+    an up-to-date columnar copy, the columnar copy is used.
+    """
+    by_year = {}
+    for fp in glob.glob(os.path.join(data_dir, "ILI_*_formatted.*")):
         fname = os.path.basename(fp)
-        # Match pattern: ILI_YYYY_formatted.csv
-        m1 = re.search(r'ILI_(\d{4})_formatted\.csv', fname)
+        # Match pattern: ILI_YYYY_formatted.csv (or .parquet/.feather/.npz)
+        m1 = re.search(r'ILI_(\d{4})_formatted\.(csv|parquet|feather|npz)$', fname)
         if m1:
-            file_metadata.append({'path': fp, 'year': int(m1.group(1))})
-            print(f"Found file: {fname} (Year: {m1.group(1)})")
-            
-    if not file_metadata: 
-        print(f"Error: No formatted ILI files found in {data_dir}")
-        return "Error: No formatted ILI files found."
-    
-    sorted_files = sorted(file_metadata, key=lambda x: x['year'])
-    print(f"\nProcessing {len(sorted_files)} files in chronological order:")
-    for f in sorted_files:
-        print(f"  - {os.path.basename(f['path'])} ({f['year']})")
-    print()
-    
+            by_year.setdefault(int(m1.group(1)), []).append(fp)
+
+    file_metadata = []
+    for year, paths in by_year.items():
+        csv_paths = [p for p in paths if p.endswith('.csv')]
+        path = freshest_source(csv_paths[0]) if csv_paths else paths[0]
+        file_metadata.append({'path': path, 'year': year})
+        print(f"Found file: {os.path.basename(path)} (Year: {year})")
+    return file_metadata
+
+def alignment_pairs(years, tracking='baseline', bridge_gaps=True):
+    """
+    The (earlier_year, later_year) inspections a tracking mode aligns.
+    Every pair is independent, so they can be computed up front (e.g. in
+    parallel) and passed to process_directory as mappings.
+    """
+    years = sorted(years)
+    if tracking == 'graph':
+        pairs = list(zip(years, years[1:]))
+        if bridge_gaps:
+            pairs += list(zip(years, years[2:]))
+        return pairs
+    return [(years[0], year) for year in years[1:]]
+
+def get_rpr(df):
+    """
+    RPR (Remaining Pipe Strength) per row.
+    If mod_b31g exists, use it. Otherwise use (1 - depth) as a proxy.
+    """
+    if 'mod_b31g' in df.columns:
+        return df['mod_b31g']
+    depth_vals = df['depth_percent'].fillna(0) if 'depth_percent' in df.columns else np.zeros(len(df))
+    return 1.0 - depth_vals
+
+def load_formatted(path):
+    """Loads a formatted ILI file, reading only the columns mapping uses."""
+    return apply_schema(load_frame(path, columns=MAPPING_COLUMNS), FORMATTED_SCHEMA)
+
+def track_from_baseline(frames, sorted_files, alignment='dtw', mappings=None, workers=None):
+    """
+    Aligns every year against the baseline (oldest) inspection. Baseline
+    anomalies get a full history; unmatched anomalies in the most recent
+    file are added as new rows.
+    mappings: optional precomputed {(baseline_year, year): mapping}
+    workers: passed to align_years
+    Returns (master_df, history).
+    """
     # 3. Establish Baseline
     baseline_info = sorted_files[0]
     print(f"=== Baseline established: {baseline_info['year']} ===")
     print(f"Loading baseline from: {os.path.basename(baseline_info['path'])}\n")
-    baseline_df = pd.read_csv(baseline_info['path'])
+    baseline_df = frames[baseline_info['year']]
     print(f"Baseline contains {len(baseline_df)} anomalies")
     baseline_signal = get_alignment_signal(baseline_df)
     
@@ -173,28 +479,26 @@ def process_directory(script_path: str):
     
     for file_info in sorted_files:
         current_year = file_info['year']
-        current_df = pd.read_csv(file_info['path'])
+        current_df = frames[current_year]
         print(f"\n=== Processing Year {current_year} ===")
         print(f"File: {os.path.basename(file_info['path'])}")
         print(f"Anomalies in this file: {len(current_df)}")
 
         # Determine RPR (Remaining Pipe Strength)
-        # If mod_b31g exists, use it. Otherwise use (1 - depth) as a proxy.
-        if 'mod_b31g' in current_df.columns:
-            rpr_col = current_df['mod_b31g']
-        else:
-            depth_vals = current_df['depth_percent'].fillna(0) if 'depth_percent' in current_df.columns else np.zeros(len(current_df))
-            rpr_col = 1.0 - depth_vals
+        rpr_col = get_rpr(current_df)
 
         # Perform DTW Alignment
         if current_year == baseline_info['year']:
             mapping = {i: i for i in range(len(master_df))}
             print(f"Baseline year - direct 1:1 mapping ({len(mapping)} mappings)")
+        elif mappings and (baseline_info['year'], current_year) in mappings:
+            mapping = mappings[(baseline_info['year'], current_year)]
+            print(f"Precomputed alignment: {len(mapping)} matches found out of {len(master_df)} baseline anomalies")
         else:
-            curr_signal = get_alignment_signal(current_df)
             # Returns dict: baseline_idx -> current_idx (only for good matches)
-            mapping = compute_custom_dtw(baseline_signal, curr_signal, max_distance_threshold=2.0)
-            print(f"DTW alignment complete: {len(mapping)} matches found out of {len(master_df)} baseline anomalies")
+            mapping = align_years(baseline_df, current_df, baseline_signal, method=alignment,
+                                  max_distance_threshold=2.0, workers=workers)
+            print(f"{alignment.upper()} alignment complete: {len(mapping)} matches found out of {len(master_df)} baseline anomalies")
         
         # Track which indices in current file have been mapped
         mapped_indices_per_year[current_year] = set(mapping.values())
@@ -237,7 +541,7 @@ def process_directory(script_path: str):
     # 4b. Add new anomalies from the most recent file that weren't mapped
     most_recent_file = sorted_files[-1]
     most_recent_year = most_recent_file['year']
-    most_recent_df = pd.read_csv(most_recent_file['path'])
+    most_recent_df = frames[most_recent_year]
     mapped_in_recent = mapped_indices_per_year[most_recent_year]
     
     print(f"\n=== Checking for new anomalies in {most_recent_year} ===")
@@ -250,18 +554,15 @@ def process_directory(script_path: str):
     
     if new_anomalies:
         # Determine RPR for most recent file
-        if 'mod_b31g' in most_recent_df.columns:
-            rpr_col = most_recent_df['mod_b31g']
-        else:
-            depth_vals = most_recent_df['depth_percent'].fillna(0) if 'depth_percent' in most_recent_df.columns else np.zeros(len(most_recent_df))
-            rpr_col = 1.0 - depth_vals
+        rpr_col = get_rpr(most_recent_df)
         
+        new_rows = []
         for idx in new_anomalies:
             row = most_recent_df.iloc[idx]
             
             # Create new row for master_df
             new_row = {
-                'anomaly_no': len(master_df) + 1,
+                'anomaly_no': len(master_df) + len(new_rows) + 1,
                 'joint_no': row.get('joint_number', np.nan),
                 'start_distance': row.get('distance', np.nan),
                 'anomaly_type': row.get('feature_type', 'Unknown'),
@@ -276,8 +577,7 @@ def process_directory(script_path: str):
                 'mod_b31g': rpr_col[idx] if isinstance(rpr_col, (pd.Series, np.ndarray)) else np.nan,
             }
             
-            # Add to master_df
-            master_df = pd.concat([master_df, pd.DataFrame([new_row])], ignore_index=True)
+            new_rows.append(new_row)
             
             # Create history entry for this new anomaly
             new_history_idx = len(history)
@@ -294,46 +594,66 @@ def process_directory(script_path: str):
                 'rpr': [rpr_col[idx] if isinstance(rpr_col, (pd.Series, np.ndarray)) else 0]
             }
 
-    # 5. Calculate Scores (Using imported functions)
-    for i in range(len(master_df)):
-        h = history[i]
-        if not h['year']: continue
-        
-        # Confidence Score
-        curr_depth = h['depth'][-1] if h['depth'] else 0
-        conf = calculate_confidence_score(
-            h['j_len'], h['log_dist'], h['elevation'], h['rotation'],
-            curr_depth, h['bool']
-        )
-        master_df.at[i, 'confidence'] = round(conf, 4)
-        
-        # Severity Score
-        sev = calculate_severity_score(h['rpr'], h['year'])
-        master_df.at[i, 'severity'] = round(sev, 4)
-        
-        # Persistence (difference between first and last year anomaly appeared)
-        years_with_anomaly = [h['year'][j] for j in range(len(h['year'])) if h['bool'][j]]
-        if years_with_anomaly:
-            persistence = years_with_anomaly[-1] - years_with_anomaly[0]
-        else:
-            persistence = 0
-        master_df.at[i, 'persistence'] = persistence
-        
-        # Growth Rate
-        if len(h['year']) >= 2:
-            gr = calculate_growth_rate(
-                h['depth'][0], h['depth'][-1],
-                h['length'][0], h['length'][-1],
-                h['width'][0], h['width'][-1],
-                h['year'][-1] - h['year'][0]
-            )
-            # Clip negative growth to 0 (assuming defects don't heal)
-            if gr < 0: gr = 0.0
-            master_df.at[i, 'growth_rate'] = round(gr, 6)
-        else:
-            master_df.at[i, 'growth_rate'] = 0.0
+        # Add to master_df in one go (row-by-row concat is quadratic)
+        master_df = pd.concat([master_df, pd.DataFrame(new_rows)], ignore_index=True)
 
-        master_df.at[i, 'viewed'] = "Yes"
+    return master_df, history
+
+def process_directory(script_path: str, data_dir=None, output_folder=None, columnar_format=DEFAULT_FORMAT,
+                      publish_store=True, alignment='dtw', tracking='baseline', mappings=None, workers=None):
+    # 1. Setup Paths
+    project_root = os.path.dirname(current_dir)
+    if data_dir is None:
+        data_dir = os.path.join(project_root, "data", "formatted_files")
+    if output_folder is None:
+        output_folder = os.path.join(project_root, "data", "Aligned_Results")
+    if not os.path.exists(output_folder): os.makedirs(output_folder)
+    timer = StageTimer()
+
+    # 2. Collect Files
+    file_metadata = collect_formatted_files(data_dir)
+            
+    if not file_metadata: 
+        print(f"Error: No formatted ILI files found in {data_dir}")
+        return "Error: No formatted ILI files found."
+    
+    sorted_files = sorted(file_metadata, key=lambda x: x['year'])
+    print(f"\nProcessing {len(sorted_files)} files in chronological order:")
+    for f in sorted_files:
+        print(f"  - {os.path.basename(f['path'])} ({f['year']})")
+    print()
+    
+    # Each file is parsed once and reused for the baseline, alignment and new-anomaly passes
+    frames = {f['year']: load_formatted(f['path']) for f in sorted_files}
+    timer.lap('load')
+
+    # 3-4. Build the master table and per-anomaly history
+    if tracking == 'graph':
+        # One row per identity, including anomalies first seen in intermediate years
+        from identity_graph import track_identities
+        master_df, history = track_identities(frames, alignment=alignment, mappings=mappings, workers=workers)
+    else:
+        master_df, history = track_from_baseline(frames, sorted_files, alignment, mappings, workers)
+    timer.lap('align')
+
+    # 5. Calculate Scores, vectorized over the packed histories
+    packed = pack_history(history)
+    save_history(packed, os.path.join(output_folder, HISTORY_FILE))
+    for col, values in score_histories(packed).items():
+        master_df[col] = values
+    master_df['viewed'] = True
+
+    # Stable key from each anomaly's first detection, for diffs between runs
+    master_df[KEY_COLUMN] = anomaly_keys(packed)
+
+    # 5a. Remaining-life forecast from the same histories
+    for col, values in forecast_histories(packed).items():
+        master_df[col] = values
+
+    # 5b. Group anomalies within interaction distance of each other, per inspection year
+    for col, values in cluster_histories(packed).items():
+        master_df[col] = values
+    timer.lap('score')
 
     # 6. Save Final Result
     final_path = os.path.join(output_folder, "Master_Alignment_Final.csv")
@@ -358,15 +678,30 @@ def process_directory(script_path: str):
                   'j_len', 'log_dist', 'elevation', 'rotation']
     
     # Append any extra green columns if they exist
-    extra_cols = ['internal', 'ml_depth', 'ml_depth_lenth', 'width', 'mod_b31g']
+    extra_cols = ['internal', 'ml_depth', 'ml_depth_lenth', 'width', 'mod_b31g', KEY_COLUMN] + CLUSTER_COLUMNS + FORECAST_COLUMNS
     for c in extra_cols:
         if c in master_df.columns: final_cols.append(c)
     
     # Ensure anomaly_no is properly formatted (convert any strings to sequential numbers)
     master_df['anomaly_no'] = range(1, len(master_df) + 1)
+    apply_schema(master_df, ALIGNED_SCHEMA)
     
     master_df = master_df[final_cols]
-    master_df.to_csv(final_path, index=False)
+    to_export(master_df).to_csv(final_path, index=False)
+
+    # Typed copy for the API so it never has to re-parse the CSV
+    # final_cols repeats a few names; keep the first of each for the typed copies
+    typed_df = master_df.loc[:, ~master_df.columns.duplicated()]
+    if columnar_format:
+        save_frame(typed_df, columnar_path(final_path, columnar_format))
+
+    # Memory-mapped version the API workers share; swapped in atomically
+    if publish_store:
+        version = publish(typed_df, os.path.join(output_folder, "store"))
+        print(f"Published results store version: {version}")
+    timer.lap('save')
+    write_run_metrics(os.path.join(output_folder, RUN_METRICS_FILE), timer,
+                      rows=sum(len(df) for df in frames.values()))
     
     print(f"\n{'='*60}")
     print(f"SUCCESS! Alignment complete.")
@@ -379,4 +714,18 @@ def process_directory(script_path: str):
 
 
 if __name__ == "__main__":
-    print(process_directory(__file__))
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Align ILI inspections and score anomalies")
+    parser.add_argument('--alignment', choices=ALIGNMENT_METHODS, default='dtw',
+                        help="dtw: fixed row window, banded: window from drift-corrected distance, "
+                             "chunked: banded over overlapping segments for very long lines, "
+                             "multires: coarse-to-fine DTW, nn: one-to-one nearest-neighbour matching")
+    parser.add_argument('--tracking', choices=('baseline', 'graph'), default='baseline',
+                        help="baseline: anomalies keyed by the first inspection, "
+                             "graph: identities linked across every pair of consecutive inspections")
+    parser.add_argument('--data-dir', help="folder with ILI_YYYY_formatted files (default: data/formatted_files)")
+    parser.add_argument('--output-folder', help="results folder (default: data/Aligned_Results)")
+    parser.add_argument('--workers', type=int, help="processes for chunked alignment (default: all cores)")
+    args = parser.parse_args()
+    print(process_directory(__file__, data_dir=args.data_dir, output_folder=args.output_folder,
+                            alignment=args.alignment, tracking=args.tracking, workers=args.workers))
\ No newline at end of file
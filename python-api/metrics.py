@@ -0,0 +1,232 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Minimal Prometheus-style metrics. Every metric is pre-aggregated in memory
+# (counters, gauges, fixed-bucket histograms keyed by label values), so
+# recording costs one lock and a few additions and can stay on permanently.
+# render() produces the text exposition format served by /api/metrics.
+# Values are per process: with several gunicorn workers each worker reports
+# its own series.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+RUN_METRICS_FILE = 'run_metrics.json'
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_label_text(self.labelnames, key)} {_number(value)}' for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback  # computes the unlabelled value at scrape time
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def lines(self):
+        if self.callback is not None:
+            return [f'{self.name} {_number(self.callback())}']
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_label_text(self.labelnames, key)} {_number(value)}' for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def lines(self):
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._values.items())
+        out = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = _label_text(self.labelnames, key, [('le', _number(bound))])
+                out.append(f'{self.name}_bucket{le} {cumulative}')
+            labels = _label_text(self.labelnames, key)
+            out.append(f'{self.name}_sum{labels} {_number(total)}')
+            out.append(f'{self.name}_count{labels} {count}')
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.lines())
+        return '\n'.join(lines) + '\n'
+
+
+def process_rss_bytes():
+    """Current resident set size (Linux /proc), falling back to the peak RSS."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource is None:
+            return 0
+        # ru_maxrss is KiB on Linux and bytes on macOS; this path is mostly macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'ili_http_request_duration_seconds', 'API request latency by route', ['route', 'method']))
+REQUESTS = REGISTRY.register(Counter(
+    'ili_http_requests_total', 'API requests by route and status', ['route', 'method', 'status']))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'ili_http_requests_in_flight', 'Requests currently being handled', ['route']))
+ANALYSIS_DURATION = REGISTRY.register(Histogram(
+    'ili_pipeline_duration_seconds', 'Total mapping pipeline duration'))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    'ili_pipeline_stage_duration_seconds', 'Mapping pipeline duration by stage', ['stage']))
+ROWS_PROCESSED = REGISTRY.register(Counter(
+    'ili_pipeline_rows_total', 'Inspection rows processed by the mapping pipeline'))
+ROWS_PER_SECOND = REGISTRY.register(Gauge(
+    'ili_pipeline_rows_per_second', 'Rows per second of the last pipeline run'))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'ili_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result']))
+PROCESS_RSS = REGISTRY.register(Gauge(
+    'ili_process_resident_memory_bytes', 'Resident memory of this process', callback=process_rss_bytes))
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+class StageTimer:
+    """Wall-clock time per named stage of one pipeline run; lap() closes the current stage."""
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages = {}
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def write_run_metrics(path, timer, rows):
+    """
+    Sidecar written by mapping.py, which runs in its own process, so the
+    API can fold the run into its metrics.
+    """
+    duration = timer.elapsed()
+    with open(path, 'w') as f:
+        json.dump({'duration': duration, 'stages': timer.stages, 'rows': rows,
+                   'cache': CACHE_REQUESTS.snapshot()}, f)
+
+
+def record_run_metrics(path):
+    """Folds a run_metrics.json sidecar into this process's metrics. Returns it, or None."""
+    try:
+        with open(path) as f:
+            run = json.load(f)
+    except (OSError, ValueError):
+        return None
+    ANALYSIS_DURATION.observe(run['duration'])
+    for stage, seconds in run['stages'].items():
+        STAGE_DURATION.observe(seconds, stage=stage)
+    ROWS_PROCESSED.inc(run['rows'])
+    if run['duration'] > 0:
+        ROWS_PER_SECOND.set(round(run['rows'] / run['duration'], 1))
+    for (cache, result), count in run.get('cache', []):
+        CACHE_REQUESTS.inc(count, cache=cache, result=result)
+    return run
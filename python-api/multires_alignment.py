@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import numpy as np
+
+# Add the current directory to sys.path to ensure we can import the sibling file
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from mapping import connect_band, dtw_path, filter_path
+
+# Coarse-to-fine DTW. The alignment signal is averaged over blocks of rows,
+# DTW is solved at the coarsest level, and each finer level only evaluates
+# cells within `radius` of the projected coarse path. The number of cells
+# evaluated grows linearly with the number of anomalies.
+
+DEFAULT_FACTOR = 2     # rows averaged per block at each level
+DEFAULT_RADIUS = 4     # extra fine rows/columns kept around the projected path
+MIN_LEVEL_SIZE = 200   # solve exactly once a series is this short
+
+
+def coarsen(signal, factor=DEFAULT_FACTOR):
+    """Averages consecutive blocks of `factor` rows (the last block may be shorter)."""
+    n = len(signal)
+    blocks = -(-n // factor)
+    padded = np.full((blocks * factor, signal.shape[1]), np.nan)
+    padded[:n] = signal
+    return np.nanmean(padded.reshape(blocks, factor, -1), axis=1)
+
+
+def project_band(coarse_path, n, m, factor=DEFAULT_FACTOR, radius=DEFAULT_RADIUS):
+    """
+    Turns a coarse path into a (j_start, j_end) band for the n x m fine problem.
+    Each coarse cell covers a factor x factor block; the band is widened by
+    `radius` fine cells in both directions.
+    """
+    coarse_path = np.asarray(coarse_path)
+    n_coarse = -(-n // factor)
+    lo = np.full(n_coarse, np.iinfo(np.int64).max)
+    hi = np.full(n_coarse, -1)
+    np.minimum.at(lo, coarse_path[:, 0], coarse_path[:, 1])
+    np.maximum.at(hi, coarse_path[:, 0], coarse_path[:, 1])
+
+    # Widen across neighbouring coarse rows
+    row_radius = -(-radius // factor)
+    lo_wide, hi_wide = lo.copy(), hi.copy()
+    for shift in range(1, row_radius + 1):
+        lo_wide[shift:] = np.minimum(lo_wide[shift:], lo[:-shift])
+        lo_wide[:-shift] = np.minimum(lo_wide[:-shift], lo[shift:])
+        hi_wide[shift:] = np.maximum(hi_wide[shift:], hi[:-shift])
+        hi_wide[:-shift] = np.maximum(hi_wide[:-shift], hi[shift:])
+
+    rows = np.arange(n) // factor
+    j_lo = lo_wide[rows] * factor - radius        # 0-based first column
+    j_hi = (hi_wide[rows] + 1) * factor + radius  # 0-based end column (exclusive)
+    return connect_band(j_lo + 1, j_hi + 1, m)
+
+
+def multires_path(series_a, series_b, factor=DEFAULT_FACTOR, radius=DEFAULT_RADIUS,
+                  min_size=MIN_LEVEL_SIZE):
+    """
+    Returns (path, cells) like mapping.dtw_path, where cells is the total
+    number of cells evaluated across all levels.
+    """
+    n, m = len(series_a), len(series_b)
+    if n <= min_size or m <= min_size:
+        full_band = (np.ones(n, dtype=int), np.full(n, m + 1))
+        return dtw_path(series_a, series_b, full_band)
+
+    coarse_path, coarse_cells = multires_path(coarsen(series_a, factor), coarsen(series_b, factor),
+                                              factor, radius, min_size)
+    band = project_band(coarse_path, n, m, factor, radius)
+    path, cells = dtw_path(series_a, series_b, band)
+    return path, cells + coarse_cells
+
+
+def compute_multires_dtw(series_a, series_b, max_distance_threshold=2.0,
+                         factor=DEFAULT_FACTOR, radius=DEFAULT_RADIUS):
+    """
+    Drop-in alternative to compute_custom_dtw. Returns baseline_idx -> current_idx.
+    """
+    path, cells = multires_path(series_a, series_b, factor, radius)
+    print(f"Multi-resolution DTW evaluated {cells:,} cells ({len(series_a)} x {len(series_b)} full matrix)")
+    return filter_path(path, series_a, series_b, max_distance_threshold)
+
+
+def path_agreement(mapping, reference):
+    """Fraction of reference baseline indices mapped to the same current index."""
+    if not reference:
+        return 1.0
+    same = sum(1 for k, v in reference.items() if mapping.get(k) == v)
+    return same / len(reference)
+
+
+if __name__ == "__main__":
+    import argparse
+    from mapping import get_alignment_signal, load_formatted
+
+    parser = argparse.ArgumentParser(description="Compare multi-resolution DTW with exact DTW")
+    parser.add_argument('baseline', help="baseline ILI_YYYY_formatted file")
+    parser.add_argument('current', help="later ILI_YYYY_formatted file")
+    parser.add_argument('--radius', type=int, default=DEFAULT_RADIUS)
+    args = parser.parse_args()
+
+    series_a = get_alignment_signal(load_formatted(args.baseline))
+    series_b = get_alignment_signal(load_formatted(args.current))
+    n, m = len(series_a), len(series_b)
+
+    start = time.time()
+    exact_path, exact_cells = dtw_path(series_a, series_b, (np.ones(n, dtype=int), np.full(n, m + 1)))
+    exact = filter_path(exact_path, series_a, series_b)
+    exact_time = time.time() - start
+
+    start = time.time()
+    fast_path, fast_cells = multires_path(series_a, series_b, radius=args.radius)
+    fast = filter_path(fast_path, series_a, series_b)
+    fast_time = time.time() - start
+
+    print(f"Exact DTW:            {exact_cells:>12,} cells  {exact_time:8.2f}s  {len(exact)} matches")
+    print(f"Multi-resolution DTW: {fast_cells:>12,} cells  {fast_time:8.2f}s  {len(fast)} matches")
+    print(f"Path agreement with exact DTW: {path_agreement(fast, exact):.2%}")
@@ -0,0 +1,153 @@
+import os
+import sys
+import numpy as np
+
+# Add the current directory to sys.path to ensure we can import the sibling file
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from mapping import estimate_distance_correction, fill_distance, linear_distance_correction
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Indexed nearest-neighbour matcher, an alternative to DTW.
+# Current-year anomalies are indexed by drift-corrected distance (a sorted
+# array + searchsorted), every baseline anomaly gets its candidates within
+# tolerance in one vectorized pass, and a one-to-one assignment is solved
+# per local block. Unlike DTW, no current anomaly is matched twice.
+# Runs in O(n log n) plus the number of candidate pairs.
+
+DEFAULT_DISTANCE_TOLERANCE = 5.0   # ft, after drift correction
+DEFAULT_ANGLE_TOLERANCE = 30.0     # degrees (one clock hour)
+DEFAULT_REL_POS_TOLERANCE = 3.0    # ft from the upstream weld
+MAX_EXACT_BLOCK = 300              # Hungarian only on blocks up to this size
+MIN_COVERAGE = 0.5                 # Below this share of the smaller year with a candidate, the correction failed
+FALLBACK_DISTANCE_TOLERANCE = 60.0  # ft around the linear drift fit, whose error can reach a joint length
+
+
+def _column(df, name):
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    return df[name].astype(float).to_numpy()
+
+
+def _pairs_within(baseline_df, current_df, base_d, curr_d, distance_tol, angle_tol, rel_pos_tol):
+    # Sorted index over the current year
+    order = np.argsort(curr_d, kind='stable')
+    sorted_d = curr_d[order]
+    lo = np.searchsorted(sorted_d, base_d - distance_tol, side='left')
+    hi = np.searchsorted(sorted_d, base_d + distance_tol, side='right')
+    counts = hi - lo
+
+    # Expand the ranges into flat pair arrays
+    base_idx = np.repeat(np.arange(len(baseline_df)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    curr_idx = order[np.repeat(lo, counts) + offsets]
+
+    dd = (base_d[base_idx] - curr_d[curr_idx]) / distance_tol
+
+    angle_diff = np.abs(_column(baseline_df, 'angle')[base_idx] - _column(current_df, 'angle')[curr_idx]) % 360
+    angle_diff = np.nan_to_num(np.minimum(angle_diff, 360 - angle_diff)) / angle_tol
+
+    rel_diff = np.abs(_column(baseline_df, 'relative_position')[base_idx]
+                      - _column(current_df, 'relative_position')[curr_idx])
+    rel_diff = np.nan_to_num(rel_diff) / rel_pos_tol
+
+    keep = (angle_diff <= 1.0) & (rel_diff <= 1.0)
+    cost = dd ** 2 + angle_diff ** 2 + rel_diff ** 2
+    return base_idx[keep], curr_idx[keep], cost[keep]
+
+
+def candidate_pairs(baseline_df, current_df, distance_tol=DEFAULT_DISTANCE_TOLERANCE,
+                    angle_tol=DEFAULT_ANGLE_TOLERANCE, rel_pos_tol=DEFAULT_REL_POS_TOLERANCE):
+    """
+    All (baseline_idx, current_idx, cost) pairs within tolerance.
+    cost is the squared tolerance-normalised distance in
+    (corrected distance, clock angle, relative_position) space.
+
+    If the weld-based drift correction is off, most anomalies find no
+    candidate at all. When fewer than MIN_COVERAGE of the smaller year get
+    one, the search is repeated on the linear drift fit with a tolerance wide
+    enough for its error; angle and relative position keep that selective.
+    """
+    base_points, curr_points = estimate_distance_correction(baseline_df, current_df)
+    base_d = np.interp(fill_distance(baseline_df), base_points, curr_points)
+    curr_d = fill_distance(current_df)
+    pairs = _pairs_within(baseline_df, current_df, base_d, curr_d, distance_tol, angle_tol, rel_pos_tol)
+
+    expected = min(len(baseline_df), len(current_df))
+    covered = len(np.unique(pairs[0]))
+    fallback_tol = max(distance_tol, FALLBACK_DISTANCE_TOLERANCE)
+    if covered >= MIN_COVERAGE * expected or fallback_tol == distance_tol:
+        return pairs
+
+    print(f"NN matcher: only {covered} of {expected} anomalies have a candidate, "
+          f"retrying on the linear drift fit within {fallback_tol:g} ft")
+    base_points, curr_points = linear_distance_correction(baseline_df, current_df)
+    base_d = np.interp(fill_distance(baseline_df), base_points, curr_points)
+    widened = _pairs_within(baseline_df, current_df, base_d, curr_d, fallback_tol, angle_tol, rel_pos_tol)
+    return widened if len(np.unique(widened[0])) > covered else pairs
+
+
+def _blocks(base_idx, curr_idx):
+    """
+    Splits pairs into independent blocks. Pairs are sorted by baseline index;
+    a new block starts where every later current index is above every
+    earlier one, so no current anomaly is shared between blocks.
+    """
+    if len(base_idx) == 0:
+        return []
+    order = np.lexsort((curr_idx, base_idx))
+    b, c = base_idx[order], curr_idx[order]
+    max_before = np.maximum.accumulate(c)
+    min_after = np.minimum.accumulate(c[::-1])[::-1]
+    breaks = np.flatnonzero((b[1:] != b[:-1]) & (min_after[1:] > max_before[:-1])) + 1
+    return np.split(order, breaks)
+
+
+def _assign_greedy(b, c, cost):
+    taken_b, taken_c = set(), set()
+    result = {}
+    for k in np.argsort(cost, kind='stable'):
+        bi, ci = int(b[k]), int(c[k])
+        if bi in taken_b or ci in taken_c:
+            continue
+        taken_b.add(bi)
+        taken_c.add(ci)
+        result[bi] = ci
+    return result
+
+
+def _assign_exact(b, c, cost):
+    rows, row_pos = np.unique(b, return_inverse=True)
+    cols, col_pos = np.unique(c, return_inverse=True)
+    big = cost.max() + 1e6
+    matrix = np.full((len(rows), len(cols)), big)
+    matrix[row_pos, col_pos] = cost
+    r, k = linear_sum_assignment(matrix)
+    valid = matrix[r, k] < big
+    return dict(zip(rows[r[valid]].tolist(), cols[k[valid]].tolist()))
+
+
+def match_anomalies(baseline_df, current_df, distance_tol=DEFAULT_DISTANCE_TOLERANCE,
+                    angle_tol=DEFAULT_ANGLE_TOLERANCE, rel_pos_tol=DEFAULT_REL_POS_TOLERANCE):
+    """
+    One-to-one matching of baseline anomalies to current-year anomalies.
+    Returns the same baseline_idx -> current_idx dict as compute_custom_dtw.
+    """
+    base_idx, curr_idx, cost = candidate_pairs(baseline_df, current_df, distance_tol, angle_tol, rel_pos_tol)
+
+    mapping = {}
+    for block in _blocks(base_idx, curr_idx):
+        b, c, w = base_idx[block], curr_idx[block], cost[block]
+        small = len(np.unique(b)) <= MAX_EXACT_BLOCK and len(np.unique(c)) <= MAX_EXACT_BLOCK
+        if linear_sum_assignment is not None and small and len(block) > 1:
+            mapping.update(_assign_exact(b, c, w))
+        else:
+            mapping.update(_assign_greedy(b, c, w))
+
+    print(f"NN matcher: {len(cost):,} candidate pairs, {len(mapping)} one-to-one matches")
+    return dict(sorted(mapping.items()))
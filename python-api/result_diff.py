@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from schema import ALIGNED_SCHEMA
+
+# Run-to-run comparison of results versions.
+#
+# anomaly_no is renumbered on every run, so each anomaly also gets a stable
+# anomaly_key: a 64-bit hash of where it was first seen (inspection year,
+# log distance to 0.01 ft, clock angle to 0.1 degree). That row comes from
+# an inspection file, not from the alignment, so the key survives re-runs,
+# other alignment methods and added inspection years. diff_results joins two
+# versions on the key with a hash table (pandas Index) and compares the
+# numeric columns within per-column tolerances.
+
+KEY_COLUMN = 'anomaly_key'
+
+# Absolute change that counts as "changed" per column; others are not compared
+DEFAULT_TOLERANCES = {
+    'confidence': 0.05,
+    'severity': 0.05,
+    'growth_rate': 0.01,
+    'ml_depth': 0.02,
+    'remaining_life': 1.0,
+}
+
+# Columns a tolerance can be given for: the numeric measurements and scores
+# of ALIGNED_SCHEMA, not identifiers, flags or categories
+IDENTIFIER_COLUMNS = ('anomaly_no', 'joint_no', KEY_COLUMN, 'cluster_id')
+COMPARABLE_COLUMNS = tuple(col for col, dtype in ALIGNED_SCHEMA.items()
+                           if dtype not in ('category', 'bool') and col not in IDENTIFIER_COLUMNS)
+
+
+def anomaly_keys(packed):
+    """
+    packed: dict from history_cache.pack_history
+    Returns an int64 key per anomaly from its first detection.
+    """
+    present = packed['present']
+    rows = np.arange(len(present))
+    first = np.argmax(present, axis=1)
+    seen = present.any(axis=1)
+    year = np.where(seen, packed['years'][first], 0).astype(np.int64)
+    distance = np.round(packed['log_dist'][rows, first].astype(np.float64) * 100)
+    angle = np.round(packed['rotation'][rows, first].astype(np.float64) * 10)
+    parts = pd.DataFrame({
+        'year': year,
+        'distance': np.where(seen & np.isfinite(distance), distance, -1).astype(np.int64),
+        'angle': np.where(seen & np.isfinite(angle), angle, -1).astype(np.int64),
+    })
+    # Two anomalies at the same spot in the same year are told apart by file order
+    parts['occurrence'] = parts.groupby(['year', 'distance', 'angle'], sort=False).cumcount()
+    return pd.util.hash_pandas_object(parts, index=False).to_numpy().view(np.int64)
+
+
+def resolve_tolerances(overrides=None):
+    tolerances = dict(DEFAULT_TOLERANCES)
+    for col, value in (overrides or {}).items():
+        if col not in COMPARABLE_COLUMNS:
+            raise ValueError(f"Unknown tolerance column: {col}")
+        try:
+            tolerances[col] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Tolerance for {col} must be a number")
+        if tolerances[col] < 0:
+            raise ValueError(f"Tolerance for {col} must not be negative")
+    return tolerances
+
+
+def diff_results(old, new, tolerances=None):
+    """
+    old, new: mappings of column name -> array (a DataFrame, or a dict built
+    from ResultsView.array) that both include anomaly_key.
+    Returns row indices into each side:
+      added    rows of new whose key is not in old
+      removed  rows of old whose key is not in new
+      changed  {'old': rows, 'new': rows, 'columns': {col: bool mask}} for
+               matched rows where any compared column moved beyond its tolerance
+      matched  number of keys present in both
+    """
+    tolerances = resolve_tolerances(tolerances)
+    old_keys = pd.Index(np.asarray(old[KEY_COLUMN]))
+    new_keys = np.asarray(new[KEY_COLUMN])
+    if not old_keys.is_unique or not pd.Index(new_keys).is_unique:
+        raise ValueError("anomaly_key is not unique within a version")
+
+    # Hash join: build on old, probe with new
+    position = old_keys.get_indexer(new_keys)
+    matched = position >= 0
+    new_rows = np.flatnonzero(matched)
+    old_rows = position[matched]
+    removed_mask = np.ones(len(old_keys), dtype=bool)
+    removed_mask[old_rows] = False
+
+    any_change = np.zeros(len(new_rows), dtype=bool)
+    columns = {}
+    for col, tol in tolerances.items():
+        if col not in old or col not in new:
+            continue
+        before = np.asarray(old[col], dtype=np.float64)[old_rows]
+        after = np.asarray(new[col], dtype=np.float64)[new_rows]
+        with np.errstate(invalid='ignore'):
+            moved = np.abs(after - before) > tol
+        # Gaining or losing a value is a change; NaN on both sides is not
+        moved |= np.isnan(before) != np.isnan(after)
+        columns[col] = moved
+        any_change |= moved
+
+    return {
+        'added': np.flatnonzero(~matched),
+        'removed': np.flatnonzero(removed_mask),
+        'changed': {'old': old_rows[any_change], 'new': new_rows[any_change],
+                    'columns': {col: mask[any_change] for col, mask in columns.items()}},
+        'matched': int(matched.sum()),
+        'tolerances': {col: tol for col, tol in tolerances.items() if col in columns},
+    }
@@ -0,0 +1,363 @@
+import json
+import os
+import shutil
+import threading
+import time
+import weakref
+import numpy as np
+import pandas as pd
+
+from metrics import cache_lookup
+from schema import INDEXED_COLUMNS, plain_array
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Memory-mapped results store shared by API worker processes.
+#
+# Layout of a store directory:
+#   CURRENT            name of the live version, swapped with os.replace
+#   v<ns>/meta.json    row count, column order, string categories
+#   v<ns>/<col>.npy    one fixed-width array per column
+#   v<ns>/<col>.keys.npy, <col>.rows.npy
+#                      sorted index of an INDEXED_COLUMNS column: its non-NaN
+#                      values ascending and the row each came from
+#
+#   v<ns>/.pin         every open view holds a shared flock on it
+#   flags/<version>.viewed.npy
+#                      mutable copy of the version's 'viewed' array
+#
+# Numeric columns are opened with np.load(mmap_mode='r') so every worker maps
+# the same page-cache pages. String columns are stored as int32 codes plus a
+# small category table in meta.json. A published version is never written
+# again: 'viewed' is copied to flags/ on first use and toggled there in place
+# through a shared mapping. Versions beyond KEEP_VERSIONS are pruned unless a
+# view still has them open, since views load columns lazily.
+
+CURRENT_FILE = 'CURRENT'
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+PIN_FILE = '.pin'
+FLAGS_DIR = 'flags'
+KEEP_VERSIONS = 3
+
+STRING_COLUMNS = ('anomaly_type',)
+
+_local_locks = {}  # directory -> thread lock, so unrelated directories don't wait on each other
+_local_locks_guard = threading.Lock()
+_open_views = weakref.WeakSet()  # views open in this process (the only pins without fcntl)
+
+
+def _write_array(version_dir, col, values):
+    np.save(os.path.join(version_dir, f'{col}.npy'), np.ascontiguousarray(values))
+
+
+def _write_index(version_dir, col, values):
+    values = np.asarray(values, dtype=np.float64)
+    rows = np.flatnonzero(~np.isnan(values))
+    order = np.argsort(values[rows], kind='stable')
+    rows = rows[order].astype(np.int32)
+    _write_array(version_dir, f'{col}.keys', values[rows])
+    _write_array(version_dir, f'{col}.rows', rows)
+
+
+def publish(df, store_dir, keep=KEEP_VERSIONS, viewed_from=None):
+    """
+    Writes df as a new version and makes it current atomically. Readers that
+    still hold the previous version keep their mappings until they reopen.
+    viewed_from: a version with the same rows (e.g. the one df was re-scored
+    from) whose latest viewed flags replace df's, merged under the store lock
+    so a toggle made while df was being computed is not lost.
+    Returns the new version name.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    version = f'v{time.time_ns()}'
+    tmp_dir = os.path.join(store_dir, f'.{version}.tmp')
+    os.makedirs(tmp_dir)
+
+    meta = {'version': version, 'rows': len(df), 'columns': [], 'categories': {}, 'indexes': []}
+    df = df.loc[:, ~df.columns.duplicated()]
+    for col in df.columns:
+        series = df[col]
+        if col == 'viewed':
+            values = series.isin(['Yes', 'Y', True]).to_numpy(dtype=np.uint8)
+        elif col in STRING_COLUMNS or not pd.api.types.is_numeric_dtype(series.dtype):
+            codes, categories = pd.factorize(series.astype(object), use_na_sentinel=True)
+            values = codes.astype(np.int32)
+            meta['categories'][col] = [str(c) for c in categories]
+        else:
+            values = plain_array(series)
+        _write_array(tmp_dir, col, values)
+        meta['columns'].append(col)
+        if col in INDEXED_COLUMNS:
+            _write_index(tmp_dir, col, values)
+            meta['indexes'].append(col)
+
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    open(os.path.join(tmp_dir, PIN_FILE), 'w').close()
+
+    # Version directory appears complete or not at all, then the pointer flips
+    with DirectoryLock(store_dir):
+        if viewed_from is not None and 'viewed' in meta['columns']:
+            _carry_viewed(store_dir, viewed_from, version, meta['rows'])
+        os.replace(tmp_dir, os.path.join(store_dir, version))
+        tmp_pointer = os.path.join(store_dir, f'.{CURRENT_FILE}.{version}')
+        with open(tmp_pointer, 'w') as f:
+            f.write(version)
+        os.replace(tmp_pointer, os.path.join(store_dir, CURRENT_FILE))
+
+    _prune(store_dir, keep)
+    return version
+
+
+def _prune(store_dir, keep):
+    versions = list_versions(store_dir)
+    for old in versions[:-keep]:
+        if old in {view.version for view in _open_views if view.store_dir == store_dir}:
+            continue
+        with _VersionPin(store_dir, old, exclusive=True) as pin:
+            if not pin.held:
+                continue  # a view still reads it; retried on the next publish
+            shutil.rmtree(os.path.join(store_dir, old), ignore_errors=True)
+        flags = _viewed_path(store_dir, old)
+        if os.path.exists(flags):
+            os.remove(flags)
+
+
+def _viewed_path(store_dir, version):
+    return os.path.join(store_dir, FLAGS_DIR, f'{version}.viewed.npy')
+
+
+def _carry_viewed(store_dir, source, target, rows):
+    """Copies source's current viewed flags to target's. Caller holds the store lock."""
+    path = _viewed_path(store_dir, source)
+    if not os.path.exists(path):
+        path = os.path.join(store_dir, source, 'viewed.npy')
+    try:
+        flags = np.load(path)
+    except FileNotFoundError:
+        return
+    if len(flags) != rows:
+        return
+    target_path = _viewed_path(store_dir, target)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    np.save(f'{target_path}.tmp.npy', flags)
+    os.replace(f'{target_path}.tmp.npy', target_path)
+
+
+def list_versions(store_dir):
+    """Published versions still on disk, oldest first."""
+    try:
+        return sorted(d for d in os.listdir(store_dir) if d.startswith('v'))
+    except FileNotFoundError:
+        return []
+
+
+def current_version(store_dir):
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ResultsView:
+    """
+    Read-only, zero-copy view of one store version. Numeric columns are
+    np.memmap arrays; string columns are decoded from their codes on access.
+    """
+    def __init__(self, store_dir, version):
+        self.store_dir = store_dir
+        self.version = version
+        self.path = os.path.join(store_dir, version)
+        # Held for the life of the view so _prune leaves the version alone
+        self._pin = _VersionPin(store_dir, version).acquire()
+        with open(os.path.join(self.path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.columns = self.meta['columns']
+        self._arrays = {}
+        _open_views.add(self)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def array(self, col):
+        """Raw stored array for col (codes for string columns)."""
+        if col not in self._arrays:
+            path = self._viewed_flags() if col == 'viewed' else os.path.join(self.path, f'{col}.npy')
+            self._arrays[col] = np.load(path, mmap_mode='r')
+        return self._arrays[col]
+
+    def column(self, col):
+        values = self.array(col)
+        if col in self.meta['categories']:
+            categories = self.meta['categories'][col]
+            return pd.Categorical.from_codes(np.asarray(values), categories=categories)
+        return values
+
+    def to_frame(self, columns=None):
+        columns = columns or self.columns
+        return pd.DataFrame({c: self.column(c) for c in columns}, copy=False)
+
+    def take(self, rows, columns=None):
+        """DataFrame of just the given rows, gathered without materialising whole columns."""
+        columns = columns or self.columns
+        data = {}
+        for col in columns:
+            values = np.asarray(self.array(col)[rows])
+            if col in self.meta['categories']:
+                values = pd.Categorical.from_codes(values, categories=self.meta['categories'][col])
+            data[col] = values
+        return pd.DataFrame(data)
+
+    def rows_below(self, col, bound):
+        """
+        Rows whose col value is below bound, ordered by that value. Uses the
+        sorted index (binary search, no scan) when the version has one.
+        Returns (rows, values).
+        """
+        if col in self.meta.get('indexes', []):
+            keys = self.array(f'{col}.keys')
+            end = int(np.searchsorted(keys, bound, side='left'))
+            return np.asarray(self.array(f'{col}.rows')[:end]), np.asarray(keys[:end])
+        values = np.asarray(self.array(col), dtype=np.float64)
+        rows = np.flatnonzero(values < bound)
+        rows = rows[np.argsort(values[rows], kind='stable')]
+        return rows, values[rows]
+
+    def row_for(self, anomaly_no):
+        """Row index of anomaly_no, or None. anomaly_no is sequential so try that first."""
+        ids = self.array('anomaly_no')
+        guess = anomaly_no - 1
+        if 0 <= guess < len(ids) and ids[guess] == anomaly_no:
+            return guess
+        hits = np.flatnonzero(ids == anomaly_no)
+        return int(hits[0]) if len(hits) else None
+
+    def _viewed_flags(self):
+        """Path of the mutable viewed array, copied from the published one on first use."""
+        path = _viewed_path(self.store_dir, self.version)
+        if not os.path.exists(path):
+            with DirectoryLock(self.store_dir):
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f'{path}.{os.getpid()}.tmp'
+                    shutil.copyfile(os.path.join(self.path, 'viewed.npy'), tmp_path)
+                    os.replace(tmp_path, path)
+        return path
+
+    def toggle_viewed(self, row):
+        """
+        Flips viewed for one row in the shared mapping; returns the new value,
+        or None if this version is no longer current (reopen and retry).
+        """
+        path = self._viewed_flags()
+        with DirectoryLock(self.store_dir):
+            if current_version(self.store_dir) != self.version:
+                return None
+            viewed = np.load(path, mmap_mode='r+')
+            viewed[row] = 0 if viewed[row] else 1
+            new_value = bool(viewed[row])
+            viewed.flush()
+            del viewed
+        return new_value
+
+
+class DirectoryLock:
+    """
+    Cross-process lock on a directory (a .lock file inside it) for in-place
+    writes: the store's flags and publish, the upload hash index. Falls back to
+    a thread lock where fcntl is missing.
+    """
+    def __init__(self, directory):
+        self.path = os.path.join(directory, LOCK_FILE)
+        self.handle = None
+        key = os.path.realpath(directory)
+        with _local_locks_guard:
+            self.local = _local_locks.setdefault(key, threading.Lock())
+
+    def __enter__(self):
+        self.local.acquire()
+        if fcntl is not None:
+            self.handle = open(self.path, 'a')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        self.local.release()
+
+
+class _VersionPin:
+    """
+    flock on a version's pin file: shared while a view is open, exclusive
+    (non-blocking) while pruning. The lock goes away with the process.
+    """
+    def __init__(self, store_dir, version, exclusive=False):
+        self.path = os.path.join(store_dir, version, PIN_FILE)
+        self.exclusive = exclusive
+        self.handle = None
+        self.held = False
+
+    def acquire(self):
+        if fcntl is None:
+            self.held = True
+            return self
+        try:
+            self.handle = open(self.path, 'a')
+        except FileNotFoundError:
+            return self  # version already gone
+        try:
+            fcntl.flock(self.handle, fcntl.LOCK_EX | fcntl.LOCK_NB if self.exclusive else fcntl.LOCK_SH)
+            self.held = True
+        except BlockingIOError:
+            self.release()
+        return self
+
+    def release(self):
+        if self.handle is not None:
+            self.handle.close()  # also drops the flock
+            self.handle = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ResultsStore:
+    """
+    Per-process handle on a store directory. open() returns the current
+    version's view, reusing it until CURRENT points somewhere else.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self._view = None
+
+    def open_version(self, version):
+        """View of a specific version (e.g. for diffs); None if it was pruned."""
+        if version not in list_versions(self.store_dir):
+            return None
+        if self._view is not None and self._view.version == version:
+            return self._view
+        try:
+            return ResultsView(self.store_dir, version)
+        except FileNotFoundError:
+            return None  # pruned in the meantime
+
+    def open(self):
+        version = current_version(self.store_dir)
+        if version is None:
+            return None
+        hit = self._view is not None and self._view.version == version
+        cache_lookup('results_store', hit)
+        if not hit:
+            self._view = ResultsView(self.store_dir, version)
+        return self._view
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+# Declared dtypes for the tables passed between stages. Pandas defaults
+# (float64 everywhere, object strings) cost several times more per anomaly.
+# Distances stay float64: float32 only resolves ~0.25 ft at 500 miles.
+
+FORMATTED_SCHEMA = {
+    'feature_id': 'category',
+    'distance': 'float64',
+    'odometer': 'float64',
+    'joint_number': 'Int32',
+    'relative_position': 'float32',
+    'angle': 'float32',
+    'feature_type': 'category',
+    'depth_percent': 'float32',
+    'length': 'float32',
+    'width': 'float32',
+    'wall_thickness': 'float32',
+    'weld_type': 'category',
+    'elevation': 'float32',
+    'j_len': 'float32',
+    'mod_b31g': 'float32',
+    'internal': 'float32',
+}
+
+ALIGNED_SCHEMA = {
+    'anomaly_no': 'int32',
+    'joint_no': 'Int32',
+    'start_distance': 'float64',
+    'anomaly_type': 'category',
+    'confidence': 'float32',
+    'severity': 'float32',
+    'persistence': 'Int16',
+    'growth_rate': 'float32',
+    'viewed': 'bool',
+    'j_len': 'float32',
+    'log_dist': 'float64',
+    'elevation': 'float32',
+    'rotation': 'float32',
+    'internal': 'float32',
+    'ml_depth': 'float32',
+    'ml_depth_lenth': 'float32',
+    'width': 'float32',
+    'mod_b31g': 'float32',
+    'anomaly_key': 'int64',
+    'cluster_id': 'Int32',
+    'cluster_size': 'Int32',
+    'cluster_max_depth': 'float32',
+    'cluster_axial_extent': 'float64',
+    'depth_rate': 'float32',
+    'rpr_rate': 'float32',
+    'projected_depth': 'float32',
+    'projected_rpr': 'float32',
+    'depth_crossing_year': 'float32',
+    'rpr_crossing_year': 'float32',
+    'remaining_life': 'float32',
+}
+
+# Columns the results store keeps a sorted index for (range queries without a scan)
+INDEXED_COLUMNS = ('depth_crossing_year', 'rpr_crossing_year')
+
+VIEWED_TRUE = ('Yes', 'Y', 'yes', 'y', 'True', 'true', '1', True, 1)
+
+
+def _coerce(series, dtype):
+    if dtype == 'category':
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+        return series.astype('category')
+    if dtype == 'bool':
+        if series.dtype == bool:
+            return series
+        return series.isin(VIEWED_TRUE)
+    if dtype in ('Int16', 'Int32', 'Int64'):
+        if str(series.dtype) == dtype:
+            return series
+        return pd.to_numeric(series, errors='coerce').round().astype(dtype)
+    # Plain numpy floats / ints
+    if series.dtype == np.dtype(dtype):
+        return series
+    return pd.to_numeric(series, errors='coerce').astype(dtype)
+
+
+def apply_schema(df, schema):
+    """
+    Casts the columns of df named in schema, in place of the pandas defaults.
+    Columns not in the schema are left alone; missing columns are skipped.
+    """
+    for col, dtype in schema.items():
+        if col in df.columns:
+            df[col] = _coerce(df[col], dtype)
+    return df
+
+
+def to_export(df):
+    """Copy of df with 'viewed' written back as Yes/No for the CSV export."""
+    # Positional so tables that repeat a column name (the final export does) work too
+    positions = [i for i, col in enumerate(df.columns)
+                 if col == 'viewed' and df.iloc[:, i].dtype == bool]
+    if positions:
+        df = df.copy()
+        for i in positions:
+            df.isetitem(i, np.where(df.iloc[:, i], 'Yes', 'No'))
+    return df
+
+
+def plain_array(series):
+    """
+    numpy array for a numeric column, including nullable Int columns
+    (as float64 with NaN when they hold missing values).
+    """
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_numeric_dtype(series.dtype):
+        if series.isna().any():
+            return series.to_numpy(dtype='float64', na_value=np.nan)
+        return series.to_numpy(dtype=series.dtype.numpy_dtype)
+    return series.to_numpy()
+
+
+def bytes_per_row(df):
+    """Deep memory usage of df divided by its row count."""
+    return df.memory_usage(deep=True).sum() / max(len(df), 1)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the pipeline modules the way mapping.py and app.py do: as top-level siblings
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.join(API_DIR, 'benchmarks'))
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mapping
+from synthetic_ili import alignment_accuracy, generate_inspections, load_truth
+
+BASE_YEAR, YEAR = 2007, 2022
+
+
+@pytest.fixture(scope='module')
+def inspections(tmp_path_factory):
+    """1k synthetic anomalies; by 2022 the linear drift fit is off by up to a joint length."""
+    out_dir = tmp_path_factory.mktemp('synthetic')
+    generate_inspections(str(out_dir), n_anomalies=1000, seed=0)
+    truth = load_truth(str(out_dir))
+    frames = {year: mapping.load_formatted(str(out_dir / f'ILI_{year}_formatted.csv')) for year in truth}
+    return frames, truth
+
+
+def test_distance_correction_follows_the_welds(inspections):
+    frames, truth = inspections
+    base, curr = frames[BASE_YEAR], frames[YEAR]
+    base_points, curr_points = mapping.estimate_distance_correction(base, curr)
+
+    corrected = np.interp(base['distance'], base_points, curr_points)
+    actual = pd.Series(curr['distance'].to_numpy(), index=truth[YEAR])
+    common = np.isin(truth[BASE_YEAR], truth[YEAR])
+    error = np.abs(corrected[common] - actual.loc[truth[BASE_YEAR][common]].to_numpy())
+    assert np.percentile(error, 90) < 2.0
+
+
+def test_banded_recall_matches_dtw(inspections):
+    frames, truth = inspections
+    base, curr = frames[BASE_YEAR], frames[YEAR]
+    dtw = alignment_accuracy(mapping.align_years(base, curr, method='dtw'), truth[BASE_YEAR], truth[YEAR])
+    banded = alignment_accuracy(mapping.align_years(base, curr, method='banded'), truth[BASE_YEAR], truth[YEAR])
+    assert banded['recall'] >= dtw['recall'] - 0.01
+    assert banded['precision'] >= dtw['precision'] - 0.01
+
+
+def test_nn_recall_matches_dtw(inspections):
+    frames, truth = inspections
+    base, curr = frames[BASE_YEAR], frames[YEAR]
+    dtw = alignment_accuracy(mapping.align_years(base, curr, method='dtw'), truth[BASE_YEAR], truth[YEAR])
+    nn = alignment_accuracy(mapping.align_years(base, curr, method='nn'), truth[BASE_YEAR], truth[YEAR])
+    assert nn['recall'] >= dtw['recall']
+
+
+def test_nn_recovers_from_a_bad_correction(inspections, monkeypatch):
+    import nn_matcher
+
+    def off_by_a_joint(baseline_df, current_df):
+        base_points, curr_points = mapping.linear_distance_correction(baseline_df, current_df)
+        return base_points, curr_points + 40.0
+
+    monkeypatch.setattr(nn_matcher, 'estimate_distance_correction', off_by_a_joint)
+    frames, truth = inspections
+    result = alignment_accuracy(nn_matcher.match_anomalies(frames[BASE_YEAR], frames[YEAR]),
+                                truth[BASE_YEAR], truth[YEAR])
+    assert result['recall'] > 0.9
+    assert result['precision'] > 0.9
+
+
+@pytest.mark.parametrize('segment_size, overlap', [(200, 50), (300, 100)])
+def test_chunked_matches_monolithic(inspections, tmp_path, segment_size, overlap):
+    from chunked_alignment import align_chunked, load_mapping
+
+    frames, _ = inspections
+    base, curr = frames[BASE_YEAR], frames[YEAR]
+    monolithic = mapping.align_years(base, curr, method='banded')
+    out_path = str(tmp_path / 'mapping.bin')
+    align_chunked(base, curr, out_path, segment_size=segment_size, overlap=overlap)
+    assert load_mapping(out_path) == monolithic
+
+
+def _signals(frames, rows=300):
+    return (mapping.get_alignment_signal(frames[BASE_YEAR])[:rows],
+            mapping.get_alignment_signal(frames[2015])[:rows])
+
+
+def _in_band(path, band):
+    j_start, j_end = band  # 1-based, end exclusive
+    return all(j_start[i] <= j + 1 < j_end[i] for i, j in path)
+
+
+def test_coarsen_averages_blocks():
+    from multires_alignment import coarsen
+
+    signal = np.arange(10, dtype=float).reshape(5, 2)
+    np.testing.assert_array_equal(coarsen(signal, 2), [[1, 2], [5, 6], [8, 9]])
+
+
+@pytest.mark.parametrize('factor', [2, 3])
+def test_projected_band_contains_the_exact_path(inspections, factor):
+    from multires_alignment import coarsen, project_band
+
+    frames, _ = inspections
+    a, b = _signals(frames)
+    n, m = len(a), len(b)
+    exact, _ = mapping.dtw_path(a, b, (np.ones(n, dtype=int), np.full(n, m + 1)))
+    assert len(coarsen(a, factor)) == -(-n // factor)
+
+    # The exact path seen at the coarse level, projected back without any widening
+    coarse = sorted({(i // factor, j // factor) for i, j in exact})
+    assert _in_band(exact, project_band(coarse, n, m, factor, radius=0))
+
+
+def test_multires_path_matches_dtw(inspections):
+    from multires_alignment import coarsen, multires_path, project_band
+
+    frames, _ = inspections
+    a, b = _signals(frames)
+    n, m = len(a), len(b)
+    exact, exact_cells = mapping.dtw_path(a, b, (np.ones(n, dtype=int), np.full(n, m + 1)))
+
+    path, cells = multires_path(a, b, min_size=50)  # two coarse levels
+
+    assert path == exact
+    assert cells < exact_cells / 4
+    coarse_path, _ = multires_path(coarsen(a), coarsen(b), min_size=50)
+    assert _in_band(path, project_band(coarse_path, n, m))
@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pytest
+
+from anomaly_score import ScoreAccumulator, calculate_severity_score, score_histories
+from history_cache import pack_history
+
+YEARS = [2007, 2011, 2015, 2019, 2022]
+
+
+def _histories(n=300, seed=0):
+    """Random histories with missed inspections and some detections without a depth."""
+    rng = np.random.default_rng(seed)
+    history = {}
+    for i in range(n):
+        start = int(rng.integers(0, len(YEARS) - 1))
+        years = YEARS[start:]
+        flags = [True] + [bool(f) for f in rng.random(len(years) - 1) > 0.3]
+        seen = sum(flags)
+        history[i] = {
+            'year': years, 'bool': flags,
+            'j_len': list(rng.uniform(35, 45, seen)), 'log_dist': list(rng.uniform(100, 200, seen)),
+            'elevation': list(rng.uniform(100, 200, seen)), 'rotation': list(rng.uniform(1, 360, seen)),
+            'depth': [float('nan') if rng.random() < 0.1 else d for d in rng.uniform(0.05, 0.6, seen)],
+            'length': list(rng.uniform(0.5, 3, seen)), 'width': list(rng.uniform(0.5, 3, seen)),
+            'rpr': list(np.sort(rng.uniform(0.6, 1.2, seen))[::-1]),
+        }
+    return history
+
+
+def _accumulate(h, years):
+    acc = ScoreAccumulator()
+    values = iter(range(len(h['rpr'])))
+    for year, flag in zip(years, h['bool']):
+        if not flag:
+            acc.update(year, False)
+            continue
+        k = next(values)
+        depth = h['depth'][k]
+        acc.update(year, True, h['j_len'][k], h['log_dist'][k], h['elevation'][k], h['rotation'][k],
+                   None if math.isnan(depth) else depth, h['length'][k], h['width'][k], h['rpr'][k])
+    return acc
+
+
+@pytest.fixture(scope='module')
+def scored():
+    history = _histories()
+    packed = {key: np.asarray(value) for key, value in pack_history(history, YEARS).items()}
+    return history, score_histories(packed)
+
+
+def test_accumulator_matches_packed_scores(scored):
+    history, expected = scored
+    for i, h in history.items():
+        scores = _accumulate(h, h['year']).scores()
+        for col, value in scores.items():
+            np.testing.assert_allclose(value, expected[col][i], atol=1e-4, err_msg=f"{col} of anomaly {i}")
+
+
+def test_merged_accumulators_match_packed_scores(scored):
+    history, expected = scored
+    for i, h in history.items():
+        cut = len(h['year']) // 2
+        seen = sum(h['bool'][:cut])
+        head = {key: value[:seen] if key not in ('year', 'bool') else value[:cut] for key, value in h.items()}
+        tail = {key: value[seen:] if key not in ('year', 'bool') else value[cut:] for key, value in h.items()}
+        merged = _accumulate(head, head['year']).merge(_accumulate(tail, tail['year']))
+        np.testing.assert_allclose(merged.scores()['severity'], expected['severity'][i], atol=1e-4)
+
+
+def test_severity_pairs_rpr_with_detection_years(scored):
+    history, expected = scored
+    for i, h in history.items():
+        detected = [y for y, flag in zip(h['year'], h['bool']) if flag]
+        assert round(calculate_severity_score(h['rpr'], detected), 4) == pytest.approx(expected['severity'][i])
@@ -0,0 +1,95 @@
+import json
+import os
+
+import batch_runner
+from synthetic_ili import generate_inspections
+
+_align_pair = batch_runner.align_pair
+
+
+def crashing_align_pair(job, pair):
+    """Kills the worker process for the pipeline named 'crash'."""
+    if job['name'] == 'crash':
+        os._exit(1)
+    return _align_pair(job, pair)
+
+
+def recording_align_pair(job, pair):
+    """Appends the worker count the pipeline's alignments were given."""
+    with open(os.environ['ALIGN_WORKERS_LOG'], 'a') as f:
+        f.write(f"{job['align_workers']}\n")
+    return _align_pair(job, pair)
+
+
+def _manifest(tmp_path, names):
+    for seed, name in enumerate(names):
+        generate_inspections(str(tmp_path / name), n_anomalies=60, seed=seed)
+    manifest = {
+        'defaults': {'alignment': 'nn', 'publish_store': False},
+        'pipelines': [{'name': name, 'data_dir': name, 'output_folder': f'out/{name}'} for name in names],
+    }
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+def test_dead_worker_only_fails_its_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_runner, 'align_pair', crashing_align_pair)
+    path = _manifest(tmp_path, ['a', 'crash', 'b', 'c'])
+    summary_path = tmp_path / 'fleet_summary.json'
+
+    summary = batch_runner.run_batch(batch_runner.load_manifest(path), workers=2, summary_path=str(summary_path))
+
+    status = {p['name']: p['status'] for p in summary['pipelines']}
+    assert status == {'a': 'ok', 'crash': 'failed', 'b': 'ok', 'c': 'ok'}
+    crash = next(p for p in summary['pipelines'] if p['name'] == 'crash')
+    assert 'BrokenProcessPool' in crash['error']
+    assert json.loads(summary_path.read_text())['pipelines_ok'] == 3
+    for name in ('a', 'b', 'c'):
+        assert os.path.exists(tmp_path / 'out' / name / 'Master_Alignment_Final.csv')
+
+
+def test_missing_directory_is_reported(tmp_path):
+    path = _manifest(tmp_path, ['a'])
+    jobs = batch_runner.load_manifest(path)
+    jobs.append({'name': 'gone', 'data_dir': str(tmp_path / 'gone'),
+                 'output_folder': str(tmp_path / 'out' / 'gone'), 'options': {}})
+
+    summary = batch_runner.run_batch(jobs, workers=2)
+
+    assert [p['status'] for p in summary['pipelines']] == ['ok', 'failed']
+
+
+def test_batch_workers_split_the_cores(tmp_path, monkeypatch):
+    record = tmp_path / 'align_workers.txt'
+    monkeypatch.setenv('ALIGN_WORKERS_LOG', str(record))
+    monkeypatch.setattr(batch_runner, 'align_pair', recording_align_pair)
+    monkeypatch.setattr(batch_runner.os, 'cpu_count', lambda: 8)
+    path = _manifest(tmp_path, ['a', 'b'])
+
+    summary = batch_runner.run_batch(batch_runner.load_manifest(path), workers=4)
+
+    assert summary['pipelines_ok'] == 2
+    assert set(record.read_text().split()) == {'2'}
+
+
+def test_align_years_passes_workers_to_chunked(tmp_path, monkeypatch):
+    import chunked_alignment
+    import mapping
+
+    seen = []
+
+    def recording_align_chunked(baseline_df, current_df, out_path, workers=None, **kwargs):
+        seen.append(workers)
+        open(out_path, 'wb').close()
+        return 0
+
+    monkeypatch.setattr(chunked_alignment, 'align_chunked', recording_align_chunked)
+    monkeypatch.setattr(mapping.os, 'cpu_count', lambda: 8)
+    generate_inspections(str(tmp_path), n_anomalies=60, seed=0)
+    frames = {f['year']: mapping.load_formatted(f['path']) for f in mapping.collect_formatted_files(str(tmp_path))}
+
+    mapping.align_years(frames[2007], frames[2015], method='chunked', workers=1)
+    mapping.align_years(frames[2007], frames[2015], method='chunked')
+
+    assert seen == [1, 8]
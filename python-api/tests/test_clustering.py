@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import clustering
+from clustering import cluster_anomalies, cluster_histories, interacting_pairs
+
+
+def _pairs(distance, angle):
+    i, j = interacting_pairs(np.asarray(distance, float), np.asarray(angle, float))
+    return sorted(tuple(sorted(p)) for p in zip(i.tolist(), j.tolist()))
+
+
+def _brute_force(distance, angle, axial=1.0, circumferential=15.0):
+    pairs = []
+    for i in range(len(distance)):
+        for j in range(i + 1, len(distance)):
+            diff = abs(angle[i] - angle[j]) % 360
+            if abs(distance[i] - distance[j]) <= axial and min(diff, 360 - diff) <= circumferential:
+                pairs.append((i, j))
+    return pairs
+
+
+def test_pairs_straddling_cell_boundaries_are_found():
+    # Axial cells start at the smallest distance: 1.9 and 2.05 sit in cells 1 and 2
+    assert _pairs([0.0, 1.9, 2.05], [90, 90, 90]) == [(1, 2)]
+    # Angle cells are 15 degrees wide; 14 and 16 sit in neighbouring cells, 359 and 5 wrap around
+    assert _pairs([0.0, 0.1, 5.0, 5.1], [14, 16, 359, 5]) == [(0, 1), (2, 3)]
+
+
+def test_grid_matches_brute_force():
+    rng = np.random.default_rng(0)
+    distance = rng.uniform(0, 50, 400)
+    angle = rng.uniform(0, 360, 400)
+    assert _pairs(distance, angle) == _brute_force(distance, angle)
+
+
+def test_chain_merges_into_one_cluster():
+    df = pd.DataFrame({'log_dist': [0.0, 0.9, 1.8, 2.7, 10.0], 'rotation': [90.0] * 5,
+                       'ml_depth': [0.1, 0.4, 0.2, 0.3, 0.5]})
+    cluster_anomalies(df)
+
+    assert df['cluster_id'].tolist() == [1, 1, 1, 1, 2]
+    assert df['cluster_size'].tolist() == [4, 4, 4, 4, 1]
+    assert df['cluster_max_depth'].tolist() == [0.4, 0.4, 0.4, 0.4, 0.5]
+    assert df['cluster_axial_extent'].tolist() == pytest.approx([2.7, 2.7, 2.7, 2.7, 0.0])
+
+
+def test_scipy_and_union_find_give_the_same_labels(monkeypatch):
+    pytest.importorskip('scipy')
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({'log_dist': rng.uniform(0, 100, 1000), 'rotation': rng.uniform(0, 360, 1000),
+                       'ml_depth': rng.uniform(0, 1, 1000)})
+    with_scipy = cluster_anomalies(df.copy())['cluster_id'].to_numpy()
+    monkeypatch.setattr(clustering, 'connected_components', None)
+    with_union_find = cluster_anomalies(df.copy())['cluster_id'].to_numpy()
+    assert np.array_equal(with_scipy, with_union_find)
+
+
+def _packed(log_dist, rotation, present, depth):
+    return {'years': np.array([2015, 2022]), 'present': np.array(present, bool),
+            'in_history': np.ones_like(present, bool), 'log_dist': np.array(log_dist, float),
+            'rotation': np.array(rotation, float), 'depth': np.array(depth, float)}
+
+
+def test_histories_cluster_within_each_inspection():
+    # 0 and 1 interact in 2015. 2 (seen in 2015 only) and 3 (seen in 2022 only) share raw
+    # coordinates but were never seen in the same inspection.
+    packed = _packed(log_dist=[[100.0, 130.0], [100.5, 130.5], [200.0, np.nan], [np.nan, 200.0]],
+                     rotation=[[90, 90], [95, 250], [45, np.nan], [np.nan, 45]],
+                     present=[[True, True], [True, True], [True, False], [False, True]],
+                     depth=[[0.1, 0.2], [0.3, 0.6], [0.4, np.nan], [np.nan, 0.1]])
+    clusters = cluster_histories(packed)
+
+    assert clusters['cluster_id'].tolist() == [1, 1, 2, 3]
+    assert clusters['cluster_size'].tolist() == [2, 2, 1, 1]
+    assert clusters['cluster_max_depth'].tolist() == [0.6, 0.6, 0.4, 0.1]
+    assert clusters['cluster_axial_extent'].tolist() == pytest.approx([0.5, 0.5, 0.0, 0.0])
@@ -0,0 +1,100 @@
+import importlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import columnar
+from columnar import columnar_path, freshest_source, load_frame, save_frame
+from schema import FORMATTED_SCHEMA, apply_schema
+
+FORMATS = ['csv', 'npz',
+           pytest.param('parquet', marks=pytest.mark.skipif(not columnar.HAS_PYARROW, reason='needs pyarrow')),
+           pytest.param('feather', marks=pytest.mark.skipif(not columnar.HAS_PYARROW, reason='needs pyarrow'))]
+
+
+def _typed_frame():
+    df = pd.DataFrame({
+        'distance': [1.5, 2.25, 523145.125],
+        'joint_number': [1, None, 3],
+        'feature_type': ['Metal Loss', None, 'Dent'],
+        'depth_percent': [0.1, 0.2, np.nan],
+    })
+    return apply_schema(df, FORMATTED_SCHEMA)
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_round_trip_keeps_values_and_nulls(tmp_path, fmt):
+    df = _typed_frame()
+    path = save_frame(df, str(tmp_path / f'table.{fmt}'))
+
+    back = apply_schema(load_frame(path), FORMATTED_SCHEMA)
+
+    pd.testing.assert_frame_equal(back, df)
+
+
+@pytest.mark.parametrize('fmt', ['npz',
+                                 pytest.param('parquet', marks=pytest.mark.skipif(not columnar.HAS_PYARROW,
+                                                                                  reason='needs pyarrow'))])
+def test_typed_formats_keep_dtypes(tmp_path, fmt):
+    df = _typed_frame()
+    back = load_frame(save_frame(df, str(tmp_path / f'table.{fmt}')))
+
+    assert back['distance'].dtype == np.float64
+    assert back['depth_percent'].dtype == np.float32
+    if fmt == 'parquet':
+        assert back.dtypes.to_dict() == df.dtypes.to_dict()
+    else:
+        # numpy only: nullable ints come back as float with NaN, strings as objects
+        assert back['joint_number'].dtype == np.float64
+        assert back['feature_type'].isna().tolist() == [False, True, False]
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_column_projection_ignores_unknown_names(tmp_path, fmt):
+    path = save_frame(_typed_frame(), str(tmp_path / f'table.{fmt}'))
+
+    back = load_frame(path, columns=['depth_percent', 'missing', 'distance'])
+
+    assert list(back.columns) == ['distance', 'depth_percent']
+
+
+def test_unknown_extension_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        save_frame(_typed_frame(), str(tmp_path / 'table.xlsx'))
+
+
+def test_freshest_source_prefers_an_up_to_date_columnar_copy(tmp_path):
+    csv_path = str(tmp_path / 'ILI_2007_formatted.csv')
+    save_frame(_typed_frame(), csv_path)
+    typed = save_frame(_typed_frame(), columnar_path(csv_path, 'npz'))
+    os.utime(typed, (1_000_000, 1_000_000))
+    os.utime(csv_path, (1_000_000, 1_000_000))
+    assert freshest_source(csv_path) == typed  # same mtime counts as fresh
+
+    os.utime(csv_path, (1_000_010, 1_000_010))  # CSV replaced after the copy was built
+    assert freshest_source(csv_path) == csv_path
+
+    os.remove(csv_path)
+    assert freshest_source(csv_path) == typed
+
+
+@pytest.fixture
+def without_pyarrow(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)  # import raises ImportError
+    module = importlib.reload(columnar)
+    monkeypatch.undo()  # pandas itself uses pyarrow for strings when it is there
+    yield module
+    importlib.reload(columnar)
+
+
+def test_falls_back_to_npz_without_pyarrow(without_pyarrow, tmp_path):
+    assert not without_pyarrow.HAS_PYARROW
+    assert without_pyarrow.DEFAULT_FORMAT == 'npz'
+    path = without_pyarrow.columnar_path(str(tmp_path / 'ILI_2007_formatted.csv'))
+    assert path.endswith('ILI_2007_formatted.npz')
+
+    without_pyarrow.save_frame(_typed_frame(), path)
+    assert len(without_pyarrow.load_frame(path)) == 3
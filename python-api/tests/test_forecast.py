@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from forecast import _crossing_year, _trend, forecast_histories
+
+YEARS = np.array([2007, 2015, 2022])
+NAN = np.nan
+
+
+def _packed(depth, rpr=None, present=None):
+    depth = np.asarray(depth, dtype=float)
+    return {
+        'years': YEARS,
+        'present': np.ones(depth.shape, dtype=bool) if present is None else np.asarray(present),
+        'depth': depth,
+        'rpr': 1.0 - depth if rpr is None else np.asarray(rpr, dtype=float),
+    }
+
+
+def test_trend_uses_only_detected_years():
+    years = np.broadcast_to(YEARS.astype(float), (4, 3))
+    values = np.array([[0.10, 0.26, 0.40],
+                       [0.10, 0.90, 0.25],
+                       [0.30, NAN, NAN],
+                       [NAN, NAN, NAN]])
+    mask = np.array([[True, True, True],
+                     [True, False, True],
+                     [True, True, True],
+                     [False, False, False]])
+
+    slope, last_value, last_year = _trend(years, values, mask)
+
+    np.testing.assert_allclose(slope[:2], [0.02, 0.01])
+    assert np.isnan(slope[2:]).all()  # one point, none
+    np.testing.assert_allclose(last_value[:3], [0.40, 0.25, 0.30])
+    np.testing.assert_allclose(last_year[:3], [2022, 2022, 2007])
+    assert np.isnan(last_value[3]) and np.isnan(last_year[3])
+
+
+def test_crossing_year():
+    last_value = np.array([0.4, 0.9, 0.4, 0.4])
+    rate = np.array([0.02, 0.02, 0.0, -0.01])
+    depth = _crossing_year(last_value, np.full(4, 2022.0), rate, 0.8, 1)
+    np.testing.assert_allclose(depth, [2042, 2022, NAN, NAN])  # growing, already past, flat, shrinking
+
+    rpr = _crossing_year(np.array([1.2, 0.9, 1.2]), np.full(3, 2022.0), np.array([-0.05, -0.05, 0.01]), 1.0, -1)
+    np.testing.assert_allclose(rpr, [2026, 2022, NAN])
+
+
+def test_remaining_life_with_flat_and_negative_trends():
+    packed = _packed([[0.20, 0.36, 0.50],    # +0.02/yr, reaches 0.8 in 2037
+                      [0.30, 0.30, 0.30],    # flat
+                      [0.50, 0.40, 0.30],    # shrinking is treated as no growth
+                      [0.70, 0.80, 0.90]])   # already past the threshold
+
+    result = forecast_histories(packed)
+
+    np.testing.assert_allclose(result['depth_rate'], [0.02, 0.0, 0.0, 0.0133], atol=1e-4)
+    np.testing.assert_allclose(result['depth_crossing_year'], [2037, NAN, NAN, 2022])
+    np.testing.assert_allclose(result['remaining_life'], [15, NAN, NAN, 0])
+    np.testing.assert_allclose(result['projected_depth'], [0.7, 0.3, 0.3, 1.0])
+    assert np.isnan(result['rpr_crossing_year']).all()  # 1 - depth is only a proxy
+
+
+def test_remaining_life_takes_the_earlier_threshold():
+    depth = [[0.20, 0.36, 0.50], [0.30, 0.30, 0.30]]
+    rpr = [[1.50, 1.34, 1.20], [1.50, 1.50, 1.50]]  # first row loses 0.02/yr, reaches 1.0 in 2032
+
+    result = forecast_histories(_packed(depth, rpr))
+
+    np.testing.assert_allclose(result['rpr_crossing_year'], [2032, NAN])
+    np.testing.assert_allclose(result['remaining_life'], [10, NAN])
+
+
+def _publish_forecast(tmp_path, monkeypatch):
+    import app as api
+    from results_store import ResultsStore, publish
+
+    df = pd.DataFrame({
+        'anomaly_no': [1, 2, 3, 4, 5],
+        'joint_no': [10, 20, 30, 40, 50],
+        'start_distance': [100.0, 200.0, 300.0, 400.0, 500.0],
+        'anomaly_type': ['Metal Loss'] * 5,
+        'confidence': 0.9, 'severity': 0.5, 'persistence': 3, 'growth_rate': 0.01, 'viewed': 'No',
+        'depth_crossing_year': [2030, NAN, 2028, 2035, NAN],
+        'rpr_crossing_year': [NAN, 2026, 2040, 2027, NAN],
+        'remaining_life': [8, 4, 6, 5, NAN],
+        'projected_depth': 0.6, 'projected_rpr': 1.1,
+    })
+    publish(df, str(tmp_path))
+    monkeypatch.setattr(api, 'results_store', ResultsStore(str(tmp_path)))
+    return api.app.test_client()
+
+
+def test_due_endpoint_filters_by_year_and_threshold(tmp_path, monkeypatch):
+    client = _publish_forecast(tmp_path, monkeypatch)
+
+    def due(query):
+        body = client.get(f'/api/forecast/due?{query}').get_json()
+        return [(r['anomalyNumber'], r['dueYear']) for r in body['results']], body['totalAnomalies']
+
+    assert due('before=2031&threshold=depth') == ([(3, 2028), (1, 2030)], 2)
+    assert due('before=2031&threshold=rpr') == ([(2, 2026), (4, 2027)], 2)
+    # Anomaly 4 is due on both counts and listed once, at its earlier year
+    assert due('before=2036') == ([(2, 2026), (4, 2027), (3, 2028), (1, 2030)], 4)
+    assert due('before=2036&limit=2') == ([(2, 2026), (4, 2027)], 4)
+    assert due('before=2026') == ([], 0)
+
+
+def test_due_endpoint_validates_query(tmp_path, monkeypatch):
+    client = _publish_forecast(tmp_path, monkeypatch)
+
+    assert client.get('/api/forecast/due').status_code == 400
+    assert client.get('/api/forecast/due?before=2030&threshold=width').status_code == 400
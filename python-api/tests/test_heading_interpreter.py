@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+import heading_interpreter
+from heading_interpreter import (MAX_OUTPUT_TOKENS, FakeBackend, _plan_chunks, get_column_mapping,
+                                 interpret_headers_batch)
+
+HEADERS = "log dist. [ft],Width [in],O'clock,Comment\n"
+TARGETS = ['distance', 'weld_type', 'width']
+
+
+def _csv(tmp_path):
+    path = tmp_path / 'ILI_2015.csv'
+    path.write_text(HEADERS + "10.0,1.5,3:00,none\n")
+    return str(path)
+
+
+def test_failed_backend_drops_low_confidence_guesses(tmp_path, no_sleep):
+    mapping, confidence = get_column_mapping(_csv(tmp_path), TARGETS, backend=FakeBackend(fail_times=100))
+
+    assert mapping == {'distance': 0, 'weld_type': None, 'width': 1}
+    assert confidence['weld_type'] < 0.75  # the local score is still reported
+
+
+def test_backend_resolves_low_confidence_targets(tmp_path):
+    backend = FakeBackend()
+    mapping, confidence = get_column_mapping(_csv(tmp_path), TARGETS, backend=backend)
+
+    assert len(backend.prompts) == 1
+    assert mapping['distance'] == 0 and mapping['width'] == 1
+    assert confidence['weld_type'] is None
+
+
+# --- batching, concurrency and retries ---
+
+ALL_TARGETS = ['distance', 'odometer', 'joint_number', 'relative_position', 'angle', 'feature_type',
+               'depth_percent', 'length', 'width', 'wall_thickness', 'weld_type', 'elevation', 'mod_b31g']
+
+
+def _requests(n):
+    headers = ['log dist. [ft]', 'J. no.', 'Width [in]', "O'clock", 'Comment']
+    return {f'file{i}': {'headers': headers, 'targets': list(ALL_TARGETS)} for i in range(n)}
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(heading_interpreter.time, 'sleep', lambda s: None)
+
+
+def test_full_chunks_stay_within_the_output_limit():
+    backend = FakeBackend()
+    results = interpret_headers_batch(_requests(25), backend=backend)
+
+    assert len(results) == 25 and all(results[k] is not None for k in results)
+    assert max(backend.max_tokens) <= MAX_OUTPUT_TOKENS
+    # 13 targets per file: 7 files fit in one reply, so 25 files take 4 requests
+    assert len(backend.prompts) == 4
+    assert [len(chunk) for chunk in _plan_chunks(_requests(25))] == [7, 7, 7, 4]
+
+
+def test_small_files_are_grouped_by_file_count():
+    requests = {f'f{i}': {'headers': ['a'], 'targets': ['distance']} for i in range(25)}
+    assert [len(chunk) for chunk in _plan_chunks(requests, files_per_request=10)] == [10, 10, 5]
+
+
+class _SlowBackend(FakeBackend):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.active = self.peak = 0
+
+    def complete(self, prompt, max_tokens=500):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        try:
+            return super().complete(prompt, max_tokens)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_requests_run_concurrently_up_to_the_limit():
+    backend = _SlowBackend()
+    results = interpret_headers_batch(_requests(50), backend=backend, max_workers=3)
+
+    assert len(backend.prompts) == 8
+    assert backend.peak == 3
+    assert all(results[k] is not None for k in results)
+
+
+def test_timeouts_are_retried(no_sleep):
+    backend = FakeBackend(fail_times=2)
+    results = interpret_headers_batch(_requests(1), backend=backend, retries=3)
+
+    assert len(backend.prompts) == 3
+    assert results['file0'] is not None
+
+
+def test_persistent_timeouts_give_up(no_sleep):
+    backend = FakeBackend(fail_times=10)
+    assert interpret_headers_batch(_requests(1), backend=backend, retries=3) == {'file0': None}
+    assert len(backend.prompts) == 3
+
+
+class _ClientError(Exception):
+    """Shaped like botocore.exceptions.ClientError."""
+    def __init__(self, code, status):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+class _FailingBackend(FakeBackend):
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+    def complete(self, prompt, max_tokens=500):
+        self.prompts.append(prompt)
+        raise self.error
+
+
+@pytest.mark.parametrize('error, attempts', [
+    (_ClientError('ValidationException', 400), 1),
+    (_ClientError('AccessDeniedException', 403), 1),
+    (_ClientError('ThrottlingException', 429), 3),
+    (_ClientError('InternalServerException', 500), 3),
+    (_ClientError('SomethingElse', 503), 3),
+])
+def test_only_transient_errors_are_retried(no_sleep, error, attempts):
+    backend = _FailingBackend(error)
+    assert interpret_headers_batch(_requests(1), backend=backend, retries=3) == {'file0': None}
+    assert len(backend.prompts) == attempts
+
+
+class _GarbageBackend(FakeBackend):
+    def complete(self, prompt, max_tokens=500):
+        self.prompts.append(prompt)
+        return "Sorry, I can't help with that."
+
+
+def test_unparseable_reply_is_not_retried(no_sleep):
+    backend = _GarbageBackend()
+    assert interpret_headers_batch(_requests(1), backend=backend, retries=3) == {'file0': None}
+    assert len(backend.prompts) == 1
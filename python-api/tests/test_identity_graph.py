@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from identity_graph import UnionFind, build_identity_graph, track_identities
+
+YEARS = (2007, 2015, 2022)
+
+
+def _frame(distances):
+    n = len(distances)
+    return pd.DataFrame({'distance': np.asarray(distances, dtype=float), 'joint_number': np.arange(1, n + 1),
+                         'angle': np.full(n, 90.0), 'depth_percent': np.linspace(0.1, 0.3, n)})
+
+
+def _identities(frames, mappings, bridge_gaps=True):
+    """Components as sorted lists of (year, row)."""
+    years, offsets, components = build_identity_graph(frames, mappings=mappings, bridge_gaps=bridge_gaps)
+    result = []
+    for nodes in components:
+        k = np.searchsorted(offsets, nodes, side='right') - 1
+        result.append([(years[y], int(n - offsets[y])) for y, n in zip(k, nodes)])
+    return result
+
+
+def test_union_find_merges_sets():
+    uf = UnionFind(6)
+    uf.union(0, 1)
+    uf.union(2, 3)
+    uf.union(1, 3)
+
+    roots = uf.roots()
+    assert len(set(roots[:4])) == 1
+    assert len(set(roots)) == 3
+    assert uf.size[uf.find(0)] == 4
+    assert uf.union(0, 2) == uf.find(3)  # already joined
+
+
+def test_bridge_rejoins_anomaly_missed_in_middle_year():
+    # 2007 row 2 is missing from 2015 and seen again as 2022 row 2
+    frames = {2007: _frame([10, 20, 30]), 2015: _frame([10, 20]), 2022: _frame([10, 20, 30])}
+    mappings = {(2007, 2015): {0: 0, 1: 1}, (2015, 2022): {0: 0, 1: 1},
+                (2007, 2022): {0: 0, 1: 1, 2: 2}}
+
+    assert _identities(frames, mappings) == [
+        [(2007, 0), (2015, 0), (2022, 0)],
+        [(2007, 1), (2015, 1), (2022, 1)],
+        [(2007, 2), (2022, 2)],
+    ]
+    # Without the k -> k+2 pass the missed anomaly splits in two
+    assert [(2007, 2)] in _identities(frames, mappings, bridge_gaps=False)
+
+    master_df, history = track_identities(frames, mappings=mappings)
+    assert len(master_df) == 3
+    assert history[2]['year'] == list(YEARS)
+    assert history[2]['bool'] == [True, False, True]
+    assert history[2]['log_dist'] == [30.0, 30.0]
+
+
+def test_no_bridge_when_middle_year_has_a_match():
+    frames = {2007: _frame([10, 20]), 2015: _frame([10]), 2022: _frame([10, 20])}
+    # 2007 row 0 is tracked through 2015; 2022 row 0 already has 2015 as its predecessor
+    mappings = {(2007, 2015): {0: 0}, (2015, 2022): {0: 0},
+                (2007, 2022): {0: 1, 1: 0}}
+
+    assert _identities(frames, mappings) == [
+        [(2007, 0), (2015, 0), (2022, 0)],
+        [(2007, 1)],
+        [(2022, 1)],
+    ]
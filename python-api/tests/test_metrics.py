@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import metrics
+from metrics import (CACHE_REQUESTS, ROWS_PROCESSED, STAGE_DURATION, Counter, Gauge, Histogram, Registry,
+                     StageTimer, record_run_metrics, write_run_metrics)
+
+
+def _registry():
+    registry = Registry()
+    latency = registry.register(Histogram('latency_seconds', 'Request latency', ['route'], buckets=(1.0, 0.1)))
+    requests = registry.register(Counter('requests_total', 'Requests', ['route', 'status']))
+    registry.register(Gauge('rss_bytes', 'Resident memory', callback=lambda: 2048))
+    return registry, latency, requests
+
+
+def test_render_exposition_format():
+    registry, latency, requests = _registry()
+    for value in (0.05, 0.1, 0.5, 5.0):
+        latency.observe(value, route='/api/results')
+    requests.inc(route='/api/results', status=200)
+    requests.inc(2, route='/api/results', status=200)
+
+    lines = registry.render().splitlines()
+
+    assert lines == [
+        '# HELP latency_seconds Request latency',
+        '# TYPE latency_seconds histogram',
+        # Buckets are cumulative and a value on a bound counts in that bucket
+        'latency_seconds_bucket{route="/api/results",le="0.1"} 2',
+        'latency_seconds_bucket{route="/api/results",le="1.0"} 3',
+        'latency_seconds_bucket{route="/api/results",le="+Inf"} 4',
+        'latency_seconds_sum{route="/api/results"} 5.65',
+        'latency_seconds_count{route="/api/results"} 4',
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/api/results",status="200"} 3',
+        '# HELP rss_bytes Resident memory',
+        '# TYPE rss_bytes gauge',
+        'rss_bytes 2048',
+    ]
+
+
+def test_label_values_are_escaped():
+    registry, _, requests = _registry()
+    requests.inc(route='C:\\data\n"quoted"', status=500)
+
+    assert 'requests_total{route="C:\\\\data\\n\\"quoted\\"",status="500"} 1' in registry.render().splitlines()
+
+
+def test_wrong_labels_are_rejected():
+    _, latency, _ = _registry()
+    with pytest.raises(ValueError):
+        latency.observe(0.1, path='/api/results')
+
+
+def test_stage_timer_laps(monkeypatch):
+    clock = iter([100.0, 101.5, 104.0, 104.25, 105.0])
+    monkeypatch.setattr(metrics.time, 'perf_counter', lambda: next(clock))
+
+    timer = StageTimer()
+    timer.lap('load')
+    timer.lap('align')
+    timer.lap('load')  # a repeated stage adds up
+
+    assert timer.stages == {'load': 1.75, 'align': 2.5}
+    assert timer.elapsed() == 5.0
+
+
+def _count(metric, key):
+    return dict((tuple(k), v) for k, v in metric.snapshot()).get(key, 0)
+
+
+def test_run_metrics_sidecar_is_folded_in(tmp_path):
+    timer = StageTimer()
+    timer.lap('load')
+    timer.lap('align')
+    path = str(tmp_path / metrics.RUN_METRICS_FILE)
+    write_run_metrics(path, timer, rows=1200)
+    with open(path) as f:
+        written = json.load(f)
+    assert written['rows'] == 1200
+    assert list(written['stages']) == ['load', 'align']
+    assert written['duration'] >= sum(written['stages'].values())
+
+    rows_before = _count(ROWS_PROCESSED, ())
+    hits_before = _count(CACHE_REQUESTS, ('columnar', 'hit'))
+    written['cache'] = [[['columnar', 'hit'], 3]]
+    with open(path, 'w') as f:
+        json.dump(written, f)
+
+    assert record_run_metrics(path) == written
+    assert _count(ROWS_PROCESSED, ()) == rows_before + 1200
+    assert _count(CACHE_REQUESTS, ('columnar', 'hit')) == hits_before + 3
+    assert any(line.startswith('ili_pipeline_stage_duration_seconds_count{stage="align"}')
+               for line in STAGE_DURATION.lines())
+    assert record_run_metrics(str(tmp_path / 'missing.json')) is None
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from result_diff import COMPARABLE_COLUMNS, diff_results, resolve_tolerances
+
+
+@pytest.mark.parametrize('col', ['anomaly_no', 'anomaly_key', 'viewed', 'anomaly_type', 'no_such_column'])
+def test_tolerance_rejects_non_comparable_columns(col):
+    with pytest.raises(ValueError, match='Unknown tolerance column'):
+        resolve_tolerances({col: 1})
+
+
+def test_tolerance_accepts_numeric_result_columns():
+    assert resolve_tolerances({'width': '0.5'})['width'] == 0.5
+    assert 'remaining_life' in COMPARABLE_COLUMNS
+
+
+def test_diff_uses_tolerance_override():
+    old = pd.DataFrame({'anomaly_key': [1, 2, 3], 'width': [1.0, 1.0, 1.0]})
+    new = pd.DataFrame({'anomaly_key': [2, 3, 4], 'width': [1.2, 1.6, 1.0]})
+    diff = diff_results(old, new, {'width': 0.5})
+
+    assert diff['added'].tolist() == [2] and diff['removed'].tolist() == [0]
+    assert diff['changed']['new'].tolist() == [1]
+    assert np.array_equal(diff['changed']['columns']['width'], [True])
+
+
+def test_diff_endpoint_rejects_identifier_tolerance(tmp_path, monkeypatch):
+    import app as api
+    from results_store import ResultsStore
+
+    monkeypatch.setattr(api, 'results_store', ResultsStore(str(tmp_path)))
+    response = api.app.test_client().get('/api/results/diff?tolerance=anomaly_no:1')
+
+    assert response.status_code == 400
+    assert 'anomaly_no' not in response.get_json()['details']['allowed']
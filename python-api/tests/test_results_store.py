@@ -0,0 +1,114 @@
+import gc
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from results_store import ResultsStore, ResultsView, list_versions, publish
+
+
+def _frame(n=5):
+    return pd.DataFrame({'anomaly_no': np.arange(1, n + 1), 'ml_depth': np.linspace(0.1, 0.5, n),
+                         'viewed': ['No'] * n})
+
+
+def test_toggle_leaves_published_version_untouched(tmp_path):
+    store_dir = str(tmp_path)
+    version = publish(_frame(), store_dir)
+    published = os.path.join(store_dir, version, 'viewed.npy')
+    before = open(published, 'rb').read()
+
+    view = ResultsStore(store_dir).open()
+    view.array('viewed')  # mapped before the toggle, like a busy worker
+    assert view.toggle_viewed(2) is True
+
+    assert open(published, 'rb').read() == before
+    assert view.array('viewed')[2] == 1
+    assert ResultsView(store_dir, version).array('viewed').tolist() == [0, 0, 1, 0, 0]
+
+
+def test_prune_keeps_versions_with_open_views(tmp_path):
+    store_dir = str(tmp_path)
+    first = publish(_frame(), store_dir)
+    view = ResultsView(store_dir, first)
+    for _ in range(4):
+        publish(_frame(), store_dir, keep=3)
+
+    assert first in list_versions(store_dir)
+    assert view.column('ml_depth')[4] == np.float32(0.5)  # lazily loaded after the prunes
+
+    del view
+    gc.collect()
+    publish(_frame(), store_dir, keep=3)
+    assert first not in list_versions(store_dir)
+    assert len(list_versions(store_dir)) == 3
+
+
+def _hold_view(store_dir, version, opened, done):
+    view = ResultsView(store_dir, version)
+    opened.set()
+    done.wait(30)
+    del view
+
+
+def test_prune_keeps_versions_open_in_other_processes(tmp_path):
+    store_dir = str(tmp_path)
+    first = publish(_frame(), store_dir)
+    ctx = multiprocessing.get_context('fork')
+    opened, done = ctx.Event(), ctx.Event()
+    worker = ctx.Process(target=_hold_view, args=(store_dir, first, opened, done))
+    worker.start()
+    try:
+        assert opened.wait(30)
+        for _ in range(4):
+            publish(_frame(), store_dir, keep=3)
+        assert first in list_versions(store_dir)
+    finally:
+        done.set()
+        worker.join(30)
+
+    publish(_frame(), store_dir, keep=3)
+    assert first not in list_versions(store_dir)
+
+
+def test_publish_carries_viewed_toggled_meanwhile(tmp_path):
+    store_dir = str(tmp_path)
+    store = ResultsStore(store_dir)
+    publish(_frame(), store_dir)
+    view = store.open()
+    rescored = view.to_frame()  # read before the toggle, like /api/rescore
+    view.toggle_viewed(1)
+
+    publish(rescored, store_dir, viewed_from=view.version)
+    assert store.open().array('viewed').tolist() == [0, 1, 0, 0, 0]
+
+
+def test_toggle_on_superseded_version_is_refused(tmp_path):
+    store_dir = str(tmp_path)
+    store = ResultsStore(store_dir)
+    publish(_frame(), store_dir)
+    stale = store.open()
+    publish(stale.to_frame(), store_dir, viewed_from=stale.version)
+
+    assert stale.toggle_viewed(3) is None
+    assert store.open().toggle_viewed(3) is True
+    assert store.open().array('viewed').tolist() == [0, 0, 0, 1, 0]
+
+
+def test_viewed_endpoint_updates_store_not_export(tmp_path, monkeypatch):
+    import app as api
+    from results_store import ResultsStore
+
+    store_dir = str(tmp_path / 'store')
+    publish(_frame(), store_dir)
+    export = tmp_path / 'Master_Alignment_Final.csv'
+    export.write_text('anomaly_no,viewed\n1,No\n')
+    monkeypatch.setattr(api, 'results_store', ResultsStore(store_dir))
+    monkeypatch.setattr(api, 'RESULTS_FOLDER', str(tmp_path))
+
+    response = api.app.test_client().patch('/api/anomaly/3/viewed')
+
+    assert response.get_json()['viewed'] == 'Y'
+    assert ResultsStore(store_dir).open().array('viewed').tolist() == [0, 0, 1, 0, 0]
+    assert export.read_text() == 'anomaly_no,viewed\n1,No\n'  # the store is the source of truth
@@ -0,0 +1,68 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from schema import ALIGNED_SCHEMA, FORMATTED_SCHEMA, apply_schema, bytes_per_row, plain_array, to_export
+
+CSV = """anomaly_no,joint_no,start_distance,anomaly_type,confidence,severity,persistence,growth_rate,viewed,extra
+1,10,1234.56,Metal Loss,0.91,0.40,3,0.0125,Yes,a
+2,,2345.67,Dent,0.52,0.10,1,0.0,No,b
+3,12.0,3456.78,Metal Loss,0.75,0.33,2,0.002,No,c
+"""
+
+
+def _results():
+    return apply_schema(pd.read_csv(io.StringIO(CSV)), ALIGNED_SCHEMA)
+
+
+def test_apply_schema_downcasts_declared_columns():
+    df = _results()
+
+    assert df['anomaly_no'].dtype == np.int32
+    assert str(df['joint_no'].dtype) == 'Int32'
+    assert df['joint_no'].isna().tolist() == [False, True, False]
+    assert df['start_distance'].dtype == np.float64  # distances keep full precision
+    assert isinstance(df['anomaly_type'].dtype, pd.CategoricalDtype)
+    assert df['confidence'].dtype == np.float32
+    assert str(df['persistence'].dtype) == 'Int16'
+    assert df['viewed'].tolist() == [True, False, False]
+    assert df['extra'].tolist() == ['a', 'b', 'c']  # not in the schema
+
+
+def test_apply_schema_is_idempotent_and_skips_missing_columns():
+    df = _results()
+    again = apply_schema(df.copy(), ALIGNED_SCHEMA)
+    pd.testing.assert_frame_equal(again, df)
+
+    formatted = apply_schema(pd.DataFrame({'distance': ['10.5', 'bad']}), FORMATTED_SCHEMA)
+    assert list(formatted.columns) == ['distance']
+    assert np.isnan(formatted['distance'].iloc[1])
+
+
+def test_typed_results_take_less_memory():
+    raw = pd.concat([pd.read_csv(io.StringIO(CSV))] * 100, ignore_index=True)
+    typed = apply_schema(raw.copy(), ALIGNED_SCHEMA)
+    assert bytes_per_row(typed) < bytes_per_row(raw) / 2
+
+
+def test_to_export_writes_the_csv_layout():
+    df = _results()
+    exported = to_export(df)
+
+    assert exported['viewed'].tolist() == ['Yes', 'No', 'No']
+    assert df['viewed'].dtype == bool  # the typed frame is not modified
+    back = apply_schema(pd.read_csv(io.StringIO(exported.to_csv(index=False))), ALIGNED_SCHEMA)
+    pd.testing.assert_frame_equal(back, df)
+
+
+def test_to_export_handles_repeated_viewed_columns():
+    df = pd.DataFrame([[1, True, False]], columns=['anomaly_no', 'viewed', 'viewed'])
+    assert to_export(df).iloc[0].tolist() == [1, 'Yes', 'No']
+
+
+def test_plain_array_turns_nullable_ints_into_numpy():
+    df = _results()
+    assert plain_array(df['joint_no']).dtype == np.float64  # has a missing value
+    assert plain_array(df['persistence']).dtype == np.int16
+    assert plain_array(df['confidence']).dtype == np.float32
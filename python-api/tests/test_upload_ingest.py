@@ -0,0 +1,105 @@
+import io
+import json
+import os
+import threading
+
+import results_store
+from results_store import DirectoryLock
+from upload_ingest import INDEX_FILE, ingest_multipart
+
+BOUNDARY = 'test-boundary'
+HEADER = 'distance,joint_number,relative_position,angle,depth_percent,j_len,feature_type,length,width,elevation\n'
+
+
+def _csv(rows=20, shift=0.0):
+    lines = [f'{10.0 * i + shift:.2f},{i // 4 + 1},{i % 4 * 1.5:.2f},{(37 * i) % 360},0.{i % 9 + 1},40.0,'
+             f'Metal Loss,1.2,0.8,100.0\n' for i in range(rows)]
+    return (HEADER + ''.join(lines)).encode()
+
+
+def _body(files, field='files'):
+    parts = []
+    for name, content in files:
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+                     f'Content-Type: text/csv\r\n\r\n'.encode() + content + b'\r\n')
+    return b''.join(parts) + f'--{BOUNDARY}--\r\n'.encode()
+
+
+def _upload(folder, files, chunk_size=64):
+    # Small chunks so every file spans many reads
+    return ingest_multipart(io.BytesIO(_body(files)), BOUNDARY, str(folder), chunk_size=chunk_size)
+
+
+def test_multi_file_upload_saves_every_file(tmp_path):
+    files = [('ILI_2007_formatted.csv', _csv()), ('ILI_2015_formatted.csv', _csv(shift=3.0))]
+
+    results = _upload(tmp_path, files)
+
+    assert [r['status'] for r in results] == ['saved', 'saved']
+    for name, content in files:
+        assert (tmp_path / name).read_bytes() == content
+    index = json.loads((tmp_path / INDEX_FILE).read_text())
+    assert sorted(index.values()) == ['ILI_2007_formatted.csv', 'ILI_2015_formatted.csv']
+    assert not [n for n in os.listdir(tmp_path) if n.endswith('.part')]
+
+
+def test_bad_schema_is_rejected_and_not_kept(tmp_path):
+    missing = _csv().replace(b'depth_percent', b'depth')
+    not_numeric = _csv().replace(b'\n50.00,', b'\nfifty,')
+
+    results = _upload(tmp_path, [('ILI_2007_formatted.csv', missing), ('ILI_2015_formatted.csv', not_numeric),
+                                 ('report.txt', _csv())])
+
+    assert [r['status'] for r in results] == ['rejected'] * 3
+    assert 'Missing required columns: depth_percent' in results[0]['errors'][0]
+    assert 'Column distance has 1 non-numeric values' in results[1]['errors'][0]
+    assert 'Invalid file type' in results[2]['errors'][0]
+    assert os.listdir(tmp_path) == []
+
+
+def test_reupload_is_a_duplicate(tmp_path):
+    content = _csv()
+    _upload(tmp_path, [('ILI_2007_formatted.csv', content)])
+    mtime = os.path.getmtime(tmp_path / 'ILI_2007_formatted.csv')
+
+    [result] = _upload(tmp_path, [('ILI_2007_formatted.csv', content)])
+
+    assert result['status'] == 'duplicate'
+    assert result['duplicateOf'] == 'ILI_2007_formatted.csv'
+    assert result['warnings'] == []
+    assert os.path.getmtime(tmp_path / 'ILI_2007_formatted.csv') == mtime
+
+
+def test_same_content_under_new_name_points_to_existing_file(tmp_path):
+    content = _csv()
+    _upload(tmp_path, [('ILI_2007_formatted.csv', content)])
+
+    [result] = _upload(tmp_path, [('ILI_2015_formatted.csv', content)])
+
+    assert result['status'] == 'duplicate'
+    assert result['duplicateOf'] == 'ILI_2007_formatted.csv'
+    assert 'Same content as ILI_2007_formatted.csv' in result['warnings'][0]
+    assert not (tmp_path / 'ILI_2015_formatted.csv').exists()
+
+
+def test_directory_lock_is_per_directory(tmp_path, monkeypatch):
+    # Without fcntl the thread lock is all there is
+    monkeypatch.setattr(results_store, 'fcntl', None)
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+
+    def try_lock(directory, out):
+        lock = DirectoryLock(str(directory))
+        out.append(lock.local.acquire(timeout=0.5))
+        if out[-1]:
+            lock.local.release()
+
+    with DirectoryLock(str(tmp_path / 'a')):
+        other, same = [], []
+        for directory, out in ((tmp_path / 'b', other), (tmp_path / 'a' / '.', same)):
+            thread = threading.Thread(target=try_lock, args=(directory, out))
+            thread.start()
+            thread.join()
+
+    assert other == [True]
+    assert same == [False]
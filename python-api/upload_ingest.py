@@ -0,0 +1,257 @@
+import hashlib
+import io
+import json
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+from columnar import COLUMNAR_EXTENSIONS, columnar_path, load_frame, save_frame
+from results_store import DirectoryLock
+from schema import FORMATTED_SCHEMA, apply_schema
+
+# Streaming upload ingestion for /api/upload.
+# The multipart body is decoded incrementally from the request stream, so
+# every file goes to disk in chunks while its SHA-256 is computed. Once the
+# header and the first SAMPLE_ROWS rows have arrived they are validated, and
+# a bad file is dropped right away instead of failing mapping.py minutes
+# later. Files whose content is already on the server are skipped; the
+# hash -> filename index lives next to the uploads. Content is stored once:
+# the same bytes under another name are not saved again under that name
+# (the result names the existing file and carries a warning), since the
+# year in the filename would otherwise give one inspection two years. Saved files get their
+# columnar copy built in the background so /api/analyze starts warm.
+
+CHUNK_SIZE = 1 << 20
+SAMPLE_ROWS = 1000
+INDEX_FILE = '.upload_index.json'
+FILENAME_PATTERN = re.compile(r'^ILI_\d{4}_formatted\.csv$')
+
+# Columns the alignment and tracking cannot do without
+REQUIRED_COLUMNS = ('distance', 'joint_number', 'relative_position', 'angle', 'depth_percent')
+# Used when present (get_alignment_signal, scoring, output table)
+RECOMMENDED_COLUMNS = ('j_len', 'feature_type', 'length', 'width', 'elevation')
+NUMERIC_COLUMNS = ('distance', 'odometer', 'joint_number', 'relative_position', 'angle', 'depth_percent',
+                   'length', 'width', 'wall_thickness', 'elevation', 'j_len', 'mod_b31g', 'internal')
+
+_precompute_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='columnar-precompute')
+
+
+def validate_sample(data, complete):
+    """
+    Checks the header and sample rows of a formatted ILI CSV.
+    data: bytes received so far; complete: True if that is the whole file.
+    Returns (errors, warnings).
+    """
+    if not complete:
+        # Drop the trailing partial line
+        data = data[:data.rfind(b'\n') + 1]
+    try:
+        sample = pd.read_csv(io.BytesIO(data), nrows=SAMPLE_ROWS)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        return [f"Not a readable CSV: {e}"], []
+
+    errors, warnings = [], []
+    missing = [c for c in REQUIRED_COLUMNS if c not in sample.columns]
+    if missing:
+        errors.append(f"Missing required columns: {', '.join(missing)}")
+    missing = [c for c in RECOMMENDED_COLUMNS if c not in sample.columns]
+    if missing:
+        warnings.append(f"Missing optional columns: {', '.join(missing)}")
+
+    for col in NUMERIC_COLUMNS:
+        if col not in sample.columns:
+            continue
+        values = pd.to_numeric(sample[col], errors='coerce')
+        bad = values.isna() & sample[col].notna()
+        if bad.any():
+            row = int(bad.idxmax())
+            errors.append(f"Column {col} has {int(bad.sum())} non-numeric values in the first "
+                          f"{len(sample)} rows (row {row + 2}: {sample[col].iloc[row]!r})")
+        elif col == 'angle' and ((values < 0) | (values > 360)).any():
+            errors.append("Column angle must be in degrees between 0 and 360")
+        elif col == 'depth_percent' and (values > 1).any():
+            warnings.append("Column depth_percent has values above 1; formatted files store depth as a fraction")
+    if sample.empty:
+        errors.append("File has a header but no rows")
+    return errors, warnings
+
+
+def load_index(upload_folder):
+    try:
+        with open(os.path.join(upload_folder, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(upload_folder, index):
+    path = os.path.join(upload_folder, INDEX_FILE)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+class _IncomingFile:
+    """One file part being streamed to disk."""
+    def __init__(self, upload_folder, filename):
+        self.upload_folder = upload_folder
+        self.filename = secure_filename(filename or '')
+        self.result = {'filename': self.filename or filename, 'errors': [], 'warnings': []}
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = bytearray()
+        self.validated = False
+        self.handle = None
+        self.tmp_path = None
+
+        if not self.filename.lower().endswith('.csv'):
+            self.reject(f"{filename}: Invalid file type (must be CSV)")
+        elif not FILENAME_PATTERN.match(self.filename):
+            self.reject(f"{self.filename}: Must match pattern ILI_YYYY_formatted.csv")
+        else:
+            self.tmp_path = os.path.join(upload_folder, f'.{self.filename}.{uuid.uuid4().hex}.part')
+            self.handle = open(self.tmp_path, 'wb')
+
+    @property
+    def rejected(self):
+        return self.result.get('status') == 'rejected'
+
+    def reject(self, message):
+        self.result['status'] = 'rejected'
+        self.result['errors'].append(message)
+        self._discard()
+
+    def _discard(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def _validate(self, complete):
+        self.validated = True
+        errors, warnings = validate_sample(bytes(self.head), complete)
+        self.result['warnings'].extend(warnings)
+        if errors:
+            self.result['status'] = 'rejected'
+            self.result['errors'].extend(f"{self.filename}: {e}" for e in errors)
+            self._discard()
+        self.head = bytearray()
+
+    def write(self, data):
+        if self.rejected:
+            return  # keep draining the request, but drop the bytes
+        self.sha256.update(data)
+        self.size += len(data)
+        self.handle.write(data)
+        if not self.validated:
+            self.head += data
+            if self.head.count(b'\n') > SAMPLE_ROWS:
+                self._validate(complete=False)
+
+    def finish(self, on_saved=None):
+        if self.rejected:
+            return self.result
+        if not self.validated:
+            self._validate(complete=True)
+            if self.rejected:
+                return self.result
+        self.handle.close()
+        self.handle = None
+        digest = self.sha256.hexdigest()
+        self.result.update({'sha256': digest, 'bytes': self.size})
+
+        target = os.path.join(self.upload_folder, self.filename)
+        with DirectoryLock(self.upload_folder):
+            index = load_index(self.upload_folder)
+            existing = index.get(digest)
+            if existing and os.path.exists(os.path.join(self.upload_folder, existing)):
+                # Same content already on the server: keep the existing file (and its caches)
+                os.remove(self.tmp_path)
+                self.result['status'] = 'duplicate'
+                self.result['duplicateOf'] = existing
+                if existing != self.filename:
+                    self.result['warnings'].append(
+                        f"{self.filename}: Same content as {existing}, not saved under the new name")
+                return self.result
+            os.replace(self.tmp_path, target)
+            index = {h: name for h, name in index.items() if name != self.filename}
+            index[digest] = self.filename
+            _save_index(self.upload_folder, index)
+        self.result['status'] = 'saved'
+        if on_saved is not None:
+            on_saved(target)
+        return self.result
+
+
+def ingest_multipart(stream, boundary, upload_folder, field='files', on_saved=None, chunk_size=CHUNK_SIZE):
+    """
+    Decodes a multipart/form-data body from `stream` and ingests every part
+    named `field`. Returns one result dict per file with status
+    'saved', 'duplicate' (with 'duplicateOf', the file already holding
+    that content) or 'rejected'.
+    """
+    decoder = MultipartDecoder(boundary.encode())
+    results = []
+    current = None
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    current = _IncomingFile(upload_folder, event.filename) if event.name == field else None
+                elif isinstance(event, Data) and current is not None:
+                    current.write(event.data)
+                    if not event.more_data:
+                        results.append(current.finish(on_saved))
+                        current = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except BaseException:
+        # Client went away or the body is malformed: leave no partial file behind
+        if current is not None:
+            current._discard()
+        raise
+    if current is not None:
+        # Body ended inside a file part
+        current.reject(f"{current.filename}: Upload was truncated")
+        results.append(current.result)
+    return results
+
+
+def precompute_columnar(csv_path):
+    """Builds the typed columnar copy of an uploaded CSV unless the CSV changes meanwhile."""
+    mtime = os.path.getmtime(csv_path)
+    target = columnar_path(csv_path)
+    df = apply_schema(load_frame(csv_path), FORMATTED_SCHEMA)
+    save_frame(df, target)
+    if not os.path.exists(csv_path) or os.path.getmtime(csv_path) != mtime:
+        # Replaced while we were reading it: this copy describes the old file
+        os.remove(target)
+        return None
+    return target
+
+
+def schedule_precompute(csv_path):
+    return _precompute_pool.submit(precompute_columnar, csv_path)
+
+
+def clear_folder(upload_folder):
+    """Removes uploaded CSVs, their columnar copies and the hash index. Returns the CSV count."""
+    removed = 0
+    for name in os.listdir(upload_folder):
+        path = os.path.join(upload_folder, name)
+        if name.endswith('.csv'):
+            os.remove(path)
+            removed += 1
+        elif name.endswith(COLUMNAR_EXTENSIONS) or name == INDEX_FILE:
+            os.remove(path)
+    return removed